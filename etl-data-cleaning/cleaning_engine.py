@@ -0,0 +1,302 @@
+"""
+Motor declarativo de limpeza de dados
+
+Cada dataset é descrito por uma especificação (ver cleaning_specs.py) com as
+colunas, tipos, valores padrão, normalizadores e validadores. O compilador
+junta todas as regras de um dataset em uma única passada vetorizada: cada
+coluna é transformada uma vez, todas as validações contribuem para uma única
+máscara booleana e a máscara é aplicada uma única vez no final.
+"""
+
+import os
+import unicodedata
+
+# pandas é importado dentro das funções que o usam: uma execução em que todos os
+# estágios são pulados pelo manifesto não paga a importação
+
+from pipeline_manifest import (
+    FORCAR,
+    arquivo_inalterado,
+    carregar_manifest,
+    hash_arquivo,
+    salvar_manifest,
+    versao_codigo,
+)
+
+# Código que define o resultado da limpeza (entra na versão do estágio)
+ARQUIVOS_CODIGO = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), nome)
+    for nome in ("cleaning_engine.py", "cleaning_parallel.py")
+]
+
+# Workers do modo particionado (1 desativa o paralelismo)
+CLEANING_WORKERS = int(os.getenv("CLEANING_WORKERS", str(os.cpu_count() or 1)))
+
+# Arquivos menores que este tamanho são limpos em um único processo
+CLEANING_PARTITION_MIN_BYTES = int(os.getenv("CLEANING_PARTITION_MIN_MB", "64")) * 1024 * 1024
+
+# Perfil de qualidade (nulos, distintos, quantis, frequentes) gerado junto com a limpeza
+CLEANING_PROFILE = os.getenv("CLEANING_PROFILE", "1") != "0"
+
+
+# === Padronizar nomes das colunas: remover espaços e acentos ===
+def normalize_col(col):
+    col = col.strip()
+    col = unicodedata.normalize('NFKD', col).encode('ASCII', 'ignore').decode('ASCII')
+    col = col.replace(' ', '').replace('-', '').replace('_', '')
+    return col.lower()
+
+
+# === Tipos suportados nas especificações ===
+TIPOS = {
+    "int": int,
+    "float": float,
+}
+
+# === Normalizadores: recebem e devolvem uma Series ===
+NORMALIZADORES = {
+    "strip": lambda serie: serie.str.strip(),
+    "lower": lambda serie: serie.str.lower(),
+    # Remove acentos (equivalente vetorizado do normalize_text)
+    "sem_acentos": lambda serie: (
+        serie.str.strip()
+        .str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('ascii')
+    ),
+}
+
+# === Validadores: recebem a Series e o argumento, devolvem máscara booleana ===
+VALIDADORES = {
+    "min": lambda serie, valor: serie >= valor,
+    "max": lambda serie, valor: serie <= valor,
+    "maior_que": lambda serie, valor: serie > valor,
+    "contem": lambda serie, valor: serie.str.contains(valor, na=False, regex=False),
+}
+
+
+def truncar(serie, maximo):
+    """Corta em 'maximo' caracteres apenas os textos maiores; os demais não são tocados"""
+    longos = (serie.str.len() > maximo).to_numpy()
+    if not longos.any():
+        return serie
+    serie = serie.copy()
+    serie.iloc[longos] = serie.iloc[longos].str[:maximo]
+    return serie
+
+
+def validar_spec(spec):
+    """Valida a especificação uma única vez, antes de processar qualquer dado"""
+    for nome, regras in spec["colunas"].items():
+        if "tipo" in regras and regras["tipo"] not in TIPOS:
+            raise ValueError(f"Tipo desconhecido na coluna '{nome}': {regras['tipo']}")
+        for normalizador in regras.get("normalizadores", []):
+            if normalizador not in NORMALIZADORES:
+                raise ValueError(f"Normalizador desconhecido na coluna '{nome}': {normalizador}")
+        for validador in regras.get("validadores", {}):
+            if validador not in VALIDADORES:
+                raise ValueError(f"Validador desconhecido na coluna '{nome}': {validador}")
+
+
+def preparar(spec, df):
+    """Padroniza e renomeia as colunas do CSV bruto conforme a especificação"""
+    colunas = spec["colunas"]
+    renomear = {regras.get("origem", nome): nome for nome, regras in colunas.items()}
+
+    df.columns = [normalize_col(c) for c in df.columns]
+    df = df.rename(columns=renomear)
+
+    faltando = [nome for nome in colunas if nome not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas faltando no arquivo bruto: {faltando}")
+    return df
+
+
+def aplicar_regras(spec, df, manter, perfil=None):
+    """
+    Transforma cada coluna uma vez e acumula as validações na máscara.
+
+    Se um perfil (cleaning_profile.PerfilDataset) for informado, ele é
+    atualizado com as mesmas Series, sem outra passada pelos dados.
+
+    Retorna (colunas transformadas, máscara final, nulos por linha no dado bruto).
+    """
+    import pandas as pd
+
+    colunas = spec["colunas"]
+    nulos_por_linha = pd.Series(0, index=df.index)
+    resultado = {}
+    if perfil is not None:
+        perfil.linhas += len(df)
+    for nome in df.columns:
+        serie = df[nome]
+        nulos = serie.isna()
+        nulos_por_linha += nulos
+
+        regras = colunas.get(nome)
+        if regras is None:
+            resultado[nome] = serie
+            continue
+
+        if "tipo" in regras:
+            # Células que não são números (ex.: "abc", "7,5") viram nulos, como as vazias
+            serie = pd.to_numeric(serie, errors="coerce")
+        if "padrao" in regras:
+            serie = serie.fillna(regras["padrao"])
+        if "tipo" in regras:
+            serie = serie.astype(TIPOS[regras["tipo"]])
+        for normalizador in regras.get("normalizadores", []):
+            serie = NORMALIZADORES[normalizador](serie)
+        if "max_caracteres" in regras:
+            serie = truncar(serie, regras["max_caracteres"])
+
+        for validador, valor in regras.get("validadores", {}).items():
+            manter &= VALIDADORES[validador](serie, valor)
+        if regras.get("obrigatoria"):
+            manter &= serie.notna()
+
+        if perfil is not None:
+            perfil.atualizar(nome, df[nome], nulos, serie)
+        resultado[nome] = serie
+    return resultado, manter, nulos_por_linha
+
+
+def compilar(spec):
+    """Compila a especificação de um dataset em uma função limpar(df, perfil=None) -> (df_limpo, estatisticas)"""
+    validar_spec(spec)
+
+    def limpar(df, perfil=None):
+        import pandas as pd
+
+        df = preparar(spec, df)
+
+        # Duplicatas entram na máscara em vez de gerar uma cópia do DataFrame
+        nao_duplicada = ~df.duplicated()
+        resultado, manter, nulos_por_linha = aplicar_regras(spec, df, nao_duplicada.copy(), perfil)
+
+        # Máscara aplicada uma única vez
+        df_limpo = pd.DataFrame(resultado, copy=False).loc[manter]
+
+        estatisticas = {
+            "duplicatas": int(len(df) - nao_duplicada.sum()),
+            # Nulos contados apenas nas linhas que não são duplicatas
+            "nulos": int(nulos_por_linha[nao_duplicada].sum()),
+            "registros_finais": len(df_limpo),
+        }
+        return df_limpo, estatisticas
+
+    return limpar
+
+
+def localizar_entrada(entradas):
+    """Retorna o primeiro caminho existente na lista de entradas, ou None"""
+    for caminho in entradas:
+        if os.path.exists(caminho):
+            return caminho
+    return None
+
+
+def ler_csv(entradas):
+    """
+    Lê o primeiro CSV bruto encontrado na lista de caminhos.
+
+    Todas as colunas são lidas como texto (como no modo particionado): os tipos
+    vêm das regras da especificação e duplicatas são linhas com o mesmo texto.
+    """
+    import pandas as pd
+
+    for caminho in entradas[:-1]:
+        try:
+            return pd.read_csv(caminho, on_bad_lines='skip', engine='python', dtype=str)
+        except FileNotFoundError:
+            continue
+    # Último fallback: deixa o FileNotFoundError propagar
+    return pd.read_csv(entradas[-1], on_bad_lines='skip', engine='python', dtype=str)
+
+
+def salvar_csv(df, saidas):
+    """Salva o CSV limpo no primeiro caminho gravável e retorna o caminho usado"""
+    for caminho in saidas[:-1]:
+        try:
+            df.to_csv(caminho, index=False, encoding="utf-8")
+            return caminho
+        except Exception:
+            continue
+    df.to_csv(saidas[-1], index=False, encoding="utf-8")
+    return saidas[-1]
+
+
+def executar(spec):
+    """Executa a limpeza completa de um dataset descrito por uma especificação"""
+    limpar = compilar(spec)
+
+    caminho = localizar_entrada(spec["entradas"])
+
+    # === Pular a limpeza se entrada, código e saída não mudaram ===
+    estagio = f"limpeza_{spec['nome']}"
+    manifest = carregar_manifest(estagio)
+    codigo = versao_codigo(ARQUIVOS_CODIGO, extra=spec)
+    entrada = hash_arquivo(caminho, manifest.get("entrada")) if caminho else None
+    if (
+        not FORCAR
+        and entrada
+        and manifest.get("codigo") == codigo
+        and manifest.get("entrada", {}).get("sha256") == entrada["sha256"]
+        and arquivo_inalterado(manifest.get("saida", {}).get("caminho"), manifest.get("saida"))
+    ):
+        print(f"⏭️ {spec['nome']}: entrada e código sem alterações, limpeza ignorada")
+        print(f"Dados salvos em: {manifest['saida']['caminho']}")
+        return None, manifest.get("estatisticas")
+
+    perfil = None
+    if CLEANING_PROFILE:
+        from cleaning_profile import PerfilDataset
+        perfil = PerfilDataset(spec)
+
+    resultado = None
+    if (
+        caminho
+        and CLEANING_WORKERS > 1
+        and os.path.getsize(caminho) >= CLEANING_PARTITION_MIN_BYTES
+    ):
+        # === Arquivo grande: limpeza particionada em vários núcleos ===
+        from cleaning_parallel import limpar_particionado
+        resultado = limpar_particionado(spec, caminho, CLEANING_WORKERS, perfil)
+    if resultado is not None:
+        df, estatisticas = resultado
+    else:
+        # === Ler CSV bruto (arquivo pequeno ou com quebras de linha entre aspas) ===
+        df = ler_csv(spec["entradas"])
+
+        # === Limpeza em passada única ===
+        df, estatisticas = limpar(df, perfil)
+
+    # === Salvar CSV limpo ===
+    arquivo_saida = salvar_csv(df, spec["saidas"])
+
+    if entrada:
+        salvar_manifest(estagio, {
+            "entrada": entrada,
+            "codigo": codigo,
+            "saida": hash_arquivo(arquivo_saida),
+            "estatisticas": estatisticas,
+        })
+
+    # === Relatório de limpeza ===
+    print(spec["mensagem"])
+    if estatisticas["duplicatas"] > 0:
+        print(f"Removidas {estatisticas['duplicatas']} duplicatas")
+    if estatisticas["nulos"] > 0:
+        print(f"Tratados {estatisticas['nulos']} valores nulos")
+    print(f"Registros finais: {estatisticas['registros_finais']}")
+    print(f"Dados salvos em: {arquivo_saida}")
+
+    # === Perfil de qualidade e drift em relação à execução anterior ===
+    if perfil is not None:
+        from cleaning_profile import salvar_perfil
+        arquivo_perfil, drift = salvar_perfil(perfil, caminho)
+        print(f"📊 Perfil de qualidade salvo em: {arquivo_perfil}")
+        for mudanca in drift:
+            print(f"⚠️ Drift em {spec['nome']}.{mudanca['coluna']} ({mudanca['metrica']}): "
+                  f"{mudanca['anterior']:.4g} → {mudanca['atual']:.4g}")
+    return df, estatisticas
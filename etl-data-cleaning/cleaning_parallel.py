@@ -0,0 +1,225 @@
+"""
+Limpeza paralela de um único arquivo bruto grande
+
+O CSV é dividido em faixas de bytes alinhadas em quebras de linha e cada faixa
+é limpa por um worker de um ProcessPoolExecutor (etapa map). Como as
+duplicatas podem estar em faixas diferentes, cada worker distribui suas
+linhas em baldes pelo hash da linha bruta (shuffle) e uma segunda rodada de
+workers remove as duplicatas de cada balde (etapa reduce). Por fim os baldes
+são concatenados na ordem original das linhas.
+
+Linhas brutas idênticas geram linhas limpas idênticas e passam (ou falham)
+juntas nas validações, então validar antes de deduplicar dá o mesmo resultado
+que a limpeza sequencial.
+
+As faixas são cortadas em "\n", então campos entre aspas com quebras de linha
+internas não cabem neste modo: se algum worker encontrar uma quebra de linha
+dentro de aspas, limpar_particionado devolve None e o arquivo é limpo no modo
+sequencial.
+"""
+
+import csv
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cleaning_engine import aplicar_regras, preparar
+
+# Tamanho máximo de cada faixa, para limitar a memória de cada worker
+TAMANHO_MAXIMO_FAIXA = int(os.getenv("CLEANING_PARTITION_MAX_MB", "256")) * 1024 * 1024
+
+# Posição da faixa nos bits altos da ordem global de cada linha
+BITS_LINHA = 40
+
+# Bytes verificados por vez na busca de quebras de linha entre aspas
+BLOCO_ASPAS = 16 * 1024 * 1024
+
+
+def dividir_em_faixas(caminho, partes):
+    """Divide o arquivo em faixas de bytes [inicio, fim) que começam no início de uma linha"""
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, "rb") as f:
+        cabecalho = f.readline()
+        inicio_dados = f.tell()
+
+        limites = [inicio_dados]
+        for i in range(1, partes):
+            posicao = inicio_dados + (tamanho - inicio_dados) * i // partes
+            if posicao <= limites[-1]:
+                continue
+            # Volta um byte para não pular uma linha que começa exatamente no limite
+            f.seek(posicao - 1)
+            f.readline()
+            if f.tell() >= tamanho:
+                break
+            if f.tell() > limites[-1]:
+                limites.append(f.tell())
+        limites.append(tamanho)
+
+    faixas = [(limites[i], limites[i + 1]) for i in range(len(limites) - 1)]
+    return cabecalho, [faixa for faixa in faixas if faixa[1] > faixa[0]]
+
+
+def tipos_leitura(spec, cabecalho):
+    """
+    Tipos fixos de leitura para que todas as faixas tenham as mesmas colunas.
+
+    Sem isso o pandas infere tipos por faixa (ex.: 5 em uma, 5.0 em outra) e o
+    hash de linhas iguais deixaria de coincidir entre faixas. Todas as colunas
+    são lidas como texto, como na limpeza sequencial: uma célula numérica
+    inválida vira nulo nas regras da especificação em vez de abortar a leitura.
+    """
+    nomes_brutos = next(csv.reader([cabecalho.decode("utf-8")]))
+    return {bruto: str for bruto in nomes_brutos}
+
+
+def hash_linhas(df):
+    """Hash (uint64) de cada linha bruta lida com tipos_leitura (texto de todas as colunas)"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def quebra_entre_aspas(dados):
+    """
+    True se alguma quebra de linha dos dados está dentro de um campo entre aspas.
+
+    Aspas escapadas ("") não mudam a paridade, então uma quebra de linha com
+    número ímpar de aspas antes dela (desde o início da faixa) está dentro de
+    um campo. Linhas malformadas com aspas sem par também contam.
+    """
+    if b'"' not in dados:
+        return False
+    dentro = False
+    for inicio in range(0, len(dados), BLOCO_ASPAS):
+        trecho = np.frombuffer(dados, np.uint8, count=min(BLOCO_ASPAS, len(dados) - inicio), offset=inicio)
+        paridade = np.logical_xor.accumulate(trecho == ord('"')) ^ dentro
+        if (paridade & (trecho == ord("\n"))).any():
+            return True
+        dentro = bool(paridade[-1])
+    return False
+
+
+def _limpar_faixa(spec, caminho, cabecalho, indice, inicio, fim, baldes, pasta, perfilar):
+    """
+    Etapa map: limpa uma faixa do arquivo e grava um arquivo por balde.
+
+    Com perfilar, devolve também o perfil da faixa (sketches de tamanho fixo,
+    combinados depois no processo principal). Devolve None se a faixa tiver
+    uma quebra de linha entre aspas.
+    """
+    with open(caminho, "rb") as f:
+        f.seek(inicio)
+        dados = f.read(fim - inicio)
+    if quebra_entre_aspas(dados):
+        return None
+
+    df = pd.read_csv(
+        io.BytesIO(cabecalho + dados),
+        on_bad_lines='skip',
+        engine='python',
+        dtype=tipos_leitura(spec, cabecalho),
+    )
+    df = preparar(spec, df)
+
+    # Hash da linha bruta: identifica duplicatas entre faixas diferentes
+    hash_linha = hash_linhas(df)
+
+    perfil = None
+    if perfilar:
+        from cleaning_profile import PerfilDataset
+        perfil = PerfilDataset(spec)
+
+    manter = pd.Series(True, index=df.index)
+    resultado, valido, nulos_por_linha = aplicar_regras(spec, df, manter, perfil)
+
+    particao = pd.DataFrame(resultado, copy=False)
+    particao["_hash"] = hash_linha
+    particao["_ordem"] = (indice << BITS_LINHA) + pd.RangeIndex(len(df)).to_numpy()
+    particao["_nulos"] = nulos_por_linha.to_numpy()
+    particao["_valido"] = valido.to_numpy()
+
+    arquivos = []
+    balde_linha = hash_linha % baldes
+    for balde in range(baldes):
+        arquivo = os.path.join(pasta, f"balde-{balde:05d}-faixa-{indice:05d}.pkl")
+        particao[balde_linha == balde].to_pickle(arquivo)
+        arquivos.append(arquivo)
+    return len(df), arquivos, perfil
+
+
+def _deduplicar_balde(arquivos, destino):
+    """Etapa reduce: remove duplicatas de um balde mantendo a primeira ocorrência"""
+    balde = pd.concat([pd.read_pickle(arquivo) for arquivo in arquivos], ignore_index=True)
+    for arquivo in arquivos:
+        os.remove(arquivo)
+
+    balde = balde.sort_values("_ordem", kind="stable")
+    unicas = balde.drop_duplicates("_hash", keep="first")
+
+    estatisticas = {
+        "duplicatas": len(balde) - len(unicas),
+        "nulos": int(unicas["_nulos"].sum()),
+    }
+    unicas = unicas[unicas["_valido"]].drop(columns=["_hash", "_nulos", "_valido"])
+    unicas.to_pickle(destino)
+    return estatisticas
+
+
+def limpar_particionado(spec, caminho, workers, perfil=None):
+    """
+    Limpa o arquivo em paralelo e retorna (df_limpo, estatisticas) como a limpeza sequencial.
+
+    Se um perfil for informado, os perfis das faixas são combinados nele.
+    Retorna None (sem alterar o perfil) se o arquivo tiver campos entre aspas
+    com quebras de linha: nesse caso a limpeza deve ser sequencial.
+    """
+    tamanho = os.path.getsize(caminho)
+    partes = max(workers, -(-tamanho // TAMANHO_MAXIMO_FAIXA))
+    cabecalho, faixas = dividir_em_faixas(caminho, partes)
+    print(f"Modo particionado: {len(faixas)} faixas, {workers} workers")
+
+    with tempfile.TemporaryDirectory(prefix=f"{spec['nome']}-") as pasta, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        # Etapa map: limpeza de cada faixa
+        futuros = [
+            executor.submit(
+                _limpar_faixa, spec, caminho, cabecalho, indice, inicio, fim, workers, pasta, perfil is not None
+            )
+            for indice, (inicio, fim) in enumerate(faixas)
+        ]
+        resultados = [futuro.result() for futuro in futuros]
+        if any(resultado is None for resultado in resultados):
+            print("⚠️ Campos entre aspas com quebras de linha: usando a limpeza sequencial")
+            return None
+
+        total_linhas = 0
+        arquivos_por_balde = [[] for _ in range(workers)]
+        for linhas, arquivos, perfil_faixa in resultados:
+            total_linhas += linhas
+            if perfil is not None:
+                perfil.mesclar(perfil_faixa)
+            for balde, arquivo in enumerate(arquivos):
+                arquivos_por_balde[balde].append(arquivo)
+
+        # Etapa reduce: deduplicação por balde
+        destinos = [os.path.join(pasta, f"limpo-{balde:05d}.pkl") for balde in range(workers)]
+        futuros = [
+            executor.submit(_deduplicar_balde, arquivos, destino)
+            for arquivos, destino in zip(arquivos_por_balde, destinos)
+        ]
+        estatisticas = {"duplicatas": 0, "nulos": 0}
+        for futuro in futuros:
+            parcial = futuro.result()
+            estatisticas["duplicatas"] += parcial["duplicatas"]
+            estatisticas["nulos"] += parcial["nulos"]
+
+        # Concatenar os baldes na ordem original das linhas
+        df_limpo = pd.concat([pd.read_pickle(destino) for destino in destinos], ignore_index=True)
+        df_limpo = df_limpo.sort_values("_ordem", kind="stable").drop(columns="_ordem")
+
+    estatisticas["registros_finais"] = len(df_limpo)
+    print(f"Linhas lidas: {total_linhas}")
+    return df_limpo.reset_index(drop=True), estatisticas
@@ -0,0 +1,312 @@
+"""
+Perfil de qualidade dos dados, calculado na mesma passada da limpeza
+
+Para cada coluna da especificação o motor entrega ao perfil a Series que já
+está processando (nenhuma leitura extra do arquivo): a taxa de nulos é exata e
+as demais métricas vêm de sketches de memória fixa, que podem ser combinados
+entre as faixas do modo particionado:
+
+  - HyperLogLog: contagem aproximada de valores distintos (erro ~0,8%)
+  - t-digest: quantis das colunas com "quantis": True na especificação
+  - Misra-Gries: valores mais frequentes das colunas com "frequentes": True
+
+Cada execução grava um JSON com o perfil e o compara com o perfil anterior do
+mesmo dataset, marcando como drift as mudanças acima dos limites configurados.
+"""
+
+import json
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Perfis ficam no volume compartilhado, junto com os manifestos
+PERFIL_DIR = os.getenv("CLEANING_PROFILE_DIR") or (
+    "/app/data/perfis" if os.path.isdir("/app/data") else "data/perfis"
+)
+
+# Quantos perfis manter por dataset
+PERFIL_MANTIDOS = int(os.getenv("CLEANING_PROFILE_KEEP", "10"))
+
+# Limites de drift em relação ao perfil anterior
+DRIFT_NULOS = float(os.getenv("CLEANING_DRIFT_NULOS", "0.05"))  # diferença absoluta na taxa de nulos
+DRIFT_DISTINTOS = float(os.getenv("CLEANING_DRIFT_DISTINTOS", "0.2"))  # variação relativa dos distintos
+DRIFT_QUANTIS = float(os.getenv("CLEANING_DRIFT_QUANTIS", "0.1"))  # deslocamento / faixa p05–p95 anterior
+DRIFT_FREQUENTES = float(os.getenv("CLEANING_DRIFT_FREQUENTES", "0.05"))  # diferença absoluta na fração
+
+QUANTIS = {"p01": 0.01, "p05": 0.05, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p95": 0.95, "p99": 0.99}
+
+# Quantis comparados na detecção de drift (as caudas variam demais em amostras pequenas)
+QUANTIS_DRIFT = ("p25", "p50", "p75")
+
+
+class HyperLogLog:
+    """Contagem aproximada de distintos com 2^precisao registradores de 1 byte"""
+
+    def __init__(self, precisao=14):
+        self.precisao = precisao
+        self.registradores = np.zeros(1 << precisao, dtype=np.uint8)
+
+    def atualizar(self, serie):
+        valores = serie.dropna()
+        if valores.empty:
+            return
+        hashes = pd.util.hash_pandas_object(valores, index=False).to_numpy()
+        p = np.uint64(self.precisao)
+        indice = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # Posição do primeiro bit 1 depois dos bits do índice (o bit sentinela limita o máximo)
+        resto = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        _, expoente = np.frexp(resto.astype(np.float64))
+        # O arredondamento para float64 pode levar valores próximos de 2^64 ao expoente 65
+        posicao = np.clip(65 - expoente, 1, 65 - self.precisao).astype(np.uint8)
+        np.maximum.at(self.registradores, indice, posicao)
+
+    def mesclar(self, outro):
+        np.maximum(self.registradores, outro.registradores, out=self.registradores)
+
+    def estimar(self):
+        m = len(self.registradores)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimativa = alfa * m * m / np.sum(np.ldexp(1.0, -self.registradores.astype(np.int64)))
+        vazios = int(np.count_nonzero(self.registradores == 0))
+        if estimativa <= 2.5 * m and vazios:
+            # Correção para cardinalidades pequenas (linear counting)
+            estimativa = m * math.log(m / vazios)
+        return int(round(estimativa))
+
+
+class TDigest:
+    """
+    t-digest com fusão vetorizada: os pontos ordenados são agrupados pela
+    escala k1 (centróides menores nas caudas) com np.add.reduceat
+    """
+
+    def __init__(self, compressao=200):
+        self.compressao = compressao
+        self.medias = np.empty(0)
+        self.pesos = np.empty(0)
+        self.minimo = math.inf
+        self.maximo = -math.inf
+
+    def atualizar(self, valores):
+        valores = np.asarray(valores, dtype=np.float64)
+        valores = valores[~np.isnan(valores)]
+        if not len(valores):
+            return
+        valores = np.sort(valores)
+        self.minimo = min(self.minimo, float(valores[0]))
+        self.maximo = max(self.maximo, float(valores[-1]))
+        # O bloco é resumido sozinho (já ordenado, sem argsort de pesos) e só
+        # então combinado com os centróides existentes
+        bloco = TDigest(self.compressao)
+        bloco._agrupar(valores, np.ones(len(valores)))
+        self._comprimir(np.concatenate([self.medias, bloco.medias]), np.concatenate([self.pesos, bloco.pesos]))
+
+    def mesclar(self, outro):
+        if not len(outro.pesos):
+            return
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        self._comprimir(np.concatenate([self.medias, outro.medias]), np.concatenate([self.pesos, outro.pesos]))
+
+    def _comprimir(self, medias, pesos):
+        ordem = np.argsort(medias, kind="stable")
+        self._agrupar(medias[ordem], pesos[ordem])
+
+    def _agrupar(self, medias, pesos):
+        # Quantil à esquerda de cada ponto na escala k1: k = δ/2π · asin(2q − 1)
+        q = (np.cumsum(pesos) - pesos) / pesos.sum()
+        k = self.compressao / (2 * math.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+        grupo = np.floor(k - k[0]).astype(np.int64)
+        inicios = np.flatnonzero(np.r_[True, np.diff(grupo) != 0])
+        self.pesos = np.add.reduceat(pesos, inicios)
+        self.medias = np.add.reduceat(medias * pesos, inicios) / self.pesos
+
+    def quantil(self, q):
+        if not len(self.pesos):
+            return None
+        total = self.pesos.sum()
+        centros = np.cumsum(self.pesos) - self.pesos / 2
+        return float(np.interp(q * total, np.r_[0, centros, total], np.r_[self.minimo, self.medias, self.maximo]))
+
+
+class MisraGries:
+    """Valores mais frequentes com no máximo k contadores (subestima em até total/(k+1))"""
+
+    def __init__(self, k=32):
+        self.k = k
+        self.contadores = {}
+        self.total = 0
+
+    def atualizar(self, serie):
+        contagens = serie.dropna().value_counts()
+        self.total += int(contagens.sum())
+        # O resumo do bloco já é um Misra-Gries de k contadores, então a fusão
+        # nunca passa por mais de 2k valores
+        if len(contagens) > self.k:
+            corte = contagens.iloc[self.k]
+            contagens = contagens[contagens > corte] - corte
+        self._somar(contagens.items())
+
+    def mesclar(self, outro):
+        self.total += outro.total
+        self._somar(outro.contadores.items())
+
+    def _somar(self, itens):
+        for valor, contagem in itens:
+            self.contadores[valor] = self.contadores.get(valor, 0) + int(contagem)
+        if len(self.contadores) > self.k:
+            corte = sorted(self.contadores.values(), reverse=True)[self.k]
+            self.contadores = {valor: n - corte for valor, n in self.contadores.items() if n > corte}
+
+    def frequentes(self, n=10):
+        itens = sorted(self.contadores.items(), key=lambda item: (-item[1], str(item[0])))[:n]
+        return [
+            {"valor": _valor_json(valor), "contagem_min": contagem, "fracao": contagem / self.total}
+            for valor, contagem in itens
+        ]
+
+
+class PerfilColuna:
+    def __init__(self, regras):
+        self.linhas = 0
+        self.nulos = 0
+        self.distintos = HyperLogLog()
+        self.quantis = TDigest() if regras.get("quantis") else None
+        self.frequentes = MisraGries() if regras.get("frequentes") else None
+
+    def atualizar(self, bruta, nulos, transformada):
+        """bruta: valores lidos do arquivo; nulos: máscara de nulos da bruta; transformada: valores limpos"""
+        self.linhas += len(bruta)
+        self.nulos += int(nulos.sum())
+        # Só os valores presentes no arquivo: o padrão que preenche os nulos não conta
+        presentes = transformada[~nulos.to_numpy()]
+        self.distintos.atualizar(presentes)
+        if self.quantis is not None:
+            self.quantis.atualizar(pd.to_numeric(bruta, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan))
+        if self.frequentes is not None:
+            self.frequentes.atualizar(presentes)
+
+    def mesclar(self, outro):
+        self.linhas += outro.linhas
+        self.nulos += outro.nulos
+        self.distintos.mesclar(outro.distintos)
+        if self.quantis is not None:
+            self.quantis.mesclar(outro.quantis)
+        if self.frequentes is not None:
+            self.frequentes.mesclar(outro.frequentes)
+
+    def resumo(self):
+        resumo = {
+            "nulos": self.nulos,
+            "taxa_nulos": self.nulos / self.linhas if self.linhas else 0.0,
+            "distintos_aprox": self.distintos.estimar(),
+        }
+        if self.quantis is not None and len(self.quantis.pesos):
+            resumo["minimo"] = self.quantis.minimo
+            resumo["maximo"] = self.quantis.maximo
+            resumo["quantis"] = {nome: self.quantis.quantil(q) for nome, q in QUANTIS.items()}
+        if self.frequentes is not None:
+            resumo["frequentes"] = self.frequentes.frequentes()
+        return resumo
+
+
+class PerfilDataset:
+    """Perfil de todas as colunas da especificação; combinável entre faixas"""
+
+    def __init__(self, spec):
+        self.nome = spec["nome"]
+        self.linhas = 0
+        self.colunas = {nome: PerfilColuna(regras) for nome, regras in spec["colunas"].items()}
+
+    def atualizar(self, nome, bruta, nulos, transformada):
+        self.colunas[nome].atualizar(bruta, nulos, transformada)
+
+    def mesclar(self, outro):
+        self.linhas += outro.linhas
+        for nome, coluna in self.colunas.items():
+            coluna.mesclar(outro.colunas[nome])
+
+    def resumo(self):
+        return {
+            "dataset": self.nome,
+            "linhas": self.linhas,
+            "colunas": {nome: coluna.resumo() for nome, coluna in self.colunas.items()},
+        }
+
+
+def _valor_json(valor):
+    """Valores do numpy (ex.: int64 de uma coluna numérica) em tipos do JSON"""
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+
+def detectar_drift(atual, anterior):
+    """Lista de mudanças entre dois resumos acima dos limites configurados"""
+    drift = []
+    for nome, coluna in atual["colunas"].items():
+        antes = anterior.get("colunas", {}).get(nome)
+        if not antes:
+            continue
+
+        if abs(coluna["taxa_nulos"] - antes["taxa_nulos"]) > DRIFT_NULOS:
+            drift.append({"coluna": nome, "metrica": "taxa_nulos",
+                          "anterior": antes["taxa_nulos"], "atual": coluna["taxa_nulos"]})
+
+        if abs(coluna["distintos_aprox"] - antes["distintos_aprox"]) > DRIFT_DISTINTOS * max(antes["distintos_aprox"], 1):
+            drift.append({"coluna": nome, "metrica": "distintos_aprox",
+                          "anterior": antes["distintos_aprox"], "atual": coluna["distintos_aprox"]})
+
+        if "quantis" in coluna and "quantis" in antes:
+            faixa = antes["quantis"]["p95"] - antes["quantis"]["p05"]
+            for q in QUANTIS_DRIFT:
+                deslocamento = abs(coluna["quantis"][q] - antes["quantis"][q])
+                if deslocamento > DRIFT_QUANTIS * faixa if faixa > 0 else deslocamento > 0:
+                    drift.append({"coluna": nome, "metrica": q,
+                                  "anterior": antes["quantis"][q], "atual": coluna["quantis"][q]})
+
+        if "frequentes" in coluna and "frequentes" in antes:
+            fracoes_antes = {item["valor"]: item["fracao"] for item in antes["frequentes"]}
+            fracoes = {item["valor"]: item["fracao"] for item in coluna["frequentes"]}
+            for valor in sorted(fracoes.keys() | fracoes_antes.keys(), key=str):
+                if abs(fracoes.get(valor, 0.0) - fracoes_antes.get(valor, 0.0)) > DRIFT_FREQUENTES:
+                    drift.append({"coluna": nome, "metrica": f"fracao[{valor}]",
+                                  "anterior": fracoes_antes.get(valor, 0.0), "atual": fracoes.get(valor, 0.0)})
+    return drift
+
+
+def _listar_perfis(nome):
+    """Perfis gravados do dataset, do mais antigo para o mais recente"""
+    prefixo = f"{nome}_"
+    return sorted(
+        arquivo for arquivo in os.listdir(PERFIL_DIR)
+        if arquivo.startswith(prefixo) and arquivo.endswith(".json")
+    )
+
+
+def salvar_perfil(perfil, entrada):
+    """Grava o perfil desta execução, compara com o anterior e retorna (caminho, drift)"""
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    resumo = perfil.resumo()
+    resumo["entrada"] = entrada
+    resumo["gerado_em"] = datetime.now().isoformat()
+
+    anteriores = _listar_perfis(perfil.nome)
+    resumo["perfil_anterior"] = anteriores[-1] if anteriores else None
+    resumo["drift"] = []
+    if anteriores:
+        try:
+            with open(os.path.join(PERFIL_DIR, anteriores[-1]), encoding="utf-8") as f:
+                resumo["drift"] = detectar_drift(resumo, json.load(f))
+        except (OSError, json.JSONDecodeError, KeyError):
+            resumo["perfil_anterior"] = None
+
+    caminho = os.path.join(PERFIL_DIR, f"{perfil.nome}_{datetime.now():%Y%m%d%H%M%S%f}.json")
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(resumo, f, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+    for antigo in _listar_perfis(perfil.nome)[:-PERFIL_MANTIDOS]:
+        os.remove(os.path.join(PERFIL_DIR, antigo))
+    return caminho, resumo["drift"]
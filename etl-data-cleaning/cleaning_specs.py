@@ -0,0 +1,102 @@
+"""
+Especificações declarativas dos datasets limpos pelo pipeline
+
+Cada coluna aceita:
+  - origem: nome da coluna no CSV bruto após normalize_col (padrão: o próprio nome)
+  - padrao: valor usado para preencher nulos
+  - tipo: "int" ou "float"
+  - normalizadores: lista aplicada em ordem ("strip", "lower", "sem_acentos")
+  - max_caracteres: tamanho máximo do texto
+  - validadores: {"min": x, "max": x, "maior_que": x, "contem": texto}
+  - obrigatoria: remove linhas com valor nulo
+  - quantis: inclui os quantis (t-digest) da coluna no perfil de qualidade
+  - frequentes: inclui os valores mais frequentes (Misra-Gries) no perfil de qualidade
+
+Para adicionar um novo feed basta declarar uma nova especificação aqui.
+"""
+
+FILMES = {
+    "nome": "filmes",
+    "entradas": [
+        "/app/input/filmes_raw.csv",  # Arquivo montado da raiz do projeto
+        "filmes_raw.csv",             # Fallback para arquivo local
+        "data/filmes_raw.csv",
+    ],
+    "saidas": [
+        "/app/data/filmes_clean_500.csv",  # Volume compartilhado com os outros containers
+        "filmes_clean_500.csv",
+        "data/filmes_clean.csv",
+    ],
+    "mensagem": "Limpeza de dados concluida!",
+    "colunas": {
+        "titulo": {"normalizadores": ["strip"]},
+        "ano_lancamento": {"origem": "anolancamento", "padrao": 0, "tipo": "int", "quantis": True},
+        "genero": {"normalizadores": ["strip"], "frequentes": True},
+        "nota_imdb": {"origem": "notaimdb", "padrao": 0.0, "tipo": "float", "quantis": True},
+    },
+}
+
+USUARIOS = {
+    "nome": "usuarios",
+    "entradas": [
+        "/app/input/usuarios_raw.csv",
+        "usuarios_raw.csv",
+        "../usuarios_raw.csv",
+    ],
+    "saidas": [
+        "/app/data/usuarios_clean.csv",
+        "usuarios_clean.csv",
+        "../usuarios_clean.csv",
+    ],
+    "mensagem": "Limpeza de dados de usuários concluída!",
+    "colunas": {
+        "nome": {"normalizadores": ["sem_acentos"], "obrigatoria": True},
+        "email": {
+            "normalizadores": ["strip", "lower"],
+            "validadores": {"contem": "@"},
+            "obrigatoria": True,
+        },
+        "genero": {"normalizadores": ["strip"], "obrigatoria": True, "frequentes": True},
+        "pais": {"normalizadores": ["sem_acentos"], "obrigatoria": True, "frequentes": True},
+    },
+}
+
+AVALIACOES = {
+    "nome": "avaliacoes",
+    "entradas": [
+        "/app/input/avaliacoes_raw.csv",
+        "avaliacoes_raw.csv",
+        "../avaliacoes_raw.csv",
+    ],
+    "saidas": [
+        "/app/data/avaliacoes_clean.csv",
+        "avaliacoes_clean.csv",
+        "../avaliacoes_clean.csv",
+    ],
+    "mensagem": "Limpeza de dados de avaliações concluída!",
+    "colunas": {
+        "user_id": {
+            "origem": "userid",
+            "padrao": 0,
+            "tipo": "int",
+            "validadores": {"maior_que": 0},
+            "obrigatoria": True,
+        },
+        "filme_titulo": {"origem": "filmetitulo", "normalizadores": ["strip"], "obrigatoria": True},
+        "nota": {
+            "padrao": 5.0,  # Nota padrão 5.0
+            "tipo": "float",
+            "validadores": {"min": 0, "max": 10},
+            "obrigatoria": True,
+            "quantis": True,
+        },
+        # Sem padrão: comentário ausente fica nulo (NULL no banco) e o texto
+        # "Sem comentário" é exibido apenas pela aplicação
+        "comentario": {
+            "normalizadores": ["strip"],
+            "max_caracteres": 500,
+        },
+    },
+}
+
+DATASETS = {spec["nome"]: spec for spec in (FILMES, USUARIOS, AVALIACOES)}
@@ -0,0 +1,242 @@
+"""
+Limpeza contínua (tail) de arquivos brutos que só crescem no final
+
+Para cada dataset (padrão: usuários e avaliações) guarda no manifesto
+tail_limpeza_<nome> a posição em bytes já lida do CSV bruto, o hash do
+cabeçalho e dos bytes logo antes da posição. A cada passada só as linhas novas
+são lidas, limpas com as mesmas regras do motor e anexadas ao CSV limpo.
+
+Duplicatas são detectadas pelo hash da linha bruta (como no modo particionado)
+contra um array ordenado com os hashes de todas as linhas já vistas, gravado
+ao lado do manifesto. Se o arquivo bruto for truncado ou reescrito, ou se o
+CSV limpo tiver sido alterado por outro processo (ex.: run_all_cleaning.py),
+o arquivo inteiro é limpo de novo.
+
+TAIL_LOOP=1 mantém o processo verificando os arquivos a cada TAIL_INTERVALO_S.
+"""
+
+import io
+import os
+import sys
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from cleaning_engine import aplicar_regras, localizar_entrada, preparar, salvar_csv
+from cleaning_parallel import hash_linhas, tipos_leitura
+from cleaning_specs import DATASETS
+from pipeline_manifest import (
+    MANIFEST_DIR,
+    carregar_manifest,
+    ler_linhas_novas,
+    motivo_releitura,
+    registrar_posicao,
+    salvar_manifest,
+)
+
+# Datasets acompanhados (arquivos brutos que recebem linhas no final)
+TAIL_DATASETS = [nome.strip() for nome in os.getenv("TAIL_DATASETS", "usuarios,avaliacoes").split(",") if nome.strip()]
+
+# Processo contínuo: verificar os arquivos a cada TAIL_INTERVALO_S segundos
+TAIL_LOOP = os.getenv("TAIL_LOOP", "0").lower() in ("1", "true", "yes")
+TAIL_INTERVALO = float(os.getenv("TAIL_INTERVALO_S", "2"))
+
+# Uma última linha sem quebra de linha só é lida depois de o arquivo ficar
+# este tempo sem mudanças (os arquivos brutos do projeto não terminam em "\n")
+TAIL_LINHA_FINAL = float(os.getenv("TAIL_LINHA_FINAL_S", "5"))
+
+SEM_HASHES = np.empty(0, dtype=np.uint64)
+
+
+def arquivo_hashes(nome):
+    return os.path.join(MANIFEST_DIR, f"tail_limpeza_{nome}_linhas.npy")
+
+
+def carregar_hashes(nome):
+    """Hashes ordenados das linhas brutas já lidas (vazio se ainda não existirem)"""
+    try:
+        return np.load(arquivo_hashes(nome))
+    except (FileNotFoundError, ValueError):
+        return SEM_HASHES
+
+
+def salvar_hashes(nome, hashes):
+    """Grava os hashes de forma atômica"""
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    caminho = arquivo_hashes(nome)
+    with open(caminho + ".tmp", "wb") as f:
+        np.save(f, hashes)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def ja_vistas(vistas, hashes):
+    """Máscara das linhas cujo hash já está no array ordenado 'vistas'"""
+    if not len(vistas):
+        return np.zeros(len(hashes), dtype=bool)
+    posicoes = np.minimum(np.searchsorted(vistas, hashes), len(vistas) - 1)
+    return vistas[posicoes] == hashes
+
+
+def _ler_bytes(spec, cabecalho, dados):
+    return pd.read_csv(
+        io.BytesIO(cabecalho + dados),
+        on_bad_lines='skip',
+        engine='python',
+        dtype=tipos_leitura(spec, cabecalho),
+    )
+
+
+def ler_trecho(spec, cabecalho, dados):
+    """
+    Lê um trecho do CSV bruto (todas as colunas como texto) e retorna (df, linhas descartadas).
+
+    Se o trecho inteiro não puder ser lido (ex.: bytes que não são UTF-8), lê
+    linha a linha e descarta só as que falharem: a posição do tail sempre
+    avança, em vez de a mesma linha travar todas as passadas seguintes.
+    """
+    try:
+        return _ler_bytes(spec, cabecalho, dados), 0
+    except (pd.errors.ParserError, UnicodeDecodeError, ValueError) as e:
+        print(f"⚠️ {spec['nome']}: trecho ilegível ({e.__class__.__name__}), lendo linha a linha")
+
+    partes = []
+    descartadas = 0
+    for linha in dados.splitlines(keepends=True):
+        try:
+            partes.append(_ler_bytes(spec, cabecalho, linha))
+        except (pd.errors.ParserError, UnicodeDecodeError, ValueError):
+            descartadas += 1
+    if descartadas:
+        print(f"⚠️ {spec['nome']}: {descartadas} linhas ilegíveis descartadas")
+    if not partes:
+        return _ler_bytes(spec, cabecalho, b""), descartadas
+    return pd.concat(partes, ignore_index=True), descartadas
+
+
+def limpar_linhas(spec, cabecalho, dados, vistas):
+    """
+    Limpa um trecho do CSV bruto e retorna (df_limpo, hashes das linhas novas, estatisticas).
+
+    Uma linha é descartada como duplicata se repetir outra do trecho ou uma já vista.
+    """
+    df, descartadas = ler_trecho(spec, cabecalho, dados)
+    df = preparar(spec, df)
+
+    hashes = hash_linhas(df)
+    nova = ~pd.Series(hashes).duplicated().to_numpy() & ~ja_vistas(vistas, hashes)
+    resultado, manter, nulos_por_linha = aplicar_regras(spec, df, pd.Series(nova, index=df.index))
+    df_limpo = pd.DataFrame(resultado, copy=False).loc[manter]
+
+    estatisticas = {
+        "linhas": len(df),
+        "ilegiveis": descartadas,
+        "duplicatas": int(len(df) - nova.sum()),
+        "nulos": int(nulos_por_linha[nova].sum()),
+        "registros": len(df_limpo),
+    }
+    return df_limpo, np.unique(hashes[nova]), estatisticas
+
+
+def arquivo_parado(caminho):
+    """True se o arquivo não é modificado há pelo menos TAIL_LINHA_FINAL segundos"""
+    return time.time() - os.path.getmtime(caminho) >= TAIL_LINHA_FINAL
+
+
+def saida_alterada(registro):
+    """True se o CSV limpo não termina mais exatamente onde a última passada o deixou"""
+    motivo = motivo_releitura(registro["caminho"], registro) if registro else "sem registro"
+    return motivo is not None or os.path.getsize(registro["caminho"]) != registro["posicao"]
+
+
+def reconstruir(spec, caminho, motivo):
+    """Limpa o arquivo bruto inteiro, reescreve o CSV limpo e retorna o novo estado"""
+    print(f"🔁 {spec['nome']}: {motivo}; limpando o arquivo inteiro")
+    cabecalho, dados, posicao = ler_linhas_novas(caminho, incluir_sem_quebra=arquivo_parado(caminho))
+    df, hashes, estatisticas = limpar_linhas(spec, cabecalho, dados, SEM_HASHES)
+
+    saida = salvar_csv(df, spec["saidas"])
+    salvar_hashes(spec["nome"], hashes)
+    print(f"✅ {spec['nome']}: {estatisticas['registros']} registros em {saida}")
+    return {
+        "entrada": registrar_posicao(caminho, posicao),
+        "saida": registrar_posicao(saida, os.path.getsize(saida)),
+        "estatisticas": estatisticas,
+    }
+
+
+def processar(spec):
+    """Uma passada do tail para um dataset; retorna quantos registros limpos foram gravados"""
+    nome = spec["nome"]
+    caminho = localizar_entrada(spec["entradas"])
+    if not caminho:
+        print(f"⚠️ {nome}: arquivo bruto não encontrado")
+        return 0
+
+    estagio = f"tail_limpeza_{nome}"
+    estado = carregar_manifest(estagio)
+    motivo = motivo_releitura(caminho, estado.get("entrada"))
+    if motivo is None and saida_alterada(estado.get("saida")):
+        motivo = "CSV limpo alterado fora do tail"
+    if motivo:
+        estado = reconstruir(spec, caminho, motivo)
+        salvar_manifest(estagio, estado)
+        return estado["estatisticas"]["registros"]
+
+    inicio = time.perf_counter()
+    cabecalho, dados, posicao = ler_linhas_novas(
+        caminho, estado["entrada"]["posicao"], incluir_sem_quebra=arquivo_parado(caminho)
+    )
+    if not dados:
+        return 0
+
+    vistas = carregar_hashes(nome)
+    df, novas, estatisticas = limpar_linhas(spec, cabecalho, dados, vistas)
+
+    # Ordem das gravações: CSV limpo, hashes e por último o manifesto. Uma falha
+    # no meio deixa o CSV diferente do registrado, o que força a reconstrução
+    saida = estado["saida"]["caminho"]
+    if len(df):
+        df.to_csv(saida, mode="a", header=False, index=False, encoding="utf-8")
+    salvar_hashes(nome, np.insert(vistas, np.searchsorted(vistas, novas), novas))
+
+    estado["entrada"] = registrar_posicao(caminho, posicao)
+    estado["saida"] = registrar_posicao(saida, os.path.getsize(saida))
+    estado["estatisticas"] = {
+        chave: estado.get("estatisticas", {}).get(chave, 0) + valor
+        for chave, valor in estatisticas.items()
+    }
+    salvar_manifest(estagio, estado)
+
+    if not estatisticas["linhas"]:
+        # Só a quebra de linha que antecede uma linha ainda em escrita
+        return 0
+    print(f"📥 {nome}: {estatisticas['linhas']} linhas novas, {estatisticas['registros']} registros "
+          f"anexados ({estatisticas['duplicatas']} duplicatas) em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    return estatisticas["registros"]
+
+
+def executar_tail(nomes=TAIL_DATASETS):
+    """Uma passada por todos os datasets acompanhados; retorna o total de registros gravados"""
+    total = 0
+    for nome in nomes:
+        try:
+            total += processar(DATASETS[nome])
+        except Exception as e:
+            print(f"❌ Erro no tail de {nome}: {e}")
+            traceback.print_exc()
+    return total
+
+
+def main():
+    print(f"=== LIMPEZA CONTÍNUA: {', '.join(TAIL_DATASETS)} ===")
+    while True:
+        executar_tail()
+        if not TAIL_LOOP:
+            return 0
+        time.sleep(TAIL_INTERVALO)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Manifesto de estágios do pipeline
+
+Registra, para cada estágio (limpeza, carga), o hash dos arquivos de entrada,
+a versão do código e o hash das saídas. Um estágio cujas entradas e código não
+mudaram desde a última execução pode ser pulado.
+
+No modo contínuo (tail) registra também a posição já processada de arquivos
+que só crescem no final, para ler apenas as linhas novas.
+
+O mesmo módulo existe em etl-data-cleaning/ e etl-postgres/ (contextos de build
+separados); mantenha as duas cópias iguais.
+"""
+
+import hashlib
+import json
+import os
+
+# Manifestos ficam no volume compartilhado, junto com os dados limpos
+MANIFEST_DIR = os.getenv("PIPELINE_MANIFEST_DIR") or (
+    "/app/data/manifests" if os.path.isdir("/app/data") else "data/manifests"
+)
+
+# PIPELINE_FORCE=1 ignora o manifesto e refaz todos os estágios
+FORCAR = os.getenv("PIPELINE_FORCE", "").lower() in ("1", "true", "yes")
+
+TAMANHO_BLOCO = 1024 * 1024
+
+# Bytes antes da posição registrada conferidos a cada leitura incremental
+TAMANHO_ANCORA = 4096
+
+
+def hash_arquivo(caminho, anterior=None):
+    """
+    Retorna {caminho, tamanho, mtime_ns, sha256} do arquivo.
+
+    Se o registro anterior tiver o mesmo tamanho e mtime, o hash é reaproveitado
+    sem reler o arquivo.
+    """
+    info = os.stat(caminho)
+    if (
+        anterior
+        and anterior.get("tamanho") == info.st_size
+        and anterior.get("mtime_ns") == info.st_mtime_ns
+    ):
+        sha256 = anterior["sha256"]
+    else:
+        h = hashlib.sha256()
+        with open(caminho, "rb") as f:
+            for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b""):
+                h.update(bloco)
+        sha256 = h.hexdigest()
+    return {
+        "caminho": caminho,
+        "tamanho": info.st_size,
+        "mtime_ns": info.st_mtime_ns,
+        "sha256": sha256,
+    }
+
+
+def versao_codigo(arquivos, extra=None):
+    """Hash do conteúdo dos arquivos de código (e de configuração extra, se houver)"""
+    h = hashlib.sha256()
+    for caminho in arquivos:
+        with open(caminho, "rb") as f:
+            h.update(f.read())
+    if extra is not None:
+        h.update(json.dumps(extra, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def arquivo_inalterado(caminho, registro):
+    """True se o arquivo existe e tem o mesmo hash do registro"""
+    if not registro or not caminho or not os.path.exists(caminho):
+        return False
+    return hash_arquivo(caminho, registro)["sha256"] == registro["sha256"]
+
+
+def carregar_manifest(estagio):
+    """Lê o manifesto de um estágio (vazio se não existir ou estiver corrompido)"""
+    caminho = os.path.join(MANIFEST_DIR, f"{estagio}.json")
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def salvar_manifest(estagio, manifest):
+    """Grava o manifesto de forma atômica"""
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    caminho = os.path.join(MANIFEST_DIR, f"{estagio}.json")
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(caminho + ".tmp", caminho)
+
+
+# === Leitura incremental de arquivos que só crescem no final ===
+def registrar_posicao(caminho, posicao):
+    """
+    Retorna {caminho, posicao, cabecalho_sha256, ancora_sha256}.
+
+    A âncora são os bytes logo antes da posição: se o arquivo for reescrito
+    mantendo ou aumentando o tamanho, ela deixa de coincidir.
+    """
+    with open(caminho, "rb") as f:
+        cabecalho = f.readline()
+        inicio = max(posicao - TAMANHO_ANCORA, 0)
+        f.seek(inicio)
+        ancora = f.read(posicao - inicio)
+    return {
+        "caminho": caminho,
+        "posicao": posicao,
+        "cabecalho_sha256": hashlib.sha256(cabecalho).hexdigest(),
+        "ancora_sha256": hashlib.sha256(ancora).hexdigest(),
+    }
+
+
+def motivo_releitura(caminho, registro):
+    """Motivo para reler o arquivo inteiro, ou None se ele só recebeu linhas no final"""
+    if not registro:
+        return "nenhuma posição registrada"
+    if registro["caminho"] != caminho:
+        return f"arquivo mudou de {registro['caminho']} para {caminho}"
+    if not os.path.exists(caminho):
+        return "arquivo ausente"
+    if os.path.getsize(caminho) < registro["posicao"]:
+        return "arquivo truncado"
+    if registrar_posicao(caminho, registro["posicao"]) != registro:
+        return "arquivo reescrito (cabeçalho ou conteúdo já lido mudou)"
+    return None
+
+
+def ler_linhas_novas(caminho, posicao=None, incluir_sem_quebra=False):
+    """
+    Retorna (cabeçalho, bytes das linhas completas a partir da posição, nova posição).
+
+    Sem posição, lê desde a primeira linha depois do cabeçalho. Uma última linha
+    sem quebra de linha (ainda sendo escrita) fica para a próxima leitura, a
+    menos que incluir_sem_quebra indique que o arquivo não está sendo escrito.
+    """
+    with open(caminho, "rb") as f:
+        cabecalho = f.readline()
+        f.seek(len(cabecalho) if posicao is None else posicao)
+        inicio = f.tell()
+        dados = f.read()
+    completos = len(dados) if incluir_sem_quebra else dados.rfind(b"\n") + 1
+    return cabecalho, dados[:completos], inicio + completos
@@ -3,45 +3,40 @@
 Script principal para executar todos os processos de limpeza de dados
 """
 
-import subprocess
 import sys
-import os
+import traceback
 
-def run_script(script_name):
-    """Executa um script Python e retorna o código de saída"""
-    print(f"\n=== EXECUTANDO {script_name} ===")
+from cleaning_engine import executar
+from cleaning_specs import AVALIACOES, FILMES, USUARIOS
+
+# Etapas executadas no mesmo processo (cada script continua executável sozinho):
+# o interpretador e o pandas são carregados uma única vez
+ETAPAS = [
+    ("etl01", FILMES),  # Limpeza de filmes (script original)
+    ("usuarios_cleaning.py", USUARIOS),  # Limpeza de usuários
+    ("avaliacoes_cleaning.py", AVALIACOES),  # Limpeza de avaliações
+]
+
+def run_etapa(nome, spec):
+    """Executa a limpeza de um dataset e retorna True em caso de sucesso"""
+    print(f"\n=== EXECUTANDO {nome} ===")
     try:
-        result = subprocess.run([sys.executable, script_name], 
-                              capture_output=True, text=True, check=True)
-        print(result.stdout)
-        if result.stderr:
-            print("STDERR:", result.stderr)
+        executar(spec)
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"ERRO ao executar {script_name}:")
-        print("STDOUT:", e.stdout)
-        print("STDERR:", e.stderr)
-        return False
-    except FileNotFoundError:
-        print(f"ERRO: Script {script_name} não encontrado")
+    except Exception as e:
+        print(f"ERRO ao executar {nome}: {e}")
+        traceback.print_exc()
         return False
 
 def main():
     """Função principal"""
     print("=== INICIANDO PIPELINE DE LIMPEZA DE DADOS ===")
     
-    # Lista de scripts para executar em ordem
-    scripts = [
-        "etl01",  # Limpeza de filmes (script original)
-        "usuarios_cleaning.py",  # Limpeza de usuários
-        "avaliacoes_cleaning.py"  # Limpeza de avaliações
-    ]
-    
     success_count = 0
-    total_scripts = len(scripts)
+    total_scripts = len(ETAPAS)
     
-    for script in scripts:
-        if run_script(script):
+    for script, spec in ETAPAS:
+        if run_etapa(script, spec):
             success_count += 1
             print(f"✅ {script} executado com sucesso")
         else:
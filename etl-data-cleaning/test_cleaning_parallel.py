@@ -0,0 +1,37 @@
+"""Limpeza particionada x sequencial: células numéricas inválidas e quebras de linha entre aspas"""
+
+import pandas as pd
+
+from cleaning_engine import compilar, ler_csv
+from cleaning_parallel import limpar_particionado, quebra_entre_aspas
+from cleaning_specs import AVALIACOES
+
+
+def test_celula_numerica_invalida_igual_nos_dois_modos(tmp_path):
+    caminho = tmp_path / "avaliacoes_raw.csv"
+    linhas = ["user_id,filme_titulo,nota,comentario"]
+    linhas += [f"{i % 50},Filme {i % 30},{i % 10},ok" for i in range(3000)]
+    # Texto em coluna numérica e nota com vírgula decimal, mais uma duplicata
+    linhas += ["abc,Matrix,7,x", '3,Matrix,"7,5",y', "1,Filme 1,1,ok"]
+    caminho.write_text("\n".join(linhas) + "\n", encoding="utf-8")
+
+    sequencial, estatisticas_seq = compilar(AVALIACOES)(ler_csv([str(caminho)]))
+    particionado, estatisticas_par = limpar_particionado(AVALIACOES, str(caminho), 2)
+
+    pd.testing.assert_frame_equal(particionado, sequencial.reset_index(drop=True))
+    assert estatisticas_par == estatisticas_seq
+
+
+def test_aspas_escapadas_nao_contam_como_quebra_entre_aspas():
+    assert not quebra_entre_aspas(b'1,Matrix,7,"disse ""uau"", gostei"\n2,Alien,8,ok\n')
+    assert quebra_entre_aspas(b'1,Matrix,7,"primeira linha\nsegunda linha"\n2,Alien,8,ok\n')
+
+
+def test_quebra_de_linha_entre_aspas_volta_para_a_limpeza_sequencial(tmp_path):
+    caminho = tmp_path / "avaliacoes_raw.csv"
+    linhas = ["user_id,filme_titulo,nota,comentario"]
+    linhas += [f"{i % 50},Filme {i % 30},{i % 10},ok" for i in range(3000)]
+    linhas.insert(1500, '7,Matrix,9,"comentário em\nduas linhas"')
+    caminho.write_text("\n".join(linhas) + "\n", encoding="utf-8")
+
+    assert limpar_particionado(AVALIACOES, str(caminho), 2) is None
@@ -0,0 +1,132 @@
+"""Sketches do perfil de qualidade: erro das estimativas, fusão entre faixas e limites de drift"""
+
+import numpy as np
+import pandas as pd
+
+import cleaning_profile
+from cleaning_profile import QUANTIS, HyperLogLog, MisraGries, PerfilDataset, TDigest, detectar_drift
+
+
+def test_hyperloglog_dentro_do_erro_esperado():
+    # Erro padrão 1,04/√m (m = 2^14 registradores); a tolerância é de 3 erros padrão
+    tolerancia = 3 * 1.04 / np.sqrt(1 << 14)
+    for distintos in (1_000, 200_000):
+        hll = HyperLogLog()
+        valores = pd.Series(np.arange(distintos))
+        # Repetidos não mudam a contagem
+        hll.atualizar(pd.concat([valores, valores.iloc[: distintos // 2]]))
+        assert abs(hll.estimar() - distintos) <= tolerancia * distintos
+
+
+def test_tdigest_quantis_proximos_do_numpy():
+    rng = np.random.default_rng(42)
+    valores = rng.normal(50, 10, 200_000)
+    digest = TDigest()
+    # Em blocos, como nas leituras em pedaços
+    for bloco in np.array_split(valores, 7):
+        digest.atualizar(bloco)
+
+    assert digest.minimo == valores.min() and digest.maximo == valores.max()
+    for q in QUANTIS.values():
+        assert abs(digest.quantil(q) - np.quantile(valores, q)) < 0.05  # 0,5% do desvio padrão
+
+
+def test_misra_gries_retorna_os_frequentes_reais():
+    rng = np.random.default_rng(7)
+    frequentes = ["a"] * 30_000 + ["b"] * 20_000 + ["c"] * 10_000
+    raros = [f"raro{i}" for i in rng.integers(0, 5_000, 40_000)]
+    valores = np.array(frequentes + raros, dtype=object)
+    rng.shuffle(valores)
+    serie = pd.Series(valores)
+
+    mg = MisraGries()
+    for bloco in np.array_split(np.arange(len(serie)), 5):
+        mg.atualizar(serie.iloc[bloco])
+
+    resultado = mg.frequentes(3)
+    assert [item["valor"] for item in resultado] == ["a", "b", "c"]
+    erro_maximo = mg.total / (mg.k + 1)
+    reais = serie.value_counts()
+    for item in resultado:
+        assert reais[item["valor"]] - erro_maximo <= item["contagem_min"] <= reais[item["valor"]]
+
+
+def _perfilar(perfil, df):
+    perfil.linhas += len(df)
+    for nome in perfil.colunas:
+        nulos = df[nome].isna()
+        perfil.atualizar(nome, df[nome], nulos, df[nome])
+
+
+def test_perfis_das_faixas_combinados_iguais_ao_perfil_unico():
+    spec = {"nome": "teste", "colunas": {"nota": {"quantis": True}, "genero": {"frequentes": True}}}
+    rng = np.random.default_rng(3)
+    linhas = 30_000
+    notas = rng.uniform(0, 10, linhas).round(1)
+    notas[rng.random(linhas) < 0.1] = np.nan
+    generos = rng.choice(["Ação", "Drama", "Comédia", "Terror", None], linhas, p=[0.4, 0.3, 0.15, 0.1, 0.05])
+    df = pd.DataFrame({"nota": notas, "genero": generos})
+
+    unico = PerfilDataset(spec)
+    _perfilar(unico, df)
+    combinado = PerfilDataset(spec)
+    for inicio, fim in ((0, 7_000), (7_000, 19_000), (19_000, linhas)):
+        faixa = PerfilDataset(spec)
+        _perfilar(faixa, df.iloc[inicio:fim])
+        combinado.mesclar(faixa)
+
+    esperado, obtido = unico.resumo(), combinado.resumo()
+    assert obtido["linhas"] == esperado["linhas"] == linhas
+    for nome in spec["colunas"]:
+        for metrica in ("nulos", "taxa_nulos", "distintos_aprox"):
+            assert obtido["colunas"][nome][metrica] == esperado["colunas"][nome][metrica]
+    # Menos de k valores distintos: os contadores são exatos nos dois casos
+    assert obtido["colunas"]["genero"]["frequentes"] == esperado["colunas"]["genero"]["frequentes"]
+    nota, nota_esperada = obtido["colunas"]["nota"], esperado["colunas"]["nota"]
+    assert (nota["minimo"], nota["maximo"]) == (nota_esperada["minimo"], nota_esperada["maximo"])
+    for nome, valor in nota["quantis"].items():
+        assert abs(valor - nota_esperada["quantis"][nome]) < 0.05
+
+
+def _resumo(taxa_nulos=0.0, distintos=1000, quantis=None, frequentes=None):
+    coluna = {"taxa_nulos": taxa_nulos, "distintos_aprox": distintos}
+    if quantis is not None:
+        coluna["quantis"] = quantis
+    if frequentes is not None:
+        coluna["frequentes"] = [{"valor": valor, "fracao": fracao} for valor, fracao in frequentes.items()]
+    return {"colunas": {"c": coluna}}
+
+
+def _metricas(atual, anterior):
+    return [item["metrica"] for item in detectar_drift(atual, anterior)]
+
+
+def test_limites_de_drift(monkeypatch):
+    # Limites representáveis exatamente em float: o valor no limite não dispara
+    monkeypatch.setattr(cleaning_profile, "DRIFT_NULOS", 0.25)
+    monkeypatch.setattr(cleaning_profile, "DRIFT_DISTINTOS", 0.5)
+    monkeypatch.setattr(cleaning_profile, "DRIFT_QUANTIS", 0.125)
+    monkeypatch.setattr(cleaning_profile, "DRIFT_FREQUENTES", 0.0625)
+    anterior = _resumo()
+
+    assert _metricas(_resumo(taxa_nulos=0.25), anterior) == []
+    assert _metricas(_resumo(taxa_nulos=0.2501), anterior) == ["taxa_nulos"]
+
+    assert _metricas(_resumo(distintos=1500), anterior) == []
+    assert _metricas(_resumo(distintos=499), anterior) == ["distintos_aprox"]
+
+    # Faixa p05–p95 anterior = 16: deslocamento permitido de 2
+    quantis = {"p05": 0.0, "p25": 4.0, "p50": 8.0, "p75": 12.0, "p95": 16.0}
+    anterior_q = _resumo(quantis=quantis)
+    assert _metricas(_resumo(quantis={**quantis, "p50": 10.0}), anterior_q) == []
+    assert _metricas(_resumo(quantis={**quantis, "p50": 10.01}), anterior_q) == ["p50"]
+    # Faixa anterior zerada: qualquer deslocamento é drift
+    constantes = dict.fromkeys(quantis, 5.0)
+    assert _metricas(_resumo(quantis=constantes), _resumo(quantis=constantes)) == []
+    assert _metricas(_resumo(quantis={**constantes, "p25": 5.5}), _resumo(quantis=constantes)) == ["p25"]
+
+    anterior_f = _resumo(frequentes={"a": 0.5, "b": 0.25})
+    assert _metricas(_resumo(frequentes={"a": 0.5625, "b": 0.25}), anterior_f) == []
+    assert _metricas(_resumo(frequentes={"a": 0.5, "b": 0.1874}), anterior_f) == ["fracao[b]"]
+    # Valor que sai da lista conta como fração zero
+    assert _metricas(_resumo(frequentes={"a": 0.5}), anterior_f) == ["fracao[b]"]
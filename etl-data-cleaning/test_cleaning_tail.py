@@ -0,0 +1,116 @@
+"""Tail da limpeza: releitura do arquivo inteiro, linha final incompleta, linhas ilegíveis e duplicatas"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cleaning_tail
+import pipeline_manifest
+from cleaning_specs import AVALIACOES
+from cleaning_tail import arquivo_hashes, ler_trecho, processar
+from pipeline_manifest import carregar_manifest, motivo_releitura
+
+CABECALHO = b"user_id,filme_titulo,nota,comentario\n"
+
+
+def linhas(inicio, fim):
+    return b"".join(f"{i},Filme {i},{i % 10},ok\n".encode() for i in range(inicio, fim))
+
+
+@pytest.fixture
+def spec(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_manifest, "MANIFEST_DIR", str(tmp_path / "manifests"))
+    monkeypatch.setattr(cleaning_tail, "MANIFEST_DIR", str(tmp_path / "manifests"))
+    monkeypatch.setattr(cleaning_tail, "TAIL_LINHA_FINAL", 0)
+    return {
+        **AVALIACOES,
+        "entradas": [str(tmp_path / "avaliacoes_raw.csv")],
+        "saidas": [str(tmp_path / "avaliacoes_clean.csv")],
+    }
+
+
+def escrever(spec, conteudo, modo="wb"):
+    with open(spec["entradas"][0], modo) as f:
+        f.write(conteudo)
+
+
+def registro(spec):
+    return carregar_manifest("tail_limpeza_avaliacoes")["entrada"]
+
+
+def limpos(spec):
+    return pd.read_csv(spec["saidas"][0])
+
+
+def test_linhas_novas_sao_anexadas(spec):
+    escrever(spec, CABECALHO + linhas(1, 101))
+    assert processar(spec) == 100
+    escrever(spec, linhas(101, 111), "ab")
+    assert processar(spec) == 10
+    assert processar(spec) == 0
+    assert limpos(spec)["user_id"].tolist() == list(range(1, 111))
+
+
+@pytest.mark.parametrize("alterar, motivo", [
+    (lambda antes: CABECALHO + linhas(1, 51), "arquivo truncado"),
+    (lambda antes: antes.replace(b"user_id", b"USER_ID", 1) + linhas(101, 111), "arquivo reescrito"),
+    (lambda antes: antes.replace(b"50,Filme 50,0", b"50,Filme 50,9", 1) + linhas(101, 111), "arquivo reescrito"),
+], ids=["truncado", "cabecalho", "ancora"])
+def test_arquivo_reescrito_forca_reconstrucao(spec, alterar, motivo):
+    conteudo = CABECALHO + linhas(1, 101)
+    escrever(spec, conteudo)
+    processar(spec)
+
+    novo = alterar(conteudo)
+    escrever(spec, novo)
+    assert motivo_releitura(spec["entradas"][0], registro(spec)).startswith(motivo)
+    # Reconstrução: o total devolvido é o do arquivo inteiro, não só o das linhas novas
+    total = novo.count(b"\n") - 1
+    assert processar(spec) == total
+    assert len(limpos(spec)) == total
+    assert registro(spec)["posicao"] == len(novo)
+
+
+def test_linha_final_sem_quebra_espera_o_arquivo_parar(spec, monkeypatch):
+    monkeypatch.setattr(cleaning_tail, "TAIL_LINHA_FINAL", 3600)
+    escrever(spec, CABECALHO + linhas(1, 11) + b"11,Filme 11,")
+    assert processar(spec) == 10
+    assert registro(spec)["posicao"] == len(CABECALHO + linhas(1, 11))
+
+    # A linha termina de ser escrita, ainda sem "\n": só entra com o arquivo parado
+    escrever(spec, b"1,ok", "ab")
+    assert processar(spec) == 0
+    monkeypatch.setattr(cleaning_tail, "TAIL_LINHA_FINAL", 0)
+    assert processar(spec) == 1
+    assert limpos(spec)["user_id"].iloc[-1] == 11
+
+
+def test_linha_ilegivel_e_descartada_sem_travar_a_posicao(spec):
+    escrever(spec, CABECALHO + linhas(1, 11))
+    processar(spec)
+
+    ilegivel = b"11,Filme \xff\xfe,5,ok\n"
+    df, descartadas = ler_trecho(spec, CABECALHO, linhas(12, 14) + ilegivel + linhas(14, 16))
+    assert descartadas == 1 and df["user_id"].tolist() == ["12", "13", "14", "15"]
+
+    escrever(spec, linhas(12, 14) + ilegivel + linhas(14, 16), "ab")
+    assert processar(spec) == 4
+    assert registro(spec)["posicao"] == len(CABECALHO + linhas(1, 11) + linhas(12, 14) + ilegivel + linhas(14, 16))
+    assert carregar_manifest("tail_limpeza_avaliacoes")["estatisticas"]["ilegiveis"] == 1
+
+    # A passada seguinte continua depois da linha ilegível
+    escrever(spec, linhas(16, 18), "ab")
+    assert processar(spec) == 2
+
+
+def test_duplicatas_detectadas_pelos_hashes_gravados(spec):
+    escrever(spec, CABECALHO + linhas(1, 21))
+    processar(spec)
+    assert len(np.load(arquivo_hashes("avaliacoes"))) == 20
+
+    # Repete linhas de passadas anteriores e uma do próprio trecho
+    escrever(spec, linhas(5, 8) + linhas(21, 23) + linhas(22, 23), "ab")
+    assert processar(spec) == 2
+    assert carregar_manifest("tail_limpeza_avaliacoes")["estatisticas"]["duplicatas"] == 4
+    assert len(np.load(arquivo_hashes("avaliacoes"))) == 22
+    assert limpos(spec)["user_id"].tolist() == list(range(1, 23))
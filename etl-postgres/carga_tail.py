@@ -0,0 +1,159 @@
+"""
+Carga contínua (tail) dos CSVs limpos de usuários e avaliações
+
+A carga em lote (etl_com_postgres.main) grava no manifesto "carga" até que
+byte cada CSV limpo foi lido. A cada passada este módulo lê só as linhas
+anexadas depois dessa posição (pela limpeza contínua, cleaning_tail.py) e as
+grava com o mesmo COPY e a mesma preparação da carga em lote. Os agregados são
+atualizados pelo trigger de avaliacoes e o snapshot dos marts é regravado.
+
+Se um CSV limpo for truncado ou reescrito, ou se uma passada anterior tiver
+sido interrompida no meio do COPY, as tabelas afetadas são recarregadas por
+inteiro com etl_com_postgres.main().
+
+Filmes similares não são recalculados aqui: ficam para a próxima carga em lote.
+
+TAIL_LOOP=1 mantém o processo verificando os arquivos a cada TAIL_INTERVALO_S.
+"""
+
+import io
+import os
+import sys
+import time
+import traceback
+from datetime import date
+
+from sqlalchemy import text
+
+import etl_com_postgres as etl
+from pipeline_manifest import (
+    carregar_manifest,
+    ler_linhas_novas,
+    motivo_releitura,
+    registrar_posicao,
+    salvar_manifest,
+    versao_codigo,
+)
+
+# Usuários antes das avaliações: os user_id dependem dos usuários carregados
+TAIL_TABELAS = ["usuarios", "avaliacoes"]
+
+# Processo contínuo: verificar os arquivos a cada TAIL_INTERVALO_S segundos
+TAIL_LOOP = os.getenv("TAIL_LOOP", "0").lower() in ("1", "true", "yes")
+TAIL_INTERVALO = float(os.getenv("TAIL_INTERVALO_S", "2"))
+
+
+def motivo_recarga(caminho, registro, codigo_carga):
+    """Motivo para recarregar a tabela inteira, ou None se basta ler as linhas novas"""
+    if not registro:
+        return "tabela nunca carregada"
+    if "pendente" in registro:
+        return "passada anterior interrompida durante a carga"
+    if registro["codigo"] != codigo_carga:
+        # As linhas novas precisam entrar do mesmo jeito que as da carga em lote
+        return "código da carga mudou"
+    return motivo_releitura(caminho, registro.get("posicao"))
+
+
+def gravar_linhas(tabela, df):
+    """Grava as linhas novas com COPY (linha a linha se o COPY falhar) e retorna quantas entraram"""
+    if tabela == "usuarios":
+        if "id" in df.columns:
+            df = df.drop("id", axis=1)
+        # As linhas continuam a numeração do CSV; o id vem da sequência e fica
+        # associado à linha em usuarios.linha_carga
+        with etl.engine.connect() as conn:
+            ultima = conn.execute(text("SELECT COALESCE(MAX(linha_carga), 0) FROM usuarios")).scalar()
+        df.insert(0, "linha_carga", range(ultima + 1, ultima + 1 + len(df)))
+    else:
+        with etl.engine.begin() as conn:
+            # Mesma base da carga em lote: só os usuários gravados pelo ETL
+            usuarios = etl.mapa_usuarios_da_carga(conn)
+            # Sem data no CSV as avaliações entram com a data atual
+            mes_atual = date.today().replace(day=1)
+            etl.garantir_particoes(conn, mes_atual, mes_atual)
+        df = etl.preparar_avaliacoes(df, usuarios)
+
+    df = etl.preparar_para_copy(df)
+    try:
+        linhas, _, _, _ = etl.copiar_lote(tabela, df)
+        return linhas
+    except Exception as e:
+        if tabela == "usuarios":
+            # Os ids dos usuários dependem da ordem do arquivo: sem fallback linha a linha
+            raise
+        print(f"⚠️ Erro no COPY das avaliações novas: {e}")
+        return etl.inserir_linha_a_linha(tabela, df)
+
+
+def processar():
+    """Uma passada do tail; retorna {tabela: registros carregados}"""
+    import pandas as pd
+
+    arquivos_limpos = etl.localizar_arquivos_limpos()
+    manifest_carga = carregar_manifest("carga")
+    codigo_carga = versao_codigo(etl.ARQUIVOS_CODIGO)
+
+    recarregar = {}
+    for tabela in TAIL_TABELAS:
+        caminho = arquivos_limpos[tabela]
+        if caminho:
+            motivo = motivo_recarga(caminho, manifest_carga.get(tabela), codigo_carga)
+            if motivo:
+                recarregar[tabela] = motivo
+    if recarregar:
+        for tabela, motivo in recarregar.items():
+            print(f"🔁 Tabela '{tabela}': {motivo}; recarga completa")
+        etl.main(forcar=tuple(recarregar))
+        return {}
+
+    carregadas = {}
+    for tabela in TAIL_TABELAS:
+        caminho = arquivos_limpos[tabela]
+        if not caminho:
+            continue
+        registro = manifest_carga[tabela]
+        cabecalho, dados, posicao = ler_linhas_novas(caminho, registro["posicao"]["posicao"])
+        if not dados:
+            continue
+
+        inicio = time.perf_counter()
+        df = pd.read_csv(io.BytesIO(cabecalho + dados))
+
+        # Marca a passada como pendente antes do COPY: se o processo cair entre o
+        # COPY e o manifesto, a próxima passada recarrega a tabela em vez de
+        # duplicar as linhas
+        registro["pendente"] = posicao
+        salvar_manifest("carga", manifest_carga)
+        linhas = gravar_linhas(tabela, df)
+        del registro["pendente"]
+        registro["posicao"] = registrar_posicao(caminho, posicao)
+        registro["registros"] += linhas
+        salvar_manifest("carga", manifest_carga)
+
+        carregadas[tabela] = linhas
+        print(f"📥 {tabela}: {linhas} registros novos em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    if carregadas:
+        etl.gerar_snapshot(carregadas)
+    return carregadas
+
+
+def main():
+    print(f"=== CARGA CONTÍNUA: {', '.join(TAIL_TABELAS)} ===")
+    etl.aguardar_banco()
+    while True:
+        try:
+            processar()
+        except Exception as e:
+            print(f"❌ Erro na carga contínua: {e}")
+            traceback.print_exc()
+            if not TAIL_LOOP:
+                return 1
+        if not TAIL_LOOP:
+            return 0
+        time.sleep(TAIL_INTERVALO)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,42 @@
-import pandas as pd
+"""
+Carga dos dados limpos no Data Warehouse (PostgreSQL)
+
+Cria o schema, carrega filmes, usuários e avaliações, reconstrói os agregados,
+cria as views dos Data Marts e grava o snapshot lido pela aplicação. Tudo roda
+em main(); importar o módulo não conecta ao banco nem lê arquivos. pandas e
+msgpack são importados só pelas etapas que os usam, então uma execução sem
+tabelas a recarregar não paga essas importações.
+"""
+
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+import io
+import math
 import os
+import re
+import threading
 import unicodedata
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+from pipeline_manifest import (
+    FORCAR,
+    arquivo_inalterado,
+    carregar_manifest,
+    hash_arquivo,
+    ler_linhas_novas,
+    motivo_releitura,
+    registrar_posicao,
+    salvar_manifest,
+    versao_codigo,
+)
+
 
 # Função para normalizar texto (remover acentos e caracteres especiais)
 def normalize_text(text):
     """Remove acentos e caracteres especiais de strings"""
-    if pd.isna(text):
+    if text is None or (isinstance(text, float) and math.isnan(text)):
         return text
     text = str(text).strip()
     # Normalizar caracteres Unicode (remover acentos)
@@ -24,240 +53,769 @@ PG_PORT = os.getenv("PG_PORT", "5432")
 # string de conexão com configuração explícita de codificação
 conn_str = f"postgresql+psycopg2://{PG_USER}:{PG_PASS}@{PG_HOST}:{PG_PORT}/{PG_DB}?client_encoding=utf8"
 
-print("Conexão:", conn_str)
 
-time.sleep(3)
+engine = create_engine(conn_str, echo=False)
 
+# Espera máxima (s) pelo PostgreSQL antes de desistir
+PG_READY_TIMEOUT = float(os.getenv("PG_READY_TIMEOUT", "60"))
 
-engine = create_engine(conn_str, echo=False)
 
+def aguardar_banco(timeout=PG_READY_TIMEOUT):
+    """Tenta SELECT 1 com espera exponencial até o banco aceitar conexões"""
+    espera = 0.1
+    limite = time.monotonic() + timeout
+    while True:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return
+        except OperationalError as e:
+            if time.monotonic() + espera > limite:
+                raise RuntimeError(f"PostgreSQL indisponível após {timeout:.0f}s: {e}") from e
+            print(f"⏳ Aguardando o PostgreSQL ({espera:.1f}s)...")
+            time.sleep(espera)
+            espera = min(espera * 2, 5)
 
-import unicodedata
-# Busca dados limpos em vez de dados brutos
-csv_path = None
-if os.path.exists("/app/data/filmes_clean_500.csv"):
-    csv_path = "/app/data/filmes_clean_500.csv"
-elif os.path.exists("data/filmes_clean_500.csv"):
-    csv_path = "data/filmes_clean_500.csv"
-elif os.path.exists("../etl-data-cleaning/filmes_clean_500.csv"):
-    csv_path = "../etl-data-cleaning/filmes_clean_500.csv"
-else:
-    raise FileNotFoundError("Arquivo de dados limpos não encontrado. Execute primeiro o etl-data-cleaning.")
-
-print("Lendo CSV:", csv_path)
-df = pd.read_csv(csv_path)
-
-# Os dados já estão limpos, apenas garantir que as colunas estão corretas
-print("Colunas disponíveis:", df.columns.tolist())
-
-# Garantir que temos as colunas esperadas
-expected_cols = ["titulo", "ano_lancamento", "genero", "nota_imdb"]
-missing_cols = [col for col in expected_cols if col not in df.columns]
-if missing_cols:
-    raise ValueError(f"Colunas faltando nos dados limpos: {missing_cols}")
-
-# Selecionar apenas as colunas necessárias
-df = df[expected_cols]
-
-# Aplicar normalização de texto nos títulos
-df["titulo"] = df["titulo"].apply(normalize_text)
-
-print("Preview após transformação:")
-print(df.head())
 
-# 3) LOAD: gravar no Postgres - Data Warehouse (tabelas)
-with engine.begin() as conn:
-    # Criar tabela de filmes
-    create_filmes_sql = """
-    CREATE TABLE IF NOT EXISTS filmes (
-        id SERIAL PRIMARY KEY,
-        titulo TEXT,
-        ano_lancamento INTEGER,
+def localizar_arquivos_limpos():
+    """Caminhos dos CSVs limpos de filmes, usuários e avaliações (None se ausente)"""
+    # Busca dados limpos em vez de dados brutos
+    csv_path = None
+    if os.path.exists("/app/data/filmes_clean_500.csv"):
+        csv_path = "/app/data/filmes_clean_500.csv"
+    elif os.path.exists("data/filmes_clean_500.csv"):
+        csv_path = "data/filmes_clean_500.csv"
+    elif os.path.exists("../etl-data-cleaning/filmes_clean_500.csv"):
+        csv_path = "../etl-data-cleaning/filmes_clean_500.csv"
+    else:
+        raise FileNotFoundError("Arquivo de dados limpos não encontrado. Execute primeiro o etl-data-cleaning.")
+
+
+    # Buscar arquivo de usuários limpos
+    usuarios_csv_path = None
+    if os.path.exists("/app/data/usuarios_clean.csv"):
+        usuarios_csv_path = "/app/data/usuarios_clean.csv"
+    elif os.path.exists("data/usuarios_clean.csv"):
+        usuarios_csv_path = "data/usuarios_clean.csv"
+    elif os.path.exists("../usuarios_clean.csv"):
+        usuarios_csv_path = "../usuarios_clean.csv"
+    else:
+        print("⚠️ Arquivo de usuários limpos não encontrado. Pulando carregamento de usuários.")
+
+
+    # Buscar arquivo de avaliações limpos
+    avaliacoes_csv_path = None
+    if os.path.exists("/app/data/avaliacoes_clean.csv"):
+        avaliacoes_csv_path = "/app/data/avaliacoes_clean.csv"
+    elif os.path.exists("data/avaliacoes_clean.csv"):
+        avaliacoes_csv_path = "data/avaliacoes_clean.csv"
+    elif os.path.exists("../avaliacoes_clean.csv"):
+        avaliacoes_csv_path = "../avaliacoes_clean.csv"
+    else:
+        print("⚠️ Arquivo de avaliações limpos não encontrado. Pulando carregamento de avaliações.")
+
+    return {
+        "filmes": csv_path,
+        "usuarios": usuarios_csv_path,
+        "avaliacoes": avaliacoes_csv_path,
+    }
+
+
+# === Manifesto de carga: pular tabelas cujo arquivo limpo não mudou ===
+# Código que define o resultado da carga (entra na versão registrada no manifesto):
+# este módulo e os que ele importa (similares e manifesto)
+ARQUIVOS_CODIGO = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), nome)
+    for nome in ("etl_com_postgres.py", "filmes_similares.py", "pipeline_manifest.py")
+]
+
+def lido_ate_o_fim(caminho, posicao):
+    """True se a posição registrada (carga ou tail) cobre o arquivo inteiro, sem reescrita"""
+    return (
+        posicao is not None
+        and motivo_releitura(caminho, posicao) is None
+        and os.path.getsize(caminho) == posicao["posicao"]
+    )
+
+
+def precisa_recarregar(tabela, caminho, registro, codigo_carga):
+    """True se o arquivo limpo, o código ou o conteúdo da tabela mudaram desde a última carga"""
+    if FORCAR or not caminho or not registro or registro["codigo"] != codigo_carga:
+        return True
+    # Linhas anexadas depois da carga e já carregadas pelo tail (carga_tail.py)
+    # também contam como arquivo inalterado
+    if not arquivo_inalterado(caminho, registro["arquivo"]) and not lido_ate_o_fim(caminho, registro.get("posicao")):
+        return True
+    # Banco recriado ou tabela esvaziada desde a última carga
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:t)"), {"t": tabela}).scalar() is None:
+            return True
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {tabela}")).scalar()
+    return total < registro["registros"]
+
+
+def planejar_recarga(arquivos_limpos, manifest_carga, codigo_carga, forcar=()):
+    """{tabela: True/False} das tabelas que precisam ser recarregadas nesta execução"""
+    recarregar = {
+        tabela: tabela in forcar or precisa_recarregar(tabela, caminho, manifest_carga.get(tabela), codigo_carga)
+        for tabela, caminho in arquivos_limpos.items()
+    }
+    # Os user_id das avaliações dependem dos ids gerados na carga de usuários
+    recarregar["avaliacoes"] = recarregar["avaliacoes"] or recarregar["usuarios"]
+    for tabela, carregar in recarregar.items():
+        if not carregar:
+            print(f"⏭️ Tabela '{tabela}': arquivo limpo sem alterações desde a última carga")
+    return recarregar
+
+
+def ler_csv_limpo(caminho):
+    """
+    Lê as linhas completas do CSV limpo e retorna (DataFrame, posição em bytes lida).
+
+    A posição fica no manifesto: o tail continua dali sem carregar de novo linhas
+    anexadas enquanto esta leitura acontecia.
+    """
+    import pandas as pd
+
+    cabecalho, dados, posicao = ler_linhas_novas(caminho)
+    return pd.read_csv(io.BytesIO(cabecalho + dados)), posicao
+
+
+def ler_filmes(caminho):
+    """Lê o CSV limpo de filmes e normaliza os títulos"""
+    import pandas as pd
+
+    print("Lendo CSV:", caminho)
+    df = pd.read_csv(caminho)
+
+    # Os dados já estão limpos, apenas garantir que as colunas estão corretas
+    print("Colunas disponíveis:", df.columns.tolist())
+
+    # Garantir que temos as colunas esperadas
+    expected_cols = ["titulo", "ano_lancamento", "genero", "nota_imdb"]
+    missing_cols = [col for col in expected_cols if col not in df.columns]
+    if missing_cols:
+        raise ValueError(f"Colunas faltando nos dados limpos: {missing_cols}")
+
+    # Selecionar apenas as colunas necessárias
+    df = df[expected_cols]
+
+    # Aplicar normalização de texto nos títulos
+    df["titulo"] = df["titulo"].apply(normalize_text)
+    df["busca_texto"] = texto_de_busca(df["titulo"], df["genero"])
+
+    print("Preview após transformação:")
+    print(df.head())
+    return df
+
+
+# === Particionamento mensal de avaliações ===
+# Meses futuros com partição criada antecipadamente (para inserções da aplicação)
+AVALIACOES_PARTICOES_FUTURAS = int(os.getenv("AVALIACOES_PARTICOES_FUTURAS", "2"))
+# Partições com mais meses que isso são desanexadas (0 mantém todas)
+AVALIACOES_RETENCAO_MESES = int(os.getenv("AVALIACOES_RETENCAO_MESES", "0"))
+
+
+def somar_meses(mes, quantidade):
+    """Primeiro dia do mês deslocado em 'quantidade' meses"""
+    indice = mes.year * 12 + mes.month - 1 + quantidade
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def particao_anexada(conn, tabela, particao):
+    """True se 'particao' existe e está anexada a 'tabela' (uma tabela avulsa com o mesmo nome não conta)"""
+    return conn.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_inherits
+            WHERE inhparent = to_regclass(:tabela) AND inhrelid = to_regclass(:particao)
+        )
+    """), {"tabela": tabela, "particao": particao}).scalar()
+
+
+def arquivar_tabela(conn, nome):
+    """
+    Renomeia uma partição desanexada (e os índices dela) para <nome>_arquivada.
+
+    Libera o nome para uma nova partição do mesmo mês. Se o mês já tiver sido
+    arquivado antes, usa <nome>_arquivada_2, _3...
+    """
+    novo_nome = f"{nome}_arquivada"
+    sequencial = 1
+    while conn.execute(text("SELECT to_regclass(:t)"), {"t": novo_nome}).scalar() is not None:
+        sequencial += 1
+        novo_nome = f"{nome}_arquivada_{sequencial}"
+    indices = conn.execute(text(
+        "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(:t)"
+    ), {"t": nome}).scalars().all()
+    conn.execute(text(f"ALTER TABLE {nome} RENAME TO {novo_nome}"))
+    # Os índices também, para não colidirem com os da nova partição
+    for indice in indices:
+        if indice.startswith(nome):
+            conn.execute(text(f"ALTER INDEX {indice} RENAME TO {novo_nome}{indice.removeprefix(nome)}"))
+    return novo_nome
+
+
+def garantir_particoes(conn, primeiro_mes, ultimo_mes, tabela="avaliacoes", unlogged=False):
+    """Cria as partições mensais de avaliações (ou da tabela de staging) entre os dois meses (inclusive)"""
+    tipo = "UNLOGGED TABLE" if unlogged else "TABLE"
+    mes = date(primeiro_mes.year, primeiro_mes.month, 1)
+    while mes <= ultimo_mes:
+        proximo = somar_meses(mes, 1)
+        particao = f"{tabela}_p{mes:%Y_%m}"
+        if not particao_anexada(conn, tabela, particao):
+            if conn.execute(text("SELECT to_regclass(:t)"), {"t": particao}).scalar() is not None:
+                # Partição desanexada que manteve o nome (ex.: versões anteriores da retenção)
+                print(f"📦 Tabela avulsa {particao} arquivada como {arquivar_tabela(conn, particao)}")
+            limites = {"inicio": mes, "fim": proximo}
+            filtro = "data_avaliacao >= :inicio AND data_avaliacao < :fim"
+            # Linhas desse mês que caíram na partição DEFAULT precisam ser movidas
+            # antes de anexar a nova partição
+            na_default = conn.execute(
+                text(f"SELECT EXISTS (SELECT 1 FROM {tabela}_default WHERE {filtro})"), limites
+            ).scalar()
+            if na_default:
+                conn.execute(text(
+                    f"CREATE {tipo} {particao} "
+                    f"(LIKE {tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+                ))
+                # Colunas geradas (busca_tsv) são recalculadas pelo banco
+                colunas = ", ".join(conn.execute(text("""
+                    SELECT attname FROM pg_attribute
+                    WHERE attrelid = to_regclass(:t) AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+                    ORDER BY attnum
+                """), {"t": tabela}).scalars())
+                conn.execute(text(
+                    f"INSERT INTO {particao} ({colunas}) SELECT {colunas} FROM {tabela}_default WHERE {filtro}"
+                ), limites)
+                conn.execute(text(f"DELETE FROM {tabela}_default WHERE {filtro}"), limites)
+                conn.execute(text(
+                    f"ALTER TABLE {tabela} ATTACH PARTITION {particao} "
+                    f"FOR VALUES FROM ('{mes}') TO ('{proximo}')"
+                ))
+            else:
+                conn.execute(text(
+                    f"CREATE {tipo} {particao} PARTITION OF {tabela} "
+                    f"FOR VALUES FROM ('{mes}') TO ('{proximo}')"
+                ))
+            print(f"🧩 Partição criada: {particao}")
+        mes = proximo
+
+
+def desanexar_particoes_antigas(conn, retencao_meses):
+    """Desanexa (sem apagar) as partições mais antigas que a retenção configurada"""
+    limite = somar_meses(date.today().replace(day=1), -retencao_meses)
+    particoes = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'avaliacoes'::regclass
+          AND c.relname LIKE 'avaliacoes\\_p%'
+        ORDER BY c.relname
+    """)).scalars().all()
+    desanexadas = 0
+    for particao in particoes:
+        ano, mes = particao.removeprefix("avaliacoes_p").split("_")
+        if somar_meses(date(int(ano), int(mes), 1), 1) <= limite:
+            conn.execute(text(f"ALTER TABLE avaliacoes DETACH PARTITION {particao}"))
+            # Sem renomear, o nome continuaria ocupado e uma nova carga do mês
+            # iria para a partição DEFAULT
+            arquivada = arquivar_tabela(conn, particao)
+            print(f"📦 Partição desanexada (mantida como tabela avulsa {arquivada}): {particao}")
+            desanexadas += 1
+    return desanexadas
+
+
+# === Agregados de avaliações mantidos na escrita ===
+# Contagem, soma, mínimo e máximo das notas por filme, gênero, usuário e país.
+# A carga em lote reconstrói as tabelas com INSERT ... SELECT e, depois disso,
+# o trigger trg_avaliacoes_agregados atualiza os contadores a cada avaliação
+# inserida (inclusive pela aplicação). Assim as views dos marts leem uma linha
+# por grupo em vez de reagregar a tabela avaliacoes inteira.
+# Só INSERT é incremental (mínimo e máximo não têm como ser desfeitos); UPDATE
+# e DELETE em avaliacoes exigem uma nova reconstrução.
+# Avaliações sem nota ficam fora dos agregados, no trigger e na reconstrução.
+AGREGADOS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS agg_avaliacoes_filme (
+        filme_titulo VARCHAR(500) PRIMARY KEY,
+        total BIGINT NOT NULL,
+        soma_notas NUMERIC NOT NULL,
+        nota_minima DECIMAL(3,1),
+        nota_maxima DECIMAL(3,1),
+        primeira_avaliacao TIMESTAMP,
+        ultima_avaliacao TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS agg_avaliacoes_usuario (
+        user_id INTEGER PRIMARY KEY,
+        total BIGINT NOT NULL,
+        soma_notas NUMERIC NOT NULL,
+        nota_minima DECIMAL(3,1),
+        nota_maxima DECIMAL(3,1),
+        primeira_avaliacao TIMESTAMP,
+        ultima_avaliacao TIMESTAMP
+    )
+    """,
+    # pais e genero podem ser nulos e formam um grupo próprio, como no GROUP BY
+    """
+    CREATE TABLE IF NOT EXISTS agg_avaliacoes_pais (
+        pais TEXT UNIQUE NULLS NOT DISTINCT,
+        total BIGINT NOT NULL,
+        soma_notas NUMERIC NOT NULL,
+        nota_minima DECIMAL(3,1),
+        nota_maxima DECIMAL(3,1),
+        primeira_avaliacao TIMESTAMP,
+        ultima_avaliacao TIMESTAMP,
+        usuarios BIGINT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS agg_avaliacoes_genero (
+        genero TEXT UNIQUE NULLS NOT DISTINCT,
+        total BIGINT NOT NULL,
+        soma_notas NUMERIC NOT NULL,
+        nota_minima DECIMAL(3,1),
+        nota_maxima DECIMAL(3,1),
+        usuarios BIGINT NOT NULL,
+        filmes BIGINT NOT NULL
+    )
+    """,
+    # Por filme dentro de cada gênero (mesmo agrupamento dos rankings por gênero),
+    # com a nota média armazenada para o índice de top N por gênero
+    """
+    CREATE TABLE IF NOT EXISTS agg_avaliacoes_filme_genero (
         genero TEXT,
-        nota_imdb REAL
-    );
+        titulo TEXT NOT NULL,
+        ano_lancamento INTEGER,
+        total BIGINT NOT NULL,
+        soma_notas NUMERIC NOT NULL,
+        nota_media NUMERIC GENERATED ALWAYS AS (soma_notas / total) STORED,
+        UNIQUE NULLS NOT DISTINCT (genero, titulo, ano_lancamento)
+    )
+    """,
+    # Melhores e piores de cada gênero lidos em ordem direto do índice
     """
-    conn.execute(text(create_filmes_sql))
-    
-    # Criar tabela de usuários (estrutura simples como filmes)
-    create_usuarios_sql = """
-    CREATE TABLE IF NOT EXISTS usuarios (
-        id SERIAL PRIMARY KEY,
-        nome TEXT,
-        email TEXT,
+    CREATE INDEX IF NOT EXISTS idx_agg_filme_genero_melhores
+    ON agg_avaliacoes_filme_genero (genero, nota_media DESC, total DESC, titulo, ano_lancamento)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_agg_filme_genero_piores
+    ON agg_avaliacoes_filme_genero (genero, nota_media ASC, total DESC, titulo, ano_lancamento)
+    """,
+    # Top N de usuários sem ordenar a tabela inteira
+    "CREATE INDEX IF NOT EXISTS idx_agg_avaliacoes_usuario_total ON agg_avaliacoes_usuario (total DESC)",
+    # Pares (gênero, usuário) já vistos: alimentam agg_avaliacoes_genero.usuarios
+    """
+    CREATE TABLE IF NOT EXISTS agg_genero_usuario (
         genero TEXT,
-        pais TEXT
-    );
+        user_id INTEGER NOT NULL,
+        UNIQUE NULLS NOT DISTINCT (genero, user_id)
+    )
+    """,
+]
+
+# somar_avaliacao_agregados soma uma avaliação aos agregados: chamada pelo trigger
+# a cada linha inserida e, na troca atômica, para as avaliações gravadas durante a carga
+AGREGADOS_TRIGGER = [
     """
-    conn.execute(text(create_usuarios_sql))
-    
-    # Verificar se a tabela foi criada corretamente
-    result = conn.execute(text("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'usuarios' ORDER BY ordinal_position"))
-    columns = result.fetchall()
-    print(f"📋 Estrutura da tabela usuarios: {columns}")
-    
-    # Criar tabela de avaliações
-    create_avaliacoes_sql = """
-    CREATE TABLE IF NOT EXISTS avaliacoes (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES usuarios(id),
-        filme_titulo VARCHAR(500) NOT NULL,
-        nota DECIMAL(3,1) CHECK (nota >= 0 AND nota <= 10),
-        comentario TEXT,
-        data_avaliacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """
-    conn.execute(text(create_avaliacoes_sql))
-
-    # Limpar dados existentes
-    conn.execute(text("TRUNCATE TABLE avaliacoes CASCADE;"))
-    conn.execute(text("TRUNCATE TABLE usuarios CASCADE;"))
-    conn.execute(text("TRUNCATE TABLE filmes;"))
-
-
-df.to_sql("filmes", engine, if_exists="append", index=False)
-
-print("✅ Dados carregados na tabela 'filmes' (Data Warehouse).")
-
-# === CARREGAR DADOS DE USUÁRIOS ===
-print("\n=== CARREGANDO DADOS DE USUÁRIOS ===")
-
-# Buscar arquivo de usuários limpos
-usuarios_csv_path = None
-if os.path.exists("/app/data/usuarios_clean.csv"):
-    usuarios_csv_path = "/app/data/usuarios_clean.csv"
-elif os.path.exists("data/usuarios_clean.csv"):
-    usuarios_csv_path = "data/usuarios_clean.csv"
-elif os.path.exists("../usuarios_clean.csv"):
-    usuarios_csv_path = "../usuarios_clean.csv"
-else:
-    print("⚠️ Arquivo de usuários limpos não encontrado. Pulando carregamento de usuários.")
-
-if usuarios_csv_path:
-    print("Lendo CSV de usuários:", usuarios_csv_path)
+    CREATE OR REPLACE FUNCTION somar_avaliacao_agregados(
+        nova_user_id INTEGER, nova_filme_titulo TEXT, nova_nota NUMERIC, nova_data TIMESTAMP
+    ) RETURNS void
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        novo_filme BOOLEAN;
+        novo_usuario BOOLEAN;
+    BEGIN
+        -- Sem nota não há o que somar (soma_notas é NOT NULL)
+        IF nova_nota IS NULL THEN
+            RETURN;
+        END IF;
+
+        -- xmax = 0 no RETURNING indica que a linha foi inserida (primeira avaliação do grupo)
+        INSERT INTO agg_avaliacoes_filme AS g
+        VALUES (nova_filme_titulo, 1, nova_nota, nova_nota, nova_nota, nova_data, nova_data)
+        ON CONFLICT (filme_titulo) DO UPDATE SET
+            total = g.total + 1,
+            soma_notas = g.soma_notas + EXCLUDED.soma_notas,
+            nota_minima = LEAST(g.nota_minima, EXCLUDED.nota_minima),
+            nota_maxima = GREATEST(g.nota_maxima, EXCLUDED.nota_maxima),
+            primeira_avaliacao = LEAST(g.primeira_avaliacao, EXCLUDED.primeira_avaliacao),
+            ultima_avaliacao = GREATEST(g.ultima_avaliacao, EXCLUDED.ultima_avaliacao)
+        RETURNING (xmax = 0) INTO novo_filme;
+
+        -- Uma contribuição por linha de filmes com o título, como no JOIN das views
+        INSERT INTO agg_avaliacoes_filme_genero AS g (genero, titulo, ano_lancamento, total, soma_notas)
+        SELECT genero, titulo, ano_lancamento, COUNT(*), COUNT(*) * nova_nota
+        FROM filmes
+        WHERE titulo = nova_filme_titulo
+        GROUP BY genero, titulo, ano_lancamento
+        ON CONFLICT (genero, titulo, ano_lancamento) DO UPDATE SET
+            total = g.total + EXCLUDED.total,
+            soma_notas = g.soma_notas + EXCLUDED.soma_notas;
+
+        WITH generos AS (
+            SELECT genero, COUNT(*) AS linhas
+            FROM filmes
+            WHERE titulo = nova_filme_titulo
+            GROUP BY genero
+        ), novos_pares AS (
+            INSERT INTO agg_genero_usuario (genero, user_id)
+            SELECT genero, nova_user_id FROM generos WHERE nova_user_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+            RETURNING genero
+        )
+        INSERT INTO agg_avaliacoes_genero AS g
+        SELECT
+            ge.genero, ge.linhas, ge.linhas * nova_nota, nova_nota, nova_nota,
+            (SELECT COUNT(*) FROM novos_pares np WHERE np.genero IS NOT DISTINCT FROM ge.genero),
+            CASE WHEN novo_filme THEN 1 ELSE 0 END
+        FROM generos ge
+        ON CONFLICT (genero) DO UPDATE SET
+            total = g.total + EXCLUDED.total,
+            soma_notas = g.soma_notas + EXCLUDED.soma_notas,
+            nota_minima = LEAST(g.nota_minima, EXCLUDED.nota_minima),
+            nota_maxima = GREATEST(g.nota_maxima, EXCLUDED.nota_maxima),
+            usuarios = g.usuarios + EXCLUDED.usuarios,
+            filmes = g.filmes + EXCLUDED.filmes;
+
+        IF nova_user_id IS NOT NULL THEN
+            INSERT INTO agg_avaliacoes_usuario AS g
+            VALUES (nova_user_id, 1, nova_nota, nova_nota, nova_nota, nova_data, nova_data)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total = g.total + 1,
+                soma_notas = g.soma_notas + EXCLUDED.soma_notas,
+                nota_minima = LEAST(g.nota_minima, EXCLUDED.nota_minima),
+                nota_maxima = GREATEST(g.nota_maxima, EXCLUDED.nota_maxima),
+                primeira_avaliacao = LEAST(g.primeira_avaliacao, EXCLUDED.primeira_avaliacao),
+                ultima_avaliacao = GREATEST(g.ultima_avaliacao, EXCLUDED.ultima_avaliacao)
+            RETURNING (xmax = 0) INTO novo_usuario;
+
+            INSERT INTO agg_avaliacoes_pais AS g
+            SELECT u.pais, 1, nova_nota, nova_nota, nova_nota, nova_data, nova_data,
+                   CASE WHEN novo_usuario THEN 1 ELSE 0 END
+            FROM usuarios u
+            WHERE u.id = nova_user_id
+            ON CONFLICT (pais) DO UPDATE SET
+                total = g.total + 1,
+                soma_notas = g.soma_notas + EXCLUDED.soma_notas,
+                nota_minima = LEAST(g.nota_minima, EXCLUDED.nota_minima),
+                nota_maxima = GREATEST(g.nota_maxima, EXCLUDED.nota_maxima),
+                primeira_avaliacao = LEAST(g.primeira_avaliacao, EXCLUDED.primeira_avaliacao),
+                ultima_avaliacao = GREATEST(g.ultima_avaliacao, EXCLUDED.ultima_avaliacao),
+                usuarios = g.usuarios + EXCLUDED.usuarios;
+        END IF;
+    END;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION atualizar_agregados_avaliacao() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM somar_avaliacao_agregados(NEW.user_id, NEW.filme_titulo, NEW.nota, NEW.data_avaliacao);
+        RETURN NULL;
+    END;
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_avaliacoes_agregados ON avaliacoes",
+    """
+    CREATE TRIGGER trg_avaliacoes_agregados
+    AFTER INSERT ON avaliacoes
+    FOR EACH ROW EXECUTE FUNCTION atualizar_agregados_avaliacao()
+    """,
+]
+
+TABELAS_ATUAIS = {"filmes": "filmes", "usuarios": "usuarios", "avaliacoes": "avaliacoes"}
+
+AGREGADOS_TABELAS = [
+    "agg_avaliacoes_filme", "agg_avaliacoes_usuario", "agg_avaliacoes_pais",
+    "agg_avaliacoes_genero", "agg_genero_usuario", "agg_avaliacoes_filme_genero",
+]
+
+# {filmes}, {usuarios} e {avaliacoes}: tabelas lidas; {sufixo}: sufixo das tabelas
+# gravadas (vazio na reconstrução no lugar, _novo na troca atômica)
+AGREGADOS_RECONSTRUCAO = [
+    """
+    INSERT INTO agg_avaliacoes_filme{sufixo}
+    SELECT filme_titulo, COUNT(*), SUM(nota), MIN(nota), MAX(nota),
+           MIN(data_avaliacao), MAX(data_avaliacao)
+    FROM {avaliacoes}
+    WHERE nota IS NOT NULL
+    GROUP BY filme_titulo
+    """,
+    """
+    INSERT INTO agg_avaliacoes_filme_genero{sufixo} (genero, titulo, ano_lancamento, total, soma_notas)
+    SELECT f.genero, f.titulo, f.ano_lancamento, COUNT(a.id), SUM(a.nota)
+    FROM {filmes} f
+    INNER JOIN {avaliacoes} a ON f.titulo = a.filme_titulo
+    WHERE a.nota IS NOT NULL
+    GROUP BY f.genero, f.titulo, f.ano_lancamento
+    """,
+    """
+    INSERT INTO agg_avaliacoes_usuario{sufixo}
+    SELECT user_id, COUNT(*), SUM(nota), MIN(nota), MAX(nota),
+           MIN(data_avaliacao), MAX(data_avaliacao)
+    FROM {avaliacoes}
+    WHERE user_id IS NOT NULL AND nota IS NOT NULL
+    GROUP BY user_id
+    """,
+    """
+    INSERT INTO agg_avaliacoes_pais{sufixo}
+    SELECT u.pais, COUNT(a.id), SUM(a.nota), MIN(a.nota), MAX(a.nota),
+           MIN(a.data_avaliacao), MAX(a.data_avaliacao), COUNT(DISTINCT u.id)
+    FROM {usuarios} u
+    INNER JOIN {avaliacoes} a ON u.id = a.user_id
+    WHERE a.nota IS NOT NULL
+    GROUP BY u.pais
+    """,
+    """
+    INSERT INTO agg_genero_usuario{sufixo}
+    SELECT DISTINCT f.genero, a.user_id
+    FROM {filmes} f
+    INNER JOIN {avaliacoes} a ON f.titulo = a.filme_titulo
+    WHERE a.user_id IS NOT NULL AND a.nota IS NOT NULL
+    """,
+    """
+    INSERT INTO agg_avaliacoes_genero{sufixo}
+    SELECT f.genero, COUNT(a.id), SUM(a.nota), MIN(a.nota), MAX(a.nota),
+           COUNT(DISTINCT a.user_id), COUNT(DISTINCT f.titulo)
+    FROM {filmes} f
+    INNER JOIN {avaliacoes} a ON f.titulo = a.filme_titulo
+    WHERE a.nota IS NOT NULL
+    GROUP BY f.genero
+    """,
+]
+
+
+def reconstruir_agregados(conn, sem_bloquear_leitores=False):
+    """Recalcula os agregados a partir de avaliacoes e recria o trigger incremental"""
+    # Bloqueia inserções até o trigger voltar a valer, para nenhuma avaliação escapar
+    conn.execute(text("LOCK TABLE avaliacoes IN SHARE ROW EXCLUSIVE MODE"))
+    if sem_bloquear_leitores:
+        # DELETE em vez de TRUNCATE: as consultas continuam lendo os agregados
+        # antigos até o commit, sem esperar pelo lock exclusivo do TRUNCATE
+        for tabela in AGREGADOS_TABELAS:
+            conn.execute(text(f"DELETE FROM {tabela}"))
+    else:
+        conn.execute(text(f"TRUNCATE {', '.join(AGREGADOS_TABELAS)}"))
+    for sql in AGREGADOS_RECONSTRUCAO:
+        conn.execute(text(sql.format(sufixo="", **TABELAS_ATUAIS)))
+    for sql in AGREGADOS_TRIGGER:
+        conn.execute(text(sql))
+
+
+def preparar_agregados_novos(conn, fontes):
+    """Cria e preenche as cópias _novo dos agregados a partir das tabelas em 'fontes'"""
+    for tabela in AGREGADOS_TABELAS:
+        criar_staging(conn, tabela)
+    for sql in AGREGADOS_RECONSTRUCAO:
+        conn.execute(text(sql.format(sufixo=SUFIXO_STAGING, **fontes)))
+    for tabela in AGREGADOS_TABELAS:
+        finalizar_staging(conn, tabela)
+
+
+# === Busca em filmes e avaliações ===
+# busca_texto guarda o texto pesquisável sem acentos e em minúsculas (preenchido
+# na carga com normalize_text e pela aplicação nas novas avaliações); busca_tsv
+# é gerada a partir dele pelo próprio banco e indexada com GIN. Com a extensão
+# pg_trgm disponível, busca_texto também ganha um índice de trigramas para a
+# busca aproximada (erros de digitação e palavras incompletas).
+BUSCA_TABELAS = ["filmes", "avaliacoes"]
+
+BUSCA_COLUNAS = [
+    "ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS busca_texto TEXT",
+    "ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS busca_tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(busca_texto, ''))) STORED",
+]
+
+
+def texto_de_busca(*colunas):
+    """Junta as colunas (Series) em um texto de busca sem acentos e em minúsculas"""
+    texto = colunas[0].fillna("").astype(str)
+    for coluna in colunas[1:]:
+        texto = texto + " " + coluna.fillna("").astype(str)
+    return texto.map(normalize_text).str.lower().str.strip()
+
+
+def criar_busca(conn):
+    """Cria as colunas e os índices de busca (GIN no tsvector e, se houver pg_trgm, de trigramas)"""
+    for tabela in BUSCA_TABELAS:
+        for sql in BUSCA_COLUNAS:
+            conn.execute(text(sql.format(tabela=tabela)))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_busca_tsv ON {tabela} USING gin (busca_tsv)"))
+
     try:
-        df_usuarios = pd.read_csv(usuarios_csv_path)
-        print(f"📊 Dados carregados: {len(df_usuarios)} linhas")
-        print(f"📊 Colunas: {list(df_usuarios.columns)}")
-        print(f"📊 Primeiras 3 linhas dos dados:")
-        print(df_usuarios.head(3).to_string())
-        
-        # Verificar se há dados nulos
-        null_counts = df_usuarios.isnull().sum()
-        if null_counts.sum() > 0:
-            print(f"⚠️ Valores nulos encontrados: {null_counts.to_dict()}")
-        
-        # Remover coluna 'id' se existir (será auto-incrementada pelo PostgreSQL)
-        if 'id' in df_usuarios.columns:
-            df_usuarios = df_usuarios.drop('id', axis=1)
-            print("🔧 Coluna 'id' removida (será auto-incrementada)")
-        
-        # Usar o mesmo método que funciona para filmes
-        print("Carregando usuários usando df.to_sql()...")
-        try:
-            df_usuarios.to_sql("usuarios", engine, if_exists="append", index=False)
-            print("✅ Dados de usuários carregados com sucesso!")
-            
-            # Verificar quantos usuários foram inseridos
-            with engine.begin() as conn:
-                result = conn.execute(text("SELECT COUNT(*) FROM usuarios"))
-                count = result.scalar()
-                print(f"📊 Total de usuários inseridos: {count}")
-        except Exception as e:
-            print(f"❌ Erro ao carregar usuários: {e}")
-            import traceback
-            traceback.print_exc()
-        
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
     except Exception as e:
-        print(f"❌ Erro ao carregar usuários: {e}")
-        import traceback
-        traceback.print_exc()
-
-# === CARREGAR DADOS DE AVALIAÇÕES ===
-print("\n=== CARREGANDO DADOS DE AVALIAÇÕES ===")
-
-# Buscar arquivo de avaliações limpos
-avaliacoes_csv_path = None
-if os.path.exists("/app/data/avaliacoes_clean.csv"):
-    avaliacoes_csv_path = "/app/data/avaliacoes_clean.csv"
-elif os.path.exists("data/avaliacoes_clean.csv"):
-    avaliacoes_csv_path = "data/avaliacoes_clean.csv"
-elif os.path.exists("../avaliacoes_clean.csv"):
-    avaliacoes_csv_path = "../avaliacoes_clean.csv"
-else:
-    print("⚠️ Arquivo de avaliações limpos não encontrado. Pulando carregamento de avaliações.")
-
-if avaliacoes_csv_path:
-    print("Lendo CSV de avaliações:", avaliacoes_csv_path)
-    df_avaliacoes = pd.read_csv(avaliacoes_csv_path)
-    
-    # Verificar se temos usuários suficientes
-    with engine.begin() as conn:
-        result = conn.execute(text("SELECT COUNT(*) FROM usuarios"))
-        total_usuarios = result.scalar()
-        
-        if total_usuarios == 0:
-            print("⚠️ Nenhum usuário encontrado. Pulando carregamento de avaliações.")
+        print(f"⚠️ Extensão pg_trgm indisponível, busca aproximada desativada: {e.__class__.__name__}")
+        return
+    for tabela in BUSCA_TABELAS:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_{tabela}_busca_trgm ON {tabela} USING gin (busca_texto gin_trgm_ops)"
+        ))
+
+
+# === Filmes similares ===
+# Vizinhos de cada filme por similaridade de cosseno das notas (ver
+# filmes_similares.py). A aplicação lê os K vizinhos de um filme com uma única
+# consulta pela chave primária.
+FILMES_SIMILARES_DDL = """
+    CREATE TABLE IF NOT EXISTS filmes_similares (
+        filme_id INTEGER NOT NULL,
+        posicao SMALLINT NOT NULL,
+        similar_id INTEGER NOT NULL,
+        similaridade REAL NOT NULL,
+        PRIMARY KEY (filme_id, posicao)
+    )
+"""
+
+# Nota de cada usuário por filme, com o id inteiro do filme (o menor id do título)
+FILMES_SIMILARES_NOTAS = """
+    COPY (
+        SELECT a.user_id, f.id, AVG(a.nota)
+        FROM {avaliacoes} a
+        JOIN (SELECT titulo, MIN(id) AS id FROM {filmes} GROUP BY titulo) f ON f.titulo = a.filme_titulo
+        WHERE a.user_id IS NOT NULL AND a.nota IS NOT NULL
+        GROUP BY a.user_id, f.id
+    ) TO STDOUT WITH (FORMAT csv)
+"""
+
+
+def gerar_filmes_similares(conn, fontes=TABELAS_ATUAIS, destino="filmes_similares", sem_bloquear_leitores=False):
+    """
+    Recalcula os filmes similares a partir das avaliações, na transação de 'conn'.
+
+    Na troca atômica 'fontes' aponta para as tabelas _novo e 'destino' para
+    filmes_similares_novo, que entra no lugar da atual junto com elas.
+    """
+    import pandas as pd
+    from filmes_similares import SIMILARES_K, calcular_similares
+
+    inicio = time.perf_counter()
+    # Cursor do psycopg2 na mesma transação da conexão do SQLAlchemy (para o COPY)
+    with conn.connection.cursor() as cursor:
+        buffer = io.StringIO()
+        cursor.copy_expert(FILMES_SIMILARES_NOTAS.format(**fontes), buffer)
+        vazio = buffer.tell() == 0
+        buffer.seek(0)
+        notas = (
+            pd.DataFrame(columns=["user_id", "filme_id", "nota"]) if vazio
+            else pd.read_csv(buffer, header=None, names=["user_id", "filme_id", "nota"])
+        )
+        leitura = time.perf_counter()
+
+        filme_id, similar_id, similaridade, posicao = calcular_similares(
+            notas["user_id"].to_numpy(), notas["filme_id"].to_numpy(), notas["nota"].to_numpy()
+        )
+        calculo = time.perf_counter()
+
+        saida = io.StringIO()
+        pd.DataFrame({
+            "filme_id": filme_id,
+            "posicao": posicao,
+            "similar_id": similar_id,
+            "similaridade": similaridade,
+        }).to_csv(saida, index=False, header=False)
+        saida.seek(0)
+
+        cursor.execute(FILMES_SIMILARES_DDL)
+        if sem_bloquear_leitores:
+            # DELETE em vez de TRUNCATE: a aplicação segue lendo os vizinhos antigos até o commit
+            cursor.execute(f"DELETE FROM {destino}")
         else:
-            # Ajustar user_id para não exceder o número de usuários disponíveis
-            max_user_id = df_avaliacoes['user_id'].max()
-            if max_user_id > total_usuarios:
-                print(f"⚠️ Ajustando user_id: máximo no CSV ({max_user_id}) > usuários disponíveis ({total_usuarios})")
-                df_avaliacoes['user_id'] = ((df_avaliacoes['user_id'] - 1) % total_usuarios) + 1
-            
-            # Aplicar normalização nos títulos dos filmes para garantir correspondência
-            df_avaliacoes['filme_titulo'] = df_avaliacoes['filme_titulo'].apply(normalize_text)
-            
-            # Carregar dados na tabela avaliacoes
-            # Garantir que não temos a coluna 'id' que é auto-incrementada
-            if 'id' in df_avaliacoes.columns:
-                df_avaliacoes = df_avaliacoes.drop('id', axis=1)
-            
-            try:
-                # Tentar inserção em lote primeiro
-                df_avaliacoes.to_sql("avaliacoes", engine, if_exists="append", index=False, method='multi')
-                print(f"✅ {len(df_avaliacoes)} avaliações carregadas na tabela 'avaliacoes'")
-            except Exception as e:
-                print(f"⚠️ Erro na inserção em lote: {e}")
-                print("Tentando inserção linha por linha...")
-                
-                # Inserção linha por linha como fallback
-                success_count = 0
-                for index, row in df_avaliacoes.iterrows():
-                    try:
-                        row_df = pd.DataFrame([row])
-                        row_df.to_sql("avaliacoes", engine, if_exists="append", index=False)
-                        success_count += 1
-                    except Exception as row_error:
-                        print(f"❌ Erro na linha {index}: {row_error}")
-                        print(f"Dados da linha: {row.to_dict()}")
-                
-                print(f"✅ {success_count}/{len(df_avaliacoes)} avaliações inseridas com sucesso")
-
-# 4) Criar SQL Views para os Data Marts solicitados
-print("\nCriando SQL Views para Data Marts...")
-
-with engine.begin() as conn:
+            cursor.execute(f"TRUNCATE {destino}")
+        cursor.copy_expert(
+            f"COPY {destino} (filme_id, posicao, similar_id, similaridade) FROM STDIN WITH (FORMAT csv)",
+            saida,
+        )
+
+    fim = time.perf_counter()
+    print(
+        f"📈 Filmes similares: {len(notas)} notas de {notas['filme_id'].nunique()} filmes -> "
+        f"{len(filme_id)} pares (top {SIMILARES_K}) em {fim - inicio:.2f}s "
+        f"(leitura {leitura - inicio:.2f}s, cálculo {calculo - leitura:.2f}s, gravação {fim - calculo:.2f}s)"
+    )
+
+
+def preparar_similares_novos(conn, fontes):
+    """Calcula filmes_similares_novo a partir das tabelas em 'fontes'"""
+    # A staging copia a estrutura da tabela atual, que precisa existir
+    conn.execute(text(FILMES_SIMILARES_DDL))
+    destino = criar_staging(conn, "filmes_similares")
+    gerar_filmes_similares(conn, fontes, destino)
+    finalizar_staging(conn, "filmes_similares")
+
+
+# === Views e funções dos Data Marts ===
+def criar_views(conn):
+    """Cria (ou substitui) as funções de janela, as views e as funções dos marts"""
+    # Janela de tempo dos marts: a aplicação define marts.inicio / marts.fim na
+    # transação (set_config) e as views filtram data_avaliacao por elas. Como as
+    # funções são STABLE, o PostgreSQL poda as partições fora da janela.
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION marts_inicio() RETURNS TIMESTAMP
+        LANGUAGE sql STABLE AS $$
+            SELECT COALESCE(NULLIF(current_setting('marts.inicio', true), '')::timestamp, '-infinity')
+        $$;
+    """))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION marts_fim() RETURNS TIMESTAMP
+        LANGUAGE sql STABLE AS $$
+            SELECT COALESCE(NULLIF(current_setting('marts.fim', true), '')::timestamp, 'infinity')
+        $$;
+    """))
+
+    # Sem janela de tempo os marts leem os agregados (uma linha por grupo); com
+    # janela, reagregam as partições de avaliacoes dentro do período. O ramo que
+    # não se aplica vira um filtro constante e não é executado.
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION marts_janela_ativa() RETURNS BOOLEAN
+        LANGUAGE sql STABLE AS $$
+            SELECT marts_inicio() > '-infinity' OR marts_fim() < 'infinity'
+        $$;
+    """))
+
     # View 1: Top 10 filmes mais bem avaliados por gênero
     conn.execute(text("""
         CREATE OR REPLACE VIEW vw_top_filmes_por_genero AS
+        WITH por_filme AS (
+            SELECT g.genero, g.titulo, g.ano_lancamento, g.total, g.soma_notas
+            FROM agg_avaliacoes_filme_genero g
+            WHERE NOT marts_janela_ativa()
+            UNION ALL
+            SELECT f.genero, f.titulo, f.ano_lancamento, COUNT(a.id), SUM(a.nota)
+            FROM filmes f
+            INNER JOIN avaliacoes a ON f.titulo = a.filme_titulo
+            WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+              AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
+            GROUP BY f.genero, f.titulo, f.ano_lancamento
+        )
         SELECT 
-            f.genero,
-            f.titulo,
-            f.ano_lancamento,
-            ROUND(AVG(a.nota), 2) as nota_media,
-            COUNT(a.id) as total_avaliacoes,
-            ROW_NUMBER() OVER (PARTITION BY f.genero ORDER BY AVG(a.nota) DESC, COUNT(a.id) DESC) as ranking
-        FROM filmes f
-        INNER JOIN avaliacoes a ON f.titulo = a.filme_titulo
-        GROUP BY f.genero, f.titulo, f.ano_lancamento
-        HAVING COUNT(a.id) >= 1
-        ORDER BY f.genero, ranking;
+            genero,
+            titulo,
+            ano_lancamento,
+            ROUND(soma_notas / total, 2) as nota_media,
+            total as total_avaliacoes,
+            ROW_NUMBER() OVER (PARTITION BY genero ORDER BY soma_notas / total DESC, total DESC, titulo, ano_lancamento) as ranking
+        FROM por_filme;
     """))
     
     # View 2: Top 5 usuários com mais avaliações
     conn.execute(text("""
         CREATE OR REPLACE VIEW vw_top_usuarios_avaliacoes AS
+        SELECT 
+            u.id,
+            u.nome,
+            u.email,
+            g.total as total_avaliacoes,
+            ROUND(g.soma_notas / g.total, 2) as nota_media_dada,
+            g.primeira_avaliacao,
+            g.ultima_avaliacao
+        FROM usuarios u
+        INNER JOIN agg_avaliacoes_usuario g ON u.id = g.user_id
+        WHERE NOT marts_janela_ativa()
+        UNION ALL
         SELECT 
             u.id,
             u.nome,
@@ -268,30 +826,50 @@ with engine.begin() as conn:
             MAX(a.data_avaliacao) as ultima_avaliacao
         FROM usuarios u
         INNER JOIN avaliacoes a ON u.id = a.user_id
+        WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+          AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
         GROUP BY u.id, u.nome, u.email
-        ORDER BY total_avaliacoes DESC, nota_media_dada DESC;
+        ORDER BY total_avaliacoes DESC, nota_media_dada DESC, id;
     """))
     
     # View 3: Top 10 filmes com piores avaliações por gênero
     conn.execute(text("""
         CREATE OR REPLACE VIEW vw_piores_filmes_por_genero AS
+        WITH por_filme AS (
+            SELECT g.genero, g.titulo, g.ano_lancamento, g.total, g.soma_notas
+            FROM agg_avaliacoes_filme_genero g
+            WHERE NOT marts_janela_ativa()
+            UNION ALL
+            SELECT f.genero, f.titulo, f.ano_lancamento, COUNT(a.id), SUM(a.nota)
+            FROM filmes f
+            INNER JOIN avaliacoes a ON f.titulo = a.filme_titulo
+            WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+              AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
+            GROUP BY f.genero, f.titulo, f.ano_lancamento
+        )
         SELECT 
-            f.genero,
-            f.titulo,
-            f.ano_lancamento,
-            ROUND(AVG(a.nota), 2) as nota_media,
-            COUNT(a.id) as total_avaliacoes,
-            ROW_NUMBER() OVER (PARTITION BY f.genero ORDER BY AVG(a.nota) ASC, COUNT(a.id) DESC) as ranking
-        FROM filmes f
-        INNER JOIN avaliacoes a ON f.titulo = a.filme_titulo
-        GROUP BY f.genero, f.titulo, f.ano_lancamento
-        HAVING COUNT(a.id) >= 1
-        ORDER BY f.genero, ranking;
+            genero,
+            titulo,
+            ano_lancamento,
+            ROUND(soma_notas / total, 2) as nota_media,
+            total as total_avaliacoes,
+            ROW_NUMBER() OVER (PARTITION BY genero ORDER BY soma_notas / total ASC, total DESC, titulo, ano_lancamento) as ranking
+        FROM por_filme;
     """))
     
     # View 4: Número de avaliações por país
     conn.execute(text("""
         CREATE OR REPLACE VIEW vw_avaliacoes_por_pais AS
+        SELECT 
+            g.pais,
+            g.total as total_avaliacoes,
+            g.usuarios as total_usuarios,
+            ROUND(g.soma_notas / g.total, 2) as nota_media_pais,
+            g.primeira_avaliacao,
+            g.ultima_avaliacao
+        FROM agg_avaliacoes_pais g
+        WHERE NOT marts_janela_ativa()
+        UNION ALL
         SELECT 
             u.pais,
             COUNT(a.id) as total_avaliacoes,
@@ -301,13 +879,26 @@ with engine.begin() as conn:
             MAX(a.data_avaliacao) as ultima_avaliacao
         FROM usuarios u
         INNER JOIN avaliacoes a ON u.id = a.user_id
+        WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+          AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
         GROUP BY u.pais
-        ORDER BY total_avaliacoes DESC, nota_media_pais DESC;
+        ORDER BY total_avaliacoes DESC, nota_media_pais DESC, pais;
     """))
     
     # View 5: Nota média por gênero dos usuários
     conn.execute(text("""
         CREATE OR REPLACE VIEW vw_nota_media_por_genero AS
+        SELECT 
+            g.genero,
+            g.total as total_avaliacoes,
+            ROUND(g.soma_notas / g.total, 2) as nota_media_genero,
+            g.usuarios as usuarios_avaliaram,
+            g.filmes as filmes_avaliados,
+            g.nota_minima,
+            g.nota_maxima
+        FROM agg_avaliacoes_genero g
+        WHERE NOT marts_janela_ativa()
+        UNION ALL
         SELECT 
             f.genero,
             COUNT(a.id) as total_avaliacoes,
@@ -318,27 +909,1027 @@ with engine.begin() as conn:
             MAX(a.nota) as nota_maxima
         FROM filmes f
         INNER JOIN avaliacoes a ON f.titulo = a.filme_titulo
+        WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+          AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
         GROUP BY f.genero
-        ORDER BY nota_media_genero DESC, total_avaliacoes DESC;
+        ORDER BY nota_media_genero DESC, total_avaliacoes DESC, genero;
+    """))
+
+    # Top N por gênero: as views acima ranqueiam todos os filmes; as rotas usam
+    # estas funções, que leem só os N primeiros de cada gênero pelo índice de
+    # agg_avaliacoes_filme_genero (LATERAL ... LIMIT n). Com janela de tempo o
+    # ranking é calculado sobre as partições do período.
+    for nome, direcao in (("top", "DESC"), ("piores", "ASC")):
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION mart_{nome}_filmes_por_genero(limite INTEGER)
+            RETURNS TABLE (
+                genero TEXT,
+                titulo TEXT,
+                ano_lancamento INTEGER,
+                nota_media NUMERIC,
+                total_avaliacoes BIGINT,
+                ranking BIGINT
+            )
+            LANGUAGE sql STABLE AS $$
+                SELECT ge.genero, t.titulo, t.ano_lancamento, ROUND(t.nota_media, 2), t.total,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY ge.genero
+                           ORDER BY t.nota_media {direcao}, t.total DESC, t.titulo, t.ano_lancamento
+                       )
+                FROM agg_avaliacoes_genero ge
+                CROSS JOIN LATERAL (
+                    (SELECT g.titulo, g.ano_lancamento, g.nota_media, g.total
+                     FROM agg_avaliacoes_filme_genero g
+                     WHERE g.genero = ge.genero
+                     ORDER BY g.genero, g.nota_media {direcao}, g.total DESC, g.titulo, g.ano_lancamento
+                     LIMIT limite)
+                    UNION ALL
+                    -- Filmes sem gênero formam um grupo próprio, como no PARTITION BY das views
+                    (SELECT g.titulo, g.ano_lancamento, g.nota_media, g.total
+                     FROM agg_avaliacoes_filme_genero g
+                     WHERE ge.genero IS NULL AND g.genero IS NULL
+                     ORDER BY g.genero, g.nota_media {direcao}, g.total DESC, g.titulo, g.ano_lancamento
+                     LIMIT limite)
+                ) t
+                WHERE NOT marts_janela_ativa()
+                UNION ALL
+                SELECT r.genero, r.titulo, r.ano_lancamento, ROUND(r.soma_notas / r.total, 2), r.total, r.ranking
+                FROM (
+                    SELECT f.genero, f.titulo, f.ano_lancamento,
+                           COUNT(a.id) AS total, SUM(a.nota) AS soma_notas,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY f.genero
+                               ORDER BY SUM(a.nota) / COUNT(a.id) {direcao}, COUNT(a.id) DESC, f.titulo, f.ano_lancamento
+                           ) AS ranking
+                    FROM filmes f
+                    INNER JOIN avaliacoes a ON f.titulo = a.filme_titulo
+                    WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+                      AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
+                    GROUP BY f.genero, f.titulo, f.ano_lancamento
+                ) r
+                WHERE r.ranking <= limite
+            $$;
+        """))
+
+    # Mart 6: Número de filmes avaliados pelos usuários mais ativos
+    # Passada única com top N antecipado: sem janela, os N maiores totais saem de
+    # agg_avaliacoes_usuario e só esses usuários têm os filmes distintos contados
+    # (índice user_id, filme_titulo); com janela, uma única agregação por usuário
+    # sobre as partições do período. Função SQL STABLE de um SELECT: o PostgreSQL
+    # a expande dentro da consulta como se fosse uma view com parâmetro.
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION mart_numero_filmes_avaliados(limite INTEGER)
+        RETURNS TABLE (
+            id INTEGER,
+            nome TEXT,
+            email TEXT,
+            total_avaliacoes BIGINT,
+            filmes_unicos_avaliados BIGINT,
+            nota_media_dada NUMERIC,
+            primeira_avaliacao TIMESTAMP,
+            ultima_avaliacao TIMESTAMP
+        )
+        LANGUAGE sql STABLE AS $$
+            SELECT u.id, u.nome, u.email, top.total, filmes.distintos,
+                   top.nota_media, top.primeira_avaliacao, top.ultima_avaliacao
+            FROM (
+                SELECT g.user_id, g.total, ROUND(g.soma_notas / g.total, 2) AS nota_media,
+                       g.primeira_avaliacao, g.ultima_avaliacao
+                FROM agg_avaliacoes_usuario g
+                ORDER BY g.total DESC, nota_media DESC, g.user_id
+                LIMIT limite
+            ) top
+            INNER JOIN usuarios u ON u.id = top.user_id
+            CROSS JOIN LATERAL (
+                SELECT COUNT(DISTINCT a.filme_titulo) AS distintos
+                FROM avaliacoes a
+                WHERE a.user_id = top.user_id AND a.nota IS NOT NULL
+            ) filmes
+            WHERE NOT marts_janela_ativa()
+            UNION ALL
+            SELECT u.id, u.nome, u.email, top.total, top.distintos,
+                   top.nota_media, top.primeira_avaliacao, top.ultima_avaliacao
+            FROM (
+                SELECT a.user_id, COUNT(a.id) AS total, COUNT(DISTINCT a.filme_titulo) AS distintos,
+                       ROUND(AVG(a.nota), 2) AS nota_media,
+                       MIN(a.data_avaliacao) AS primeira_avaliacao, MAX(a.data_avaliacao) AS ultima_avaliacao
+                FROM avaliacoes a
+                WHERE marts_janela_ativa() AND a.nota IS NOT NULL
+                  AND a.user_id IS NOT NULL
+                  AND a.data_avaliacao >= marts_inicio() AND a.data_avaliacao < marts_fim()
+                GROUP BY a.user_id
+                ORDER BY total DESC, nota_media DESC, a.user_id
+                LIMIT limite
+            ) top
+            INNER JOIN usuarios u ON u.id = top.user_id
+        $$;
     """))
 
-print("✅ SQL Views criadas:")
-print("  - vw_top_filmes_por_genero (Top 10 filmes mais bem avaliados por gênero)")
-print("  - vw_top_usuarios_avaliacoes (Top 5 usuários com mais avaliações)")
-print("  - vw_piores_filmes_por_genero (Top 10 filmes com piores avaliações por gênero)")
-print("  - vw_avaliacoes_por_pais (Número de avaliações por país)")
-print("  - vw_nota_media_por_genero (Nota média por gênero dos usuários)")
+
+# === Carga azul/verde ===
+# Com CARGA_TROCA_ATOMICA=1 as tabelas recarregadas não são esvaziadas: a carga
+# grava em cópias UNLOGGED "<tabela>_novo", sem índices (e sem WAL). No final os
+# índices são criados, as cópias passam a LOGGED e entram no lugar das atuais
+# com renomeações em uma única transação curta, junto com as cópias dos agregados
+# e de filmes_similares calculadas a partir delas. A aplicação lê os dados
+# antigos durante toda a carga e nunca vê tabelas vazias ou pela metade.
+CARGA_TROCA_ATOMICA = os.getenv("CARGA_TROCA_ATOMICA", "0").lower() in ("1", "true", "yes")
+
+SUFIXO_STAGING = "_novo"
+
+# Espera máxima por cada lock da transação de troca (LOCK, DROP, RENAME). Enquanto
+# o DROP aguarda uma consulta longa, as consultas novas da aplicação ficam na fila
+# atrás dele; com o prazo estourado a troca desiste e tenta de novo.
+CARGA_LOCK_TIMEOUT = os.getenv("CARGA_LOCK_TIMEOUT", "5s")
+CARGA_TROCA_TENTATIVAS = int(os.getenv("CARGA_TROCA_TENTATIVAS", "3"))
+
+# SQLSTATE de lock_timeout estourado (lock_not_available)
+LOCK_INDISPONIVEL = "55P03"
+
+# Tamanho máximo de um identificador no PostgreSQL (nomes maiores são truncados)
+TAMANHO_MAXIMO_NOME = 63
+
+
+def nome_staging(nome):
+    """Nome da constraint/índice da staging: o original + _novo, cortando o original se preciso"""
+    return nome[:TAMANHO_MAXIMO_NOME - len(SUFIXO_STAGING)] + SUFIXO_STAGING
+
+
+def criar_staging(conn, tabela):
+    """Cria <tabela>_novo UNLOGGED com as colunas, defaults e CHECKs da tabela atual, sem índices"""
+    staging = tabela + SUFIXO_STAGING
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging} CASCADE"))
+    if tabela == "avaliacoes":
+        # Tabela particionada não pode ser UNLOGGED: as partições é que são
+        conn.execute(text(
+            f"CREATE TABLE {staging} (LIKE {tabela} INCLUDING ALL EXCLUDING INDEXES) "
+            "PARTITION BY RANGE (data_avaliacao)"
+        ))
+        conn.execute(text(f"CREATE UNLOGGED TABLE {staging}_default PARTITION OF {staging} DEFAULT"))
+        mes_atual = date.today().replace(day=1)
+        garantir_particoes(
+            conn, mes_atual, somar_meses(mes_atual, AVALIACOES_PARTICOES_FUTURAS), staging, unlogged=True
+        )
+    else:
+        conn.execute(text(f"CREATE UNLOGGED TABLE {staging} (LIKE {tabela} INCLUDING ALL EXCLUDING INDEXES)"))
+    return staging
+
+
+def finalizar_staging(conn, tabela):
+    """Recria na staging as constraints e índices da tabela atual, roda ANALYZE e passa para LOGGED"""
+    staging = tabela + SUFIXO_STAGING
+    # PRIMARY KEY / UNIQUE (o índice vem junto com a constraint)
+    constraints = conn.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = to_regclass(:t) AND contype IN ('p', 'u')
+    """), {"t": tabela}).all()
+    for nome, definicao in constraints:
+        conn.execute(text(f"ALTER TABLE {staging} ADD CONSTRAINT {nome_staging(nome)} {definicao}"))
+    # Demais índices, com o mesmo nome + sufixo (nomes de índice são únicos no schema)
+    indices = conn.execute(text("""
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(:t)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c
+              WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid
+          )
+    """), {"t": tabela}).all()
+    for nome, definicao in indices:
+        definicao = re.sub(
+            rf" INDEX {re.escape(nome)} ON (ONLY )?(\S+\.)?{tabela} ",
+            f" INDEX {nome_staging(nome)} ON {staging} ",
+            definicao,
+        )
+        conn.execute(text(definicao))
+
+    conn.execute(text(f"ANALYZE {staging}"))
+
+    particoes = conn.execute(text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:t)"
+    ), {"t": staging}).scalars().all()
+    for particao in particoes or [staging]:
+        conn.execute(text(f"ALTER TABLE {particao} SET LOGGED"))
+
+
+def trocar_tabelas(conn, tabelas):
+    """Coloca as tabelas _novo no lugar das atuais e recria as views, na mesma transação"""
+    for tabela in tabelas:
+        staging = tabela + SUFIXO_STAGING
+        # Agregados e filmes_similares não têm coluna id (nem sequência)
+        sequencia = conn.execute(text("""
+            SELECT pg_get_serial_sequence(:t, 'id')
+            WHERE EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(:t) AND attname = 'id')
+        """), {"t": tabela}).scalar()
+        if sequencia:
+            # A sequência do id passa para a tabela nova antes de a antiga ser apagada
+            conn.execute(text(f"ALTER SEQUENCE {sequencia} OWNED BY {staging}.id"))
+        # Nomes originais das constraints e índices, restaurados depois da troca
+        originais = {
+            nome_staging(nome): nome
+            for nome in conn.execute(text(
+                "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(:t)"
+            ), {"t": tabela}).scalars()
+        }
+        # CASCADE leva as views dependentes, recriadas logo abaixo
+        conn.execute(text(f"DROP TABLE {tabela} CASCADE"))
+        conn.execute(text(f"ALTER TABLE {staging} RENAME TO {tabela}"))
+
+        particoes = conn.execute(text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:t)"
+        ), {"t": tabela}).scalars().all()
+        for particao in particoes:
+            novo_nome = tabela + particao.removeprefix(staging)
+            if conn.execute(text("SELECT to_regclass(:t)"), {"t": novo_nome}).scalar() is not None:
+                # Tabela avulsa (partição desanexada) ocupando o nome
+                arquivar_tabela(conn, novo_nome)
+            conn.execute(text(f"ALTER TABLE {particao} RENAME TO {novo_nome}"))
+            # Índices das partições recebem nomes derivados do nome da partição
+            indices_particao = conn.execute(text(
+                "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(:t)"
+            ), {"t": novo_nome}).scalars().all()
+            for indice in indices_particao:
+                if indice.startswith(particao):
+                    conn.execute(text(f"ALTER INDEX {indice} RENAME TO {novo_nome}{indice.removeprefix(particao)}"))
+
+        # Renomear a constraint renomeia também o índice dela
+        constraints = conn.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:t)"
+        ), {"t": tabela}).scalars().all()
+        for nome in constraints:
+            if nome in originais:
+                conn.execute(text(f"ALTER TABLE {tabela} RENAME CONSTRAINT {nome} TO {originais[nome]}"))
+        indices = conn.execute(text("""
+            SELECT i.relname
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = to_regclass(:t)
+        """), {"t": tabela}).scalars().all()
+        for nome in indices:
+            if nome in originais:
+                conn.execute(text(f"ALTER INDEX {nome} RENAME TO {originais[nome]}"))
+
+        if sequencia:
+            conn.execute(text(
+                f"SELECT setval('{sequencia}', COALESCE((SELECT MAX(id) FROM {tabela}), 0) + 1, false)"
+            ))
+    criar_views(conn)
+
+
+# === Carga paralela com COPY ===
+# Conexões simultâneas na carga (tabelas independentes e lotes de avaliações)
+CARGA_WORKERS = int(os.getenv("CARGA_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Linhas por lote de avaliações enviado a cada conexão
+CARGA_LOTE_LINHAS = int(os.getenv("CARGA_LOTE_LINHAS", "100000"))
+
+
+def preparar_para_copy(df):
+    """Colunas float só com valores inteiros (ex.: user_id com nulos) viram Int64 para o COPY"""
+    for coluna in df.select_dtypes("float").columns:
+        if (df[coluna].dropna() % 1 == 0).all():
+            df[coluna] = df[coluna].astype("Int64")
+    return df
+
+
+def copiar_lote(tabela, df):
+    """Grava um lote com COPY em uma conexão própria e retorna (linhas, início, fim, worker)"""
+    inicio = time.perf_counter()
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {tabela} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(df), inicio, time.perf_counter(), threading.current_thread().name
+
+
+def destino_carga(tabela, df):
+    """
+    Tabela que recebe os lotes: a própria ou, na troca atômica, a staging.
+
+    Na staging os ids 1..N vão explícitos no DataFrame (como após o RESTART
+    IDENTITY) e a sequência só é ajustada na troca.
+    """
+    if not CARGA_TROCA_ATOMICA:
+        return tabela
+    df.insert(0, "id", range(1, len(df) + 1))
+    with engine.begin() as conn:
+        return criar_staging(conn, tabela)
+
+
+def reservar_ids(tabela, quantidade):
+    """Reserva ids na sequência da tabela (nenhum outro INSERT os recebe) e os retorna em ordem"""
+    with engine.begin() as conn:
+        return sorted(conn.execute(text(
+            "SELECT nextval(pg_get_serial_sequence(:t, 'id')) FROM generate_series(1, :n)"
+        ), {"t": tabela, "n": quantidade}).scalars())
+
+
+def mapa_usuarios_da_carga(conn):
+    """
+    Series linha do CSV de usuários -> usuarios.id, dos usuários gravados pelo ETL (lote + tail).
+
+    Usuários cadastrados pela aplicação usam a mesma sequência de ids, então a
+    ordem dos ids não diz a que linha do CSV cada um corresponde: a linha fica
+    gravada em usuarios.linha_carga junto com o usuário.
+    """
+    import pandas as pd
+
+    linhas = conn.execute(text(
+        "SELECT linha_carga, id FROM usuarios WHERE linha_carga IS NOT NULL ORDER BY linha_carga"
+    )).all()
+    return pd.Series([id for _, id in linhas], index=[linha for linha, _ in linhas], dtype="int64")
+
+
+def preparar_avaliacoes(df_avaliacoes, usuarios):
+    """
+    Troca o user_id do CSV (linha no CSV de usuários) pelo id gravado, normaliza
+    os títulos e monta o texto de busca. usuarios: Series linha -> usuarios.id.
+    """
+    # Ajustar user_id para não exceder o número de usuários disponíveis
+    total_usuarios = len(usuarios)
+    max_user_id = df_avaliacoes['user_id'].max()
+    if max_user_id > total_usuarios:
+        print(f"⚠️ Ajustando user_id: máximo no CSV ({max_user_id}) > usuários disponíveis ({total_usuarios})")
+        df_avaliacoes['user_id'] = ((df_avaliacoes['user_id'] - 1) % total_usuarios) + 1
+    df_avaliacoes['user_id'] = df_avaliacoes['user_id'].map(usuarios)
+
+    # Aplicar normalização nos títulos dos filmes para garantir correspondência
+    df_avaliacoes['filme_titulo'] = df_avaliacoes['filme_titulo'].apply(normalize_text)
+    if 'comentario' in df_avaliacoes.columns:
+        df_avaliacoes['busca_texto'] = texto_de_busca(df_avaliacoes['filme_titulo'], df_avaliacoes['comentario'])
+    else:
+        df_avaliacoes['busca_texto'] = texto_de_busca(df_avaliacoes['filme_titulo'])
+
+    # Garantir que não temos a coluna 'id' que é auto-incrementada
+    if 'id' in df_avaliacoes.columns:
+        df_avaliacoes = df_avaliacoes.drop('id', axis=1)
+    return df_avaliacoes
+
+
+def inserir_linha_a_linha(tabela, df):
+    """Fallback: insere linha por linha e ignora as que o banco rejeitar"""
+    import pandas as pd
+
+    success_count = 0
+    for index, row in df.iterrows():
+        try:
+            pd.DataFrame([row]).to_sql(tabela, engine, if_exists="append", index=False)
+            success_count += 1
+        except Exception as row_error:
+            print(f"❌ Erro na linha {index}: {row_error}")
+            print(f"Dados da linha: {row.to_dict()}")
+    return success_count
+
+
+# 3) LOAD: gravar no Postgres - Data Warehouse (tabelas)
+def criar_schema(recarregar):
+    """
+    Cria (ou migra) as tabelas e os agregados e esvazia as tabelas a recarregar.
+
+    Retorna True se os agregados precisam ser reconstruídos depois da carga.
+    """
+    with engine.begin() as conn:
+        # Criar tabela de filmes
+        create_filmes_sql = """
+        CREATE TABLE IF NOT EXISTS filmes (
+            id SERIAL PRIMARY KEY,
+            titulo TEXT,
+            ano_lancamento INTEGER,
+            genero TEXT,
+            nota_imdb REAL
+        );
+        """
+        conn.execute(text(create_filmes_sql))
+        # Busca do id do filme pelo título (filmes similares na aplicação)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_filmes_titulo ON filmes (titulo)"))
+
+        # Criar tabela de usuários (estrutura simples como filmes)
+        create_usuarios_sql = """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id SERIAL PRIMARY KEY,
+            nome TEXT,
+            email TEXT,
+            genero TEXT,
+            pais TEXT
+        );
+        """
+        conn.execute(text(create_usuarios_sql))
+        # Linha do usuário no CSV limpo (nula nos cadastrados pela aplicação): o
+        # user_id do CSV de avaliações é essa linha, não o id gerado
+        conn.execute(text("ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS linha_carga INTEGER"))
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_linha_carga ON usuarios (linha_carga)"))
+
+        # Verificar se a tabela foi criada corretamente
+        result = conn.execute(text("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'usuarios' ORDER BY ordinal_position"))
+        columns = result.fetchall()
+        print(f"📋 Estrutura da tabela usuarios: {columns}")
+
+        # Criar tabela de avaliações particionada por mês de data_avaliacao
+        tipo_avaliacoes = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass('avaliacoes')")
+        ).scalar()
+        if tipo_avaliacoes == "r":
+            # Tabela antiga sem particionamento: renomear e migrar os dados
+            print("🔧 Convertendo 'avaliacoes' para tabela particionada por mês...")
+            conn.execute(text("ALTER TABLE avaliacoes RENAME TO avaliacoes_legado"))
+            conn.execute(text("ALTER SEQUENCE IF EXISTS avaliacoes_id_seq RENAME TO avaliacoes_legado_id_seq"))
+
+        create_avaliacoes_sql = """
+        CREATE TABLE IF NOT EXISTS avaliacoes (
+            id SERIAL,
+            user_id INTEGER REFERENCES usuarios(id),
+            filme_titulo VARCHAR(500) NOT NULL,
+            nota DECIMAL(3,1) CHECK (nota >= 0 AND nota <= 10),
+            comentario TEXT,
+            data_avaliacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, data_avaliacao)
+        ) PARTITION BY RANGE (data_avaliacao);
+        """
+        conn.execute(text(create_avaliacoes_sql))
+        conn.execute(text("CREATE TABLE IF NOT EXISTS avaliacoes_default PARTITION OF avaliacoes DEFAULT"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_avaliacoes_data ON avaliacoes (data_avaliacao)"))
+        # Filmes distintos de um usuário direto do índice (mart numero_filmes_avaliados)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_avaliacoes_usuario_filme ON avaliacoes (user_id, filme_titulo)"))
+
+        # Partições do mês atual e dos próximos meses
+        mes_atual = date.today().replace(day=1)
+        garantir_particoes(conn, mes_atual, somar_meses(mes_atual, AVALIACOES_PARTICOES_FUTURAS))
+
+        if tipo_avaliacoes == "r":
+            periodo = conn.execute(text(
+                "SELECT MIN(data_avaliacao), MAX(data_avaliacao) FROM avaliacoes_legado"
+            )).one()
+            if periodo[0] is not None:
+                garantir_particoes(conn, periodo[0].date(), periodo[1].date())
+            conn.execute(text("""
+                INSERT INTO avaliacoes (id, user_id, filme_titulo, nota, comentario, data_avaliacao)
+                SELECT id, user_id, filme_titulo, nota, comentario, COALESCE(data_avaliacao, CURRENT_TIMESTAMP)
+                FROM avaliacoes_legado
+            """))
+            conn.execute(text(
+                "SELECT setval('avaliacoes_id_seq', COALESCE((SELECT MAX(id) FROM avaliacoes), 0) + 1, false)"
+            ))
+            # As views dependentes são recriadas mais adiante
+            conn.execute(text("DROP TABLE avaliacoes_legado CASCADE"))
+
+        # Colunas e índices da busca em filmes e avaliações
+        criar_busca(conn)
+
+        # Agregados de avaliações: sem o trigger durante a carga em lote, eles são
+        # reconstruídos de uma vez depois (passo 3b)
+        agregados_existiam = conn.execute(text("SELECT to_regclass('agg_avaliacoes_filme_genero')")).scalar() is not None
+        for sql in AGREGADOS_DDL:
+            conn.execute(text(sql))
+        reconstruir = not agregados_existiam or tipo_avaliacoes == "r" or any(recarregar.values())
+        # Na troca atômica as tabelas atuais (e o trigger) seguem valendo até a troca
+        if reconstruir and not CARGA_TROCA_ATOMICA:
+            conn.execute(text("DROP TRIGGER IF EXISTS trg_avaliacoes_agregados ON avaliacoes"))
+
+        # Limpar dados existentes (apenas das tabelas que serão recarregadas)
+        if not CARGA_TROCA_ATOMICA:
+            if recarregar["avaliacoes"]:
+                conn.execute(text("TRUNCATE TABLE avaliacoes RESTART IDENTITY CASCADE;"))
+            if recarregar["usuarios"]:
+                conn.execute(text("TRUNCATE TABLE usuarios RESTART IDENTITY CASCADE;"))
+            if recarregar["filmes"]:
+                conn.execute(text("TRUNCATE TABLE filmes RESTART IDENTITY;"))
+    return reconstruir
+
+
+def carregar_tabelas(arquivos_limpos, recarregar, df=None):
+    """
+    Carrega com COPY em paralelo as tabelas a recarregar.
+
+    Retorna ({tabela: registros}, {tabela: posição em bytes lida do CSV limpo}).
+    """
+    # pandas só é importado se houver tabela a recarregar
+    if recarregar["usuarios"] or recarregar["avaliacoes"]:
+        import pandas as pd
+
+    usuarios_csv_path = arquivos_limpos["usuarios"]
+    avaliacoes_csv_path = arquivos_limpos["avaliacoes"]
+    # Tabelas carregadas nesta execução: {tabela: registros}
+    carregadas = {}
+    posicoes = {}
+
+    # Lotes a carregar: (tabela, tabela de destino, DataFrame)
+    lotes = []
+
+    if recarregar["filmes"]:
+        lotes.append(("filmes", destino_carga("filmes", df), preparar_para_copy(df)))
+
+    # === CARREGAR DADOS DE USUÁRIOS ===
+    print("\n=== CARREGANDO DADOS DE USUÁRIOS ===")
+
+    # Usuários disponíveis para as avaliações: Series linha do CSV -> usuarios.id
+    usuarios = None
+
+    if usuarios_csv_path and recarregar["usuarios"]:
+        print("Lendo CSV de usuários:", usuarios_csv_path)
+        try:
+            df_usuarios, posicoes["usuarios"] = ler_csv_limpo(usuarios_csv_path)
+            print(f"📊 Dados carregados: {len(df_usuarios)} linhas")
+            print(f"📊 Colunas: {list(df_usuarios.columns)}")
+            print(f"📊 Primeiras 3 linhas dos dados:")
+            print(df_usuarios.head(3).to_string())
+
+            # Verificar se há dados nulos
+            null_counts = df_usuarios.isnull().sum()
+            if null_counts.sum() > 0:
+                print(f"⚠️ Valores nulos encontrados: {null_counts.to_dict()}")
+
+            # Remover coluna 'id' se existir (os ids vêm da sequência do PostgreSQL)
+            if 'id' in df_usuarios.columns:
+                df_usuarios = df_usuarios.drop('id', axis=1)
+                print("🔧 Coluna 'id' removida (será gerada pelo PostgreSQL)")
+
+            df_usuarios.insert(0, "linha_carga", range(1, len(df_usuarios) + 1))
+            destino = destino_carga("usuarios", df_usuarios)
+            if "id" not in df_usuarios.columns:
+                # ids reservados antes do COPY: as avaliações são carregadas em paralelo
+                # e a aplicação pode cadastrar usuários durante a carga
+                df_usuarios.insert(0, "id", reservar_ids("usuarios", len(df_usuarios)))
+            lotes.append(("usuarios", destino, preparar_para_copy(df_usuarios)))
+            usuarios = pd.Series(df_usuarios["id"].to_numpy(), index=df_usuarios["linha_carga"].to_numpy())
+        except Exception as e:
+            print(f"❌ Erro ao carregar usuários: {e}")
+            import traceback
+            traceback.print_exc()
+
+    # === CARREGAR DADOS DE AVALIAÇÕES ===
+    print("\n=== CARREGANDO DADOS DE AVALIAÇÕES ===")
+
+    if avaliacoes_csv_path and recarregar["avaliacoes"]:
+        print("Lendo CSV de avaliações:", avaliacoes_csv_path)
+        df_avaliacoes, posicoes["avaliacoes"] = ler_csv_limpo(avaliacoes_csv_path)
+
+        # Verificar se temos usuários suficientes
+        if usuarios is None:
+            with engine.connect() as conn:
+                usuarios = mapa_usuarios_da_carga(conn)
+
+        if usuarios.empty:
+            print("⚠️ Nenhum usuário encontrado. Pulando carregamento de avaliações.")
+        else:
+            # Carregar dados na tabela avaliacoes
+            df_avaliacoes = preparar_avaliacoes(df_avaliacoes, usuarios)
+            destino = destino_carga("avaliacoes", df_avaliacoes)
+
+            # Feeds com data da avaliação: criar as partições mensais necessárias
+            # (em transação própria, antes dos lotes paralelos)
+            if 'data_avaliacao' in df_avaliacoes.columns:
+                datas = pd.to_datetime(df_avaliacoes['data_avaliacao'])
+                with engine.begin() as conn_particoes:
+                    garantir_particoes(
+                        conn_particoes, datas.min().date(), datas.max().date(), destino, unlogged=CARGA_TROCA_ATOMICA
+                    )
+
+            # A chave estrangeira para usuarios é recriada depois da carga: assim os
+            # lotes de avaliações não esperam a carga de usuários nem a checam linha a linha
+            if not CARGA_TROCA_ATOMICA:
+                with engine.begin() as conn:
+                    conn.execute(text("ALTER TABLE avaliacoes DROP CONSTRAINT IF EXISTS avaliacoes_user_id_fkey"))
+
+            df_avaliacoes = preparar_para_copy(df_avaliacoes)
+            for inicio_lote in range(0, len(df_avaliacoes), CARGA_LOTE_LINHAS):
+                lotes.append(("avaliacoes", destino, df_avaliacoes.iloc[inicio_lote:inicio_lote + CARGA_LOTE_LINHAS]))
+
+    if lotes:
+        print(f"\nCarregando {len(lotes)} lote(s) com {CARGA_WORKERS} conexão(ões) em paralelo...")
+        # {tabela: [linhas, início, fim]} e {worker: [lotes, linhas, segundos]}
+        por_tabela = {}
+        por_worker = {}
+        falhas = {}
+        with ThreadPoolExecutor(max_workers=CARGA_WORKERS, thread_name_prefix="carga") as executor:
+            futuros = {
+                executor.submit(copiar_lote, destino, lote): (tabela, destino, lote)
+                for tabela, destino, lote in lotes
+            }
+            for futuro in as_completed(futuros):
+                tabela, destino, lote = futuros[futuro]
+                try:
+                    linhas, inicio, fim, worker = futuro.result()
+                except Exception as e:
+                    print(f"⚠️ Erro no COPY de um lote de '{tabela}': {e}")
+                    falhas.setdefault(tabela, []).append((destino, lote))
+                    continue
+                estat = por_tabela.setdefault(tabela, [0, inicio, fim])
+                estat[0] += linhas
+                estat[1] = min(estat[1], inicio)
+                estat[2] = max(estat[2], fim)
+                estat_worker = por_worker.setdefault(worker, [0, 0, 0.0])
+                estat_worker[0] += 1
+                estat_worker[1] += linhas
+                estat_worker[2] += fim - inicio
+
+        for tabela, (linhas, inicio, fim) in por_tabela.items():
+            segundos = max(fim - inicio, 1e-9)
+            print(f"📈 {tabela}: {linhas} linhas em {segundos:.2f}s ({linhas / segundos:,.0f} linhas/s)")
+        for worker, (quantidade, linhas, segundos) in sorted(por_worker.items()):
+            print(f"   {worker}: {quantidade} lote(s), {linhas} linhas ({linhas / max(segundos, 1e-9):,.0f} linhas/s)")
+
+        carregadas.update({tabela: estat[0] for tabela, estat in por_tabela.items()})
+        if "usuarios" in falhas:
+            if CARGA_TROCA_ATOMICA:
+                raise RuntimeError("Falha ao carregar a tabela 'usuarios': troca cancelada, tabelas atuais mantidas")
+            # Os ids dos usuários dependem da ordem do arquivo: sem fallback linha a linha
+            print("❌ Erro ao carregar usuários")
+            carregadas.pop("usuarios", None)
+        if "filmes" in falhas:
+            raise RuntimeError("Falha ao carregar a tabela 'filmes'")
+        for destino, lote in falhas.get("avaliacoes", []):
+            print("Tentando inserção linha por linha...")
+            success_count = inserir_linha_a_linha(destino, lote)
+            carregadas["avaliacoes"] = carregadas.get("avaliacoes", 0) + success_count
+            print(f"✅ {success_count}/{len(lote)} avaliações do lote inseridas com sucesso")
+
+        for tabela in ("filmes", "usuarios", "avaliacoes"):
+            if tabela in carregadas:
+                print(f"✅ {carregadas[tabela]} registros carregados na tabela '{tabela}'")
+
+    return carregadas, posicoes
+
+
+# 3a) Troca atômica: preparar as tabelas novas e colocá-las no lugar das atuais
+def trocar_para_tabelas_novas(carregadas):
+    """
+    Finaliza as tabelas _novo carregadas nesta execução e as coloca no lugar das atuais.
+
+    Agregados e filmes similares são calculados a partir das tabelas _novo e
+    trocados na mesma transação: a aplicação nunca vê as tabelas novas ao lado
+    de agregados antigos ou de vizinhos com ids da versão anterior.
+    """
+    trocar = [tabela for tabela in ("filmes", "usuarios", "avaliacoes") if tabela in carregadas]
+    print(f"\nPreparando tabelas novas (índices, ANALYZE, SET LOGGED): {trocar}")
+    with engine.begin() as conn:
+        # usuarios antes de avaliacoes: a FK só aceita tabela referenciada LOGGED
+        for tabela in trocar:
+            finalizar_staging(conn, tabela)
+        if "avaliacoes" in trocar:
+            referenciada = "usuarios" + SUFIXO_STAGING if "usuarios" in trocar else "usuarios"
+            conn.execute(text(
+                f"ALTER TABLE avaliacoes{SUFIXO_STAGING} ADD CONSTRAINT avaliacoes_user_id_fkey "
+                f"FOREIGN KEY (user_id) REFERENCES {referenciada}(id)"
+            ))
+
+    fontes = {tabela: tabela + SUFIXO_STAGING if tabela in trocar else tabela for tabela in TABELAS_ATUAIS}
+    marca = None
+    # Um único snapshot (REPEATABLE READ) para agregados e similares, sem lock: a
+    # aplicação continua gravando avaliações na tabela atual durante o cálculo
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn, conn.begin():
+        if "avaliacoes" not in trocar:
+            # Marca do que os agregados novos vão ler; o que entrar depois é somado na troca
+            marca = conn.execute(text("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM avaliacoes")).one()
+
+        print("Reconstruindo agregados de avaliações nas tabelas novas...")
+        preparar_agregados_novos(conn, fontes)
+        auxiliares = list(AGREGADOS_TABELAS)
+        print("Calculando filmes similares nas tabelas novas...")
+        try:
+            # Avaliações gravadas depois do snapshot entram nos vizinhos na próxima carga
+            preparar_similares_novos(conn, fontes)
+            auxiliares.append("filmes_similares")
+        except ImportError as e:
+            print(f"⚠️ Filmes similares não calculados ({e}). Instale scipy.")
+
+    for tentativa in range(1, CARGA_TROCA_TENTATIVAS + 1):
+        try:
+            with engine.begin() as conn:
+                inicio_troca = time.perf_counter()
+                novas = trocar_com_lock(conn, trocar, auxiliares, fontes, marca)
+            break
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_INDISPONIVEL or tentativa == CARGA_TROCA_TENTATIVAS:
+                raise
+            print(f"⏳ Lock da troca não obtido em {CARGA_LOCK_TIMEOUT} (tentativa {tentativa}/{CARGA_TROCA_TENTATIVAS})")
+    print(f"🔁 Tabelas trocadas em {(time.perf_counter() - inicio_troca) * 1000:.0f} ms: {trocar + auxiliares}")
+    if novas:
+        print(f"➕ {novas} avaliação(ões) gravada(s) durante a carga somada(s) aos agregados novos")
+
+
+def trocar_com_lock(conn, trocar, auxiliares, fontes, marca):
+    """
+    Transação curta da troca: bloqueia as avaliações atuais, renomeia as tabelas
+    e soma aos agregados novos as avaliações posteriores à marca.
+
+    Retorna quantas avaliações foram somadas depois da marca.
+    """
+    conn.execute(text(f"SET LOCAL lock_timeout = '{CARGA_LOCK_TIMEOUT}'"))
+    desde = None
+    if marca is not None:
+        # A partir daqui nenhuma avaliação entra até o commit
+        conn.execute(text("LOCK TABLE avaliacoes IN SHARE ROW EXCLUSIVE MODE"))
+        maior_id, total = marca
+        lidas = conn.execute(text("SELECT COUNT(*) FROM avaliacoes WHERE id <= :id"), {"id": maior_id}).scalar()
+        if lidas == total:
+            desde = maior_id
+        else:
+            # Avaliação com id abaixo da marca confirmada depois do snapshot: só
+            # refazendo os agregados (agora com a tabela bloqueada) ela não se perde
+            print("⚠️ Avaliações fora de ordem durante a carga: recalculando os agregados na troca")
+            preparar_agregados_novos(conn, fontes)
+
+    # avaliacoes primeiro: a tabela antiga referencia usuarios
+    trocar_tabelas(conn, list(reversed(trocar)) + auxiliares)
+    if "usuarios" in trocar and "avaliacoes" not in trocar:
+        # O DROP ... CASCADE da tabela antiga de usuários levou a FK das avaliações atuais
+        conn.execute(text(
+            "ALTER TABLE avaliacoes ADD CONSTRAINT avaliacoes_user_id_fkey "
+            "FOREIGN KEY (user_id) REFERENCES usuarios(id)"
+        ))
+    # O trigger dos agregados vai embora com a tabela antiga de avaliações
+    for sql in AGREGADOS_TRIGGER:
+        conn.execute(text(sql))
+    if desde is None:
+        return 0
+    return conn.execute(text("""
+        SELECT somar_avaliacao_agregados(user_id, filme_titulo, nota, data_avaliacao)
+        FROM avaliacoes
+        WHERE id > :id
+        ORDER BY id
+    """), {"id": desde}).rowcount
+
+
+def garantir_fk_avaliacoes():
+    """Recria (validando todas as linhas de uma vez) a chave estrangeira das avaliações, se ausente"""
+    with engine.begin() as conn:
+        fk_existe = conn.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conrelid = 'avaliacoes'::regclass AND conname = 'avaliacoes_user_id_fkey'"
+        )).scalar()
+        if not fk_existe:
+            try:
+                with conn.begin_nested():
+                    conn.execute(text(
+                        "ALTER TABLE avaliacoes ADD CONSTRAINT avaliacoes_user_id_fkey "
+                        "FOREIGN KEY (user_id) REFERENCES usuarios(id)"
+                    ))
+                print("🔗 Chave estrangeira avaliacoes.user_id -> usuarios.id recriada")
+            except Exception as e:
+                print(f"❌ Erro ao recriar a chave estrangeira de avaliações: {e}")
+
+
+# 5) Snapshots dos Data Marts
+# Os marts só mudam quando este ETL roda, então os resultados de cada página
+# são calculados uma única vez aqui e gravados no volume compartilhado.
+# A aplicação Flask lê o snapshot mais recente sem consultar o PostgreSQL.
+
+# Consultas idênticas às das rotas /data-marts/* da aplicação (com o N padrão de cada rota)
+MARTS_SNAPSHOT = {
+    "top_filmes_por_genero": """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_top_filmes_por_genero(10)
+        ORDER BY genero, ranking
+    """,
+    "top_usuarios_avaliacoes": """
+        SELECT id, nome, email, total_avaliacoes, nota_media_dada,
+               primeira_avaliacao, ultima_avaliacao
+        FROM vw_top_usuarios_avaliacoes
+        LIMIT 5
+    """,
+    "piores_filmes_por_genero": """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_piores_filmes_por_genero(10)
+        ORDER BY genero, ranking
+    """,
+    "top_filmes_populares": """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_top_filmes_por_genero(5)
+        ORDER BY genero, ranking
+    """,
+    "numero_filmes_avaliados": """
+        SELECT nome, email, total_avaliacoes, filmes_unicos_avaliados,
+               nota_media_dada, primeira_avaliacao, ultima_avaliacao
+        FROM mart_numero_filmes_avaliados(10)
+        ORDER BY total_avaliacoes DESC, nota_media_dada DESC, id
+    """,
+    "top_filmes_odiados": """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_piores_filmes_por_genero(5)
+        ORDER BY genero, ranking
+    """,
+    "avaliacoes_por_pais": """
+        SELECT pais, total_avaliacoes, total_usuarios, nota_media_pais,
+               primeira_avaliacao, ultima_avaliacao
+        FROM vw_avaliacoes_por_pais
+        ORDER BY total_avaliacoes DESC
+    """,
+    "nota_media_por_genero": """
+        SELECT genero, total_avaliacoes, nota_media_genero, usuarios_avaliaram,
+               filmes_avaliados, nota_minima, nota_maxima
+        FROM vw_nota_media_por_genero
+        ORDER BY nota_media_genero DESC
+    """,
+}
+
+# Quantas versões anteriores manter no disco
+SNAPSHOT_VERSOES_MANTIDAS = int(os.getenv("MARTS_SNAPSHOT_KEEP", "3"))
+
+
+def diretorio_snapshots():
+    """Diretório de snapshots no volume compartilhado (com fallback local)"""
+    snapshot_dir = os.getenv("MARTS_SNAPSHOT_DIR")
+    if not snapshot_dir:
+        snapshot_dir = "/app/data/marts" if os.path.isdir("/app/data") else "data/marts"
+    os.makedirs(snapshot_dir, exist_ok=True)
+    return snapshot_dir
+
+
+def serializar_valor(valor):
+    """Converte tipos do PostgreSQL que o msgpack não conhece"""
+    import msgpack
+
+    if isinstance(valor, (datetime, date)):
+        # ExtType 1: data/hora em ISO 8601, reconstruída pela aplicação
+        return msgpack.ExtType(1, valor.isoformat().encode("utf-8"))
+    if isinstance(valor, Decimal):
+        # ExtType 2: NUMERIC como texto, preservando a escala (ex.: 8.50)
+        return msgpack.ExtType(2, str(valor).encode("utf-8"))
+    raise TypeError(f"Tipo não suportado no snapshot: {type(valor)}")
+
+
+def listar_snapshots(snapshot_dir):
+    """Snapshots existentes, do mais antigo para o mais recente (os nomes ordenam cronologicamente)"""
+    return sorted(
+        nome for nome in os.listdir(snapshot_dir)
+        if nome.startswith("marts_") and nome.endswith(".msgpack")
+    )
+
+
+# Marca dos dados do snapshot: avaliações gravadas depois dele (pela aplicação)
+# mudam o MAX(id), e a aplicação deixa de servir o snapshot até o próximo
+SNAPSHOT_MARCA_SQL = "SELECT COALESCE(MAX(id), 0) FROM avaliacoes"
+
+
+def marca_do_snapshot(caminho):
+    """MAX(id) de avaliacoes gravado no snapshot (None se o snapshot não tiver a marca)"""
+    import msgpack
+
+    try:
+        with open(caminho, "rb") as f:
+            return msgpack.unpackb(f.read(), raw=False).get("avaliacoes_max_id")
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Snapshot {caminho} ilegível: {e}")
+        return None
+
+
+def gerar_snapshot(carregadas):
+    """Grava um novo snapshot dos marts, a menos que nem as tabelas nem as avaliações tenham mudado"""
+    snapshot_dir = diretorio_snapshots()
+    existentes = listar_snapshots(snapshot_dir)
+    with engine.connect() as conn:
+        marca = conn.execute(text(SNAPSHOT_MARCA_SQL)).scalar()
+    if (
+        not carregadas
+        and existentes
+        and marca_do_snapshot(os.path.join(snapshot_dir, existentes[-1])) == marca
+    ):
+        # Nenhuma tabela mudou: o snapshot atual continua válido
+        print(f"\n⏭️ Nenhuma tabela recarregada, snapshot mantido: {existentes[-1]}")
+    else:
+        import msgpack
+
+        print("\nGerando snapshots dos Data Marts...")
+        versao = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        snapshot = {"versao": versao, "gerado_em": datetime.now().isoformat(), "marts": {}}
+
+        # Mesma transação (REPEATABLE READ) para a marca e os marts: uma avaliação
+        # gravada no meio não fica fora dos marts com a marca já incluindo ela
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+            snapshot["avaliacoes_max_id"] = conn.execute(text(SNAPSHOT_MARCA_SQL)).scalar()
+            for nome_mart, query_sql in MARTS_SNAPSHOT.items():
+                result = conn.execute(text(query_sql))
+                snapshot["marts"][nome_mart] = {
+                    "colunas": list(result.keys()),
+                    "linhas": [list(row) for row in result.fetchall()],
+                }
+                print(f"  - {nome_mart}: {len(snapshot['marts'][nome_mart]['linhas'])} linhas")
+
+        # Escrita atômica: grava em arquivo temporário e renomeia
+        snapshot_path = os.path.join(snapshot_dir, f"marts_{versao}.msgpack")
+        with open(snapshot_path + ".tmp", "wb") as f:
+            f.write(msgpack.packb(snapshot, default=serializar_valor, use_bin_type=True))
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+
+        # Remover versões antigas
+        for antigo in listar_snapshots(snapshot_dir)[:-SNAPSHOT_VERSOES_MANTIDAS]:
+            os.remove(os.path.join(snapshot_dir, antigo))
+
+        print(f"✅ Snapshot dos Data Marts salvo em: {snapshot_path}")
+
 
 # === RELATÓRIO FINAL ===
-print("\n=== RELATÓRIO FINAL ===")
-with engine.connect() as conn:
-    total_filmes = conn.execute(text("SELECT COUNT(*) FROM filmes;")).scalar()
-    total_usuarios = conn.execute(text("SELECT COUNT(*) FROM usuarios;")).scalar()
-    total_avaliacoes = conn.execute(text("SELECT COUNT(*) FROM avaliacoes;")).scalar()
-    
-    print(f"Registros no Warehouse:")
-    print(f"  - Filmes: {total_filmes}")
-    print(f"  - Usuários: {total_usuarios}")
-    print(f"  - Avaliações: {total_avaliacoes}")
+def relatorio_final():
+    print("\n=== RELATÓRIO FINAL ===")
+    with engine.connect() as conn:
+        total_filmes = conn.execute(text("SELECT COUNT(*) FROM filmes;")).scalar()
+        total_usuarios = conn.execute(text("SELECT COUNT(*) FROM usuarios;")).scalar()
+        total_avaliacoes = conn.execute(text("SELECT COUNT(*) FROM avaliacoes;")).scalar()
+
+        print(f"Registros no Warehouse:")
+        print(f"  - Filmes: {total_filmes}")
+        print(f"  - Usuários: {total_usuarios}")
+        print(f"  - Avaliações: {total_avaliacoes}")
+
+
+def main(forcar=()):
+    """Pipeline de carga completo; 'forcar' lista tabelas recarregadas mesmo sem mudanças"""
+    print("Conexão:", conn_str)
+    aguardar_banco()
+
+    arquivos_limpos = localizar_arquivos_limpos()
+    manifest_carga = carregar_manifest("carga")
+    codigo_carga = versao_codigo(ARQUIVOS_CODIGO)
+    recarregar = planejar_recarga(arquivos_limpos, manifest_carga, codigo_carga, forcar)
+    df = ler_filmes(arquivos_limpos["filmes"]) if recarregar["filmes"] else None
+
+    reconstruir = criar_schema(recarregar)
+    carregadas, posicoes = carregar_tabelas(arquivos_limpos, recarregar, df)
+    trocadas = CARGA_TROCA_ATOMICA and bool(carregadas)
+    if trocadas:
+        # Agregados e filmes similares entram junto com as tabelas novas
+        trocar_para_tabelas_novas(carregadas)
+        reconstruir = False
+    garantir_fk_avaliacoes()
+
+    # Retenção: partições antigas são desanexadas em vez de apagadas
+    if AVALIACOES_RETENCAO_MESES > 0:
+        with engine.begin() as conn:
+            if desanexar_particoes_antigas(conn, AVALIACOES_RETENCAO_MESES):
+                reconstruir = True
+
+    # 3b) Reconstruir os agregados de avaliações (o trigger mantém dali em diante)
+    if reconstruir:
+        print("\nReconstruindo agregados de avaliações...")
+        with engine.begin() as conn:
+            reconstruir_agregados(conn, sem_bloquear_leitores=CARGA_TROCA_ATOMICA)
+            grupos = {
+                tabela: conn.execute(text(f"SELECT COUNT(*) FROM {tabela}")).scalar()
+                for tabela in ("agg_avaliacoes_filme", "agg_avaliacoes_genero",
+                               "agg_avaliacoes_usuario", "agg_avaliacoes_pais")
+            }
+        print(f"✅ Agregados reconstruídos: {grupos}")
+
+    # 3c) Filmes similares (os ids dos filmes mudam a cada recarga)
+    with engine.connect() as conn:
+        similares_existem = conn.execute(text("SELECT to_regclass('filmes_similares')")).scalar() is not None
+    if (carregadas and not trocadas) or not similares_existem:
+        print("\nCalculando filmes similares...")
+        try:
+            with engine.begin() as conn:
+                gerar_filmes_similares(conn, sem_bloquear_leitores=CARGA_TROCA_ATOMICA)
+        except ImportError as e:
+            print(f"⚠️ Filmes similares não calculados ({e}). Instale scipy.")
+
+    # 4) Criar SQL Views para os Data Marts solicitados
+    print("\nCriando SQL Views para Data Marts...")
+
+    with engine.begin() as conn:
+        criar_views(conn)
+
+    print("✅ SQL Views criadas:")
+    print("  - vw_top_filmes_por_genero (Top 10 filmes mais bem avaliados por gênero)")
+    print("  - vw_top_usuarios_avaliacoes (Top 5 usuários com mais avaliações)")
+    print("  - vw_piores_filmes_por_genero (Top 10 filmes com piores avaliações por gênero)")
+    print("  - vw_avaliacoes_por_pais (Número de avaliações por país)")
+    print("  - vw_nota_media_por_genero (Nota média por gênero dos usuários)")
+    print("  - mart_top_filmes_por_genero(n) / mart_piores_filmes_por_genero(n) (N melhores/piores por gênero)")
+    print("  - mart_numero_filmes_avaliados(n) (Filmes distintos avaliados pelos N usuários mais ativos)")
+
+    gerar_snapshot(carregadas)
+
+    # Registrar no manifesto as tabelas carregadas nesta execução
+    for tabela, registros in carregadas.items():
+        arquivo = hash_arquivo(arquivos_limpos[tabela])
+        if tabela in posicoes and arquivo["tamanho"] != posicoes[tabela]:
+            # Linhas anexadas durante a carga: o hash não representa o que foi carregado
+            arquivo = None
+        manifest_carga[tabela] = {
+            "arquivo": arquivo,
+            "codigo": codigo_carga,
+            "registros": registros,
+        }
+        # Até onde o CSV foi lido: ponto de partida do tail (carga_tail.py)
+        if tabela in posicoes:
+            manifest_carga[tabela]["posicao"] = registrar_posicao(arquivos_limpos[tabela], posicoes[tabela])
+    if carregadas:
+        salvar_manifest("carga", manifest_carga)
+
+    relatorio_final()
+    print("Fim do ETL.")
+
 
-print("Fim do ETL.")
+if __name__ == "__main__":
+    main()
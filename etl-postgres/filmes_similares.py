@@ -0,0 +1,110 @@
+"""
+Filmes similares ("quem gostou deste também gostou")
+
+As notas viram uma matriz esparsa usuário × filme (ids inteiros, compactados em
+0..n-1) e cada filme recebe os K filmes com maior similaridade de cosseno
+entre as colunas. O produto Xᵀ·X é feito em blocos de filmes: o tamanho de
+cada bloco é escolhido pela quantidade de pares (filme, vizinho) que ele pode
+gerar, limitada por SIMILARES_BLOCO_MB, e o top-K de cada bloco sai de uma
+ordenação vetorizada, sem laço por filme.
+"""
+
+import os
+
+import numpy as np
+from scipy import sparse
+
+# Vizinhos guardados por filme
+SIMILARES_K = int(os.getenv("SIMILARES_K", "10"))
+
+# Memória máxima (MB) do produto esparso de um bloco de filmes
+SIMILARES_BLOCO_MB = int(os.getenv("SIMILARES_BLOCO_MB", "256"))
+
+# Bytes por par candidato no bloco: o produto esparso e os arrays temporários
+# da ordenação (linha, coluna, valor, chave e permutação)
+_BYTES_POR_PAR = 64
+
+
+def matriz_notas(user_ids, filme_ids, notas):
+    """Matriz CSR usuário × filme e o id original de cada coluna"""
+    usuarios, linhas = np.unique(user_ids, return_inverse=True)
+    filmes, colunas = np.unique(filme_ids, return_inverse=True)
+    matriz = sparse.csr_matrix(
+        (np.asarray(notas, dtype=np.float32), (linhas, colunas)),
+        shape=(len(usuarios), len(filmes)),
+    )
+    return matriz, filmes
+
+
+def blocos_de_filmes(matriz, limite_pares):
+    """
+    Faixas [início, fim) de colunas cujo produto com a matriz gera no máximo
+    limite_pares candidatos (um filme sozinho pode passar do limite).
+    """
+    binaria = matriz.copy()
+    binaria.data[:] = 1
+    # Candidatos do filme f: soma, sobre os usuários que o avaliaram, das avaliações de cada usuário
+    grau_usuario = np.asarray(binaria.sum(axis=1)).ravel()
+    custo = np.asarray(binaria.T @ grau_usuario).ravel()
+
+    blocos = []
+    inicio = 0
+    acumulado = 0
+    for fim, custo_filme in enumerate(custo):
+        if acumulado and acumulado + custo_filme > limite_pares:
+            blocos.append((inicio, fim))
+            inicio, acumulado = fim, 0
+        acumulado += custo_filme
+    if inicio < len(custo):
+        blocos.append((inicio, len(custo)))
+    return blocos
+
+
+def top_k_bloco(produto, inicio, k):
+    """(linha, coluna, similaridade, posição) dos k maiores valores positivos de cada linha do bloco"""
+    produto.sort_indices()
+    linhas = np.repeat(np.arange(produto.shape[0]), np.diff(produto.indptr))
+    colunas = produto.indices
+    valores = produto.data
+    # Fora o próprio filme (diagonal deslocada pelo início do bloco)
+    manter = (colunas != linhas + inicio) & (valores > 0)
+    linhas, colunas, valores = linhas[manter], colunas[manter], valores[manter]
+
+    # Por linha, da maior para a menor similaridade (empate pelo menor id). Como
+    # 0 < valor <= 1, uma única chave linha*2 - valor ordena pelos dois critérios,
+    # e a ordenação estável aproveita as linhas já em ordem (bem mais rápida que
+    # um lexsort por várias chaves)
+    ordem = np.argsort(linhas * 2.0 - valores, kind="stable")
+    linhas, colunas, valores = linhas[ordem], colunas[ordem], valores[ordem]
+    primeiro = np.r_[0, np.flatnonzero(np.diff(linhas)) + 1]
+    posicao = np.arange(len(linhas)) - np.repeat(primeiro, np.diff(np.r_[primeiro, len(linhas)]))
+
+    manter = posicao < k
+    return linhas[manter] + inicio, colunas[manter], valores[manter], posicao[manter] + 1
+
+
+def calcular_similares(user_ids, filme_ids, notas, k=SIMILARES_K, bloco_mb=SIMILARES_BLOCO_MB):
+    """
+    Top-k filmes por similaridade de cosseno das notas.
+
+    Retorna arrays (filme_id, similar_id, similaridade, posicao) com os ids
+    originais dos filmes e posição a partir de 1.
+    """
+    matriz, ids_filmes = matriz_notas(user_ids, filme_ids, notas)
+    if matriz.shape[1] == 0:
+        vazio = np.array([], dtype=np.int64)
+        return vazio, vazio, np.array([], dtype=np.float32), vazio
+
+    # Colunas com norma 1: o produto escalar já é o cosseno
+    normas = np.sqrt(np.asarray(matriz.multiply(matriz).sum(axis=0)).ravel())
+    normas[normas == 0] = 1
+    x = (matriz @ sparse.diags(1 / normas).astype(np.float32)).tocsr()
+    xt = x.T.tocsr()
+
+    partes = []
+    for inicio, fim in blocos_de_filmes(matriz, bloco_mb * 1024 * 1024 // _BYTES_POR_PAR):
+        produto = (xt[inicio:fim] @ x).tocsr()
+        partes.append(top_k_bloco(produto, inicio, k))
+
+    linhas, colunas, valores, posicoes = (np.concatenate(coluna) for coluna in zip(*partes))
+    return ids_filmes[linhas], ids_filmes[colunas], valores, posicoes
@@ -1,8 +1,15 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
 import psycopg2
 import psycopg2.extras
+import msgpack
+import mmap
 import os
-from datetime import datetime
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from decimal import Decimal
+from query_profiler import ConexaoPerfilada, consultas_lentas, top_consultas, limpar_estatisticas, SLOW_QUERY_MS
 
 app = Flask(__name__)
 app.secret_key = 'movie_rating_secret_key_2024'
@@ -22,15 +29,159 @@ def get_db_connection():
             database=PG_DB,
             user=PG_USER,
             password=PG_PASS,
-            port=PG_PORT
+            port=PG_PORT,
+            # Registra duração, linhas e rota de cada consulta (ver /debug/queries)
+            connection_factory=ConexaoPerfilada
         )
         return conn
     except Exception as e:
         print(f"Erro ao conectar com PostgreSQL: {e}")
         return None
 
+# Snapshots dos Data Marts gerados pelo ETL no volume compartilhado
+MARTS_SNAPSHOT_DIR = os.getenv("MARTS_SNAPSHOT_DIR", "/app/shared/marts")
+
+# Cache do snapshot decodificado: (nome do arquivo, {mart: [linhas]}, MAX(id) de avaliacoes)
+_snapshot_cache = (None, {}, None)
+
+# O ETL grava no snapshot o MAX(id) de avaliacoes usado para gerá-lo. Se o banco
+# tiver avaliações mais novas (gravadas por qualquer processo da aplicação,
+# mesmo antes de um restart), os marts são lidos das views, que usam os
+# agregados mantidos pelo trigger e já incluem as novas avaliações.
+# O MAX(id) atual é consultado no máximo a cada MARTS_SNAPSHOT_CHECK_S segundos.
+MARTS_SNAPSHOT_CHECK_S = float(os.getenv("MARTS_SNAPSHOT_CHECK_S", "2"))
+
+# Última verificação: (instante, MAX(id) de avaliacoes)
+_marca_banco = (0.0, None)
+
+def _decodificar_ext(codigo, dados):
+    """Reconstrói tipos serializados pelo ETL (1 = data ISO 8601, 2 = NUMERIC)"""
+    if codigo == 1:
+        return datetime.fromisoformat(dados.decode('utf-8'))
+    if codigo == 2:
+        return Decimal(dados.decode('utf-8'))
+    return msgpack.ExtType(codigo, dados)
+
+def carregar_snapshot_marts():
+    """Retorna os marts do snapshot mais recente, ou None se não houver snapshot"""
+    global _snapshot_cache
+    try:
+        versoes = sorted(
+            nome for nome in os.listdir(MARTS_SNAPSHOT_DIR)
+            if nome.startswith('marts_') and nome.endswith('.msgpack')
+        )
+    except FileNotFoundError:
+        return None
+    if not versoes:
+        return None
+
+    mais_recente = versoes[-1]
+    if _snapshot_cache[0] == mais_recente:
+        return _snapshot_cache[1]
+
+    try:
+        with open(os.path.join(MARTS_SNAPSHOT_DIR, mais_recente), 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                snapshot = msgpack.unpackb(mm, ext_hook=_decodificar_ext, raw=False)
+    except Exception as e:
+        print(f"Erro ao ler snapshot {mais_recente}: {e}")
+        return None
+
+    marts = {
+        nome: [dict(zip(mart['colunas'], linha)) for linha in mart['linhas']]
+        for nome, mart in snapshot['marts'].items()
+    }
+    _snapshot_cache = (mais_recente, marts, snapshot.get('avaliacoes_max_id'))
+    print(f"Snapshot dos Data Marts carregado: {mais_recente}")
+    return marts
+
+def marca_do_banco():
+    """MAX(id) atual de avaliacoes (em cache por MARTS_SNAPSHOT_CHECK_S), ou None se o banco falhar"""
+    global _marca_banco
+    instante, marca = _marca_banco
+    if marca is not None and time.monotonic() - instante < MARTS_SNAPSHOT_CHECK_S:
+        return marca
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM avaliacoes")
+        marca = cursor.fetchone()[0]
+        cursor.close()
+    except Exception as e:
+        print(f"Erro ao verificar o snapshot dos marts: {e}")
+        return None
+    finally:
+        conn.close()
+    _marca_banco = (time.monotonic(), marca)
+    return marca
+
+def mart_do_snapshot(nome_mart):
+    """Linhas de um mart no snapshot, ou None para consultar o PostgreSQL"""
+    marts = carregar_snapshot_marts()
+    if marts is None:
+        return None
+    marca_snapshot = _snapshot_cache[2]
+    marca = marca_do_banco()
+    # Snapshot de uma versão anterior (sem marca) ou banco inacessível: serve o snapshot
+    if marca_snapshot is not None and marca is not None and marca != marca_snapshot:
+        return None
+    return marts.get(nome_mart)
+
+def invalidar_snapshot_marts():
+    """Força a verificação do snapshot na próxima leitura após uma escrita que altera os marts"""
+    global _marca_banco
+    _marca_banco = (0.0, None)
+
 # Função removida - tabelas agora são criadas no ETL
 
+# === Filmes similares ("quem gostou também gostou") ===
+# Calculados pelo ETL na tabela filmes_similares (chave primária filme_id, posicao)
+SIMILARES_EXIBIDOS = 5
+
+SIMILARES_POR_FILME_SQL = """
+    SELECT f.titulo, f.genero, f.ano_lancamento, s.similaridade
+    FROM filmes_similares s
+    JOIN filmes f ON f.id = s.similar_id
+    WHERE s.filme_id = (SELECT MIN(id) FROM filmes WHERE titulo = %s)
+    ORDER BY s.posicao
+    LIMIT %s
+"""
+
+SIMILARES_CATALOGO_SQL = """
+    SELECT f.titulo, vizinho.titulo AS similar_titulo
+    FROM filmes_similares s
+    JOIN filmes f ON f.id = s.filme_id
+    JOIN filmes vizinho ON vizinho.id = s.similar_id
+    WHERE s.posicao <= %s
+    ORDER BY s.filme_id, s.posicao
+"""
+
+def consultar_similares(conn, query_sql, parametros):
+    """Linhas de filmes_similares; lista vazia se a tabela ainda não existir (ETL não rodou)"""
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(query_sql, parametros)
+        linhas = cursor.fetchall()
+        cursor.close()
+        return linhas
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"⚠️ Filmes similares indisponíveis: {e}")
+        return []
+
+def similares_do_filme(conn, titulo, limite=SIMILARES_EXIBIDOS):
+    """Os filmes mais parecidos com o título, em uma única consulta pela chave primária"""
+    return consultar_similares(conn, SIMILARES_POR_FILME_SQL, (titulo, limite))
+
+def similares_do_catalogo(conn, limite=3):
+    """{titulo: [títulos similares]} para todo o catálogo"""
+    similares = {}
+    for linha in consultar_similares(conn, SIMILARES_CATALOGO_SQL, (limite,)):
+        similares.setdefault(linha['titulo'], []).append(linha['similar_titulo'])
+    return similares
+
 @app.route('/')
 def index():
     """Página inicial"""
@@ -63,6 +214,7 @@ def filmes():
     """Lista todos os filmes do catálogo"""
     conn = get_db_connection()
     filmes_list = []
+    similares = {}
     
     if conn:
         try:
@@ -70,6 +222,7 @@ def filmes():
             cursor.execute("SELECT titulo, ano_lancamento, genero, nota_imdb FROM filmes ORDER BY titulo")
             filmes_list = cursor.fetchall()
             cursor.close()
+            similares = similares_do_catalogo(conn)
             conn.close()
         except Exception as e:
             flash(f'Erro ao carregar filmes: {e}', 'error')
@@ -78,7 +231,7 @@ def filmes():
     else:
         flash('Erro de conexão com o banco de dados', 'error')
     
-    return render_template('filmes.html', filmes=filmes_list)
+    return render_template('filmes.html', filmes=filmes_list, similares=similares)
 
 @app.route('/avaliacoes')
 def avaliacoes():
@@ -164,7 +317,8 @@ def avaliar_filme(filme=None):
         user_id = request.form['user_id']
         filme_titulo = request.form['filme_titulo'].strip()
         nota = request.form['nota']
-        comentario = request.form['comentario'].strip()
+        # Comentário vazio é gravado como NULL (o texto padrão fica só na exibição)
+        comentario = request.form['comentario'].strip() or None
         
         if not user_id or not filme_titulo or not nota:
             flash('Usuário, filme e nota são obrigatórios!', 'error')
@@ -184,12 +338,13 @@ def avaliar_filme(filme=None):
             try:
                 cursor = conn.cursor()
                 cursor.execute(
-                    "INSERT INTO avaliacoes (user_id, filme_titulo, nota, comentario) VALUES (%s, %s, %s, %s)",
-                    (user_id, filme_titulo, nota, comentario)
+                    "INSERT INTO avaliacoes (user_id, filme_titulo, nota, comentario, busca_texto) VALUES (%s, %s, %s, %s, %s)",
+                    (user_id, filme_titulo, nota, comentario, normalizar_busca(f"{filme_titulo} {comentario or ''}"))
                 )
                 conn.commit()
                 cursor.close()
                 conn.close()
+                invalidar_snapshot_marts()
                 
                 flash('Avaliação cadastrada com sucesso!', 'success')
                 return redirect(url_for('avaliacoes'))
@@ -204,6 +359,7 @@ def avaliar_filme(filme=None):
     # Buscar usuários e filmes para os selects
     usuarios_list = []
     filmes_list = []
+    similares = []
     
     conn = get_db_connection()
     if conn:
@@ -219,13 +375,15 @@ def avaliar_filme(filme=None):
             filmes_list = cursor.fetchall()
             
             cursor.close()
+            if filme:
+                similares = similares_do_filme(conn, filme)
             conn.close()
         except Exception as e:
             flash(f'Erro ao carregar dados: {e}', 'error')
             if conn:
                 conn.close()
     
-    return render_template('avaliar_filme.html', usuarios=usuarios_list, filmes=filmes_list, filme_selecionado=filme)
+    return render_template('avaliar_filme.html', usuarios=usuarios_list, filmes=filmes_list, filme_selecionado=filme, similares=similares)
 
 @app.route('/api/filmes')
 def api_filmes():
@@ -255,27 +413,219 @@ def api_filmes():
     else:
         return jsonify({'error': 'Erro de conexão com banco'}), 500
 
+# === Busca em filmes e avaliações ===
+# busca_texto (sem acentos, minúsculo) e busca_tsv (tsvector com índice GIN) são
+# preenchidos pelo ETL; com a extensão pg_trgm, a busca também aceita termos
+# aproximados (word_similarity sobre busca_texto, com índice de trigramas)
+BUSCA_ESCOPOS = ('filmes', 'avaliacoes')
+BUSCA_POR_PAGINA = 20
+BUSCA_POR_PAGINA_MAXIMO = 100
+
+_TERMO_BUSCA = re.compile(r"[a-z0-9]+")
+
+# pg_trgm instalado no banco (só o resultado positivo fica em cache)
+_pg_trgm_disponivel = False
+
+BUSCA_SQL = {
+    'filmes': """
+        SELECT titulo, ano_lancamento, genero, nota_imdb,
+               {relevancia} AS relevancia, COUNT(*) OVER () AS total
+        FROM filmes, to_tsquery('simple', %(tsquery)s) AS consulta
+        WHERE {filtro}
+        ORDER BY relevancia DESC, titulo
+        LIMIT %(limite)s OFFSET %(deslocamento)s
+    """,
+    'avaliacoes': """
+        SELECT a.id, u.nome AS usuario_nome, a.filme_titulo, a.nota,
+               a.comentario, a.data_avaliacao,
+               {relevancia} AS relevancia, COUNT(*) OVER () AS total
+        FROM avaliacoes a
+        LEFT JOIN usuarios u ON a.user_id = u.id,
+             to_tsquery('simple', %(tsquery)s) AS consulta
+        WHERE {filtro}
+        ORDER BY relevancia DESC, a.data_avaliacao DESC
+        LIMIT %(limite)s OFFSET %(deslocamento)s
+    """,
+}
+
+def normalizar_busca(texto):
+    """Remove acentos e passa para minúsculas, como o normalize_text do ETL"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ASCII', 'ignore').decode('ASCII')
+    return texto.strip().lower()
+
+def pg_trgm_disponivel(cursor):
+    """True se a extensão pg_trgm estiver instalada no banco"""
+    global _pg_trgm_disponivel
+    if not _pg_trgm_disponivel:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        _pg_trgm_disponivel = cursor.fetchone()[0]
+    return _pg_trgm_disponivel
+
+def buscar_no_banco(escopo, termo, pagina, por_pagina):
+    """
+    Busca o termo em filmes ou avaliações, ordenado por relevância.
+
+    Cada palavra do termo vale também como prefixo ("matr" encontra "matrix").
+    Retorna (linhas da página, total de resultados).
+    """
+    termo = normalizar_busca(termo)
+    palavras = _TERMO_BUSCA.findall(termo)
+    if not palavras:
+        return [], 0
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Erro de conexão com banco')
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        alias = 'a.' if escopo == 'avaliacoes' else ''
+        relevancia = f"ts_rank_cd({alias}busca_tsv, consulta)"
+        filtro = f"{alias}busca_tsv @@ consulta"
+        if pg_trgm_disponivel(cursor):
+            relevancia += f" + word_similarity(%(termo)s, {alias}busca_texto)"
+            filtro += f" OR %(termo)s <%% {alias}busca_texto"
+        cursor.execute(BUSCA_SQL[escopo].format(relevancia=relevancia, filtro=filtro), {
+            'tsquery': ' & '.join(f"{palavra}:*" for palavra in palavras),
+            'termo': termo,
+            'limite': por_pagina,
+            'deslocamento': (pagina - 1) * por_pagina,
+        })
+        linhas = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return linhas, (linhas[0]['total'] if linhas else 0)
+
+def parametros_da_busca():
+    """Lê ?q=, ?em=, ?pagina= e ?por_pagina= da requisição"""
+    termo = request.args.get('q', '').strip()
+    escopo = request.args.get('em', 'filmes')
+    if escopo not in BUSCA_ESCOPOS:
+        escopo = 'filmes'
+    try:
+        pagina = max(1, int(request.args.get('pagina', 1)))
+        por_pagina = int(request.args.get('por_pagina', BUSCA_POR_PAGINA))
+    except ValueError:
+        pagina, por_pagina = 1, BUSCA_POR_PAGINA
+    return termo, escopo, pagina, max(1, min(por_pagina, BUSCA_POR_PAGINA_MAXIMO))
+
+@app.route('/buscar')
+def buscar():
+    """Busca em filmes e avaliações, com resultados paginados"""
+    termo, escopo, pagina, por_pagina = parametros_da_busca()
+    resultados, total = [], 0
+    if termo:
+        try:
+            resultados, total = buscar_no_banco(escopo, termo, pagina, por_pagina)
+        except Exception as e:
+            flash(f'Erro na busca: {e}', 'error')
+
+    return render_template(
+        'buscar.html',
+        termo=termo,
+        escopo=escopo,
+        resultados=resultados,
+        total=total,
+        pagina=pagina,
+        por_pagina=por_pagina,
+        paginas=max(1, -(-total // por_pagina)),
+    )
+
+@app.route('/api/buscar')
+def api_buscar():
+    """API de busca: ?q=termo&em=filmes|avaliacoes&pagina=1&por_pagina=20"""
+    termo, escopo, pagina, por_pagina = parametros_da_busca()
+    if not termo:
+        return jsonify({'error': 'Informe o termo de busca em ?q='}), 400
+    try:
+        linhas, total = buscar_no_banco(escopo, termo, pagina, por_pagina)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    resultados = []
+    for linha in linhas:
+        resultado = {chave: linha[chave] for chave in linha.keys() if chave != 'total'}
+        for chave, valor in resultado.items():
+            if isinstance(valor, Decimal):
+                resultado[chave] = float(valor)
+            elif isinstance(valor, datetime):
+                resultado[chave] = valor.isoformat()
+        resultados.append(resultado)
+
+    return jsonify({
+        'q': termo,
+        'em': escopo,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total': total,
+        'resultados': resultados,
+    })
+
 # Rotas para Data Marts
 @app.route('/data-marts')
 def data_marts():
     """Página principal dos Data Marts"""
     return render_template('data_marts.html')
 
-@app.route('/data-marts/top-filmes-por-genero')
-def top_filmes_por_genero():
-    """Data Mart: Top 10 filmes mais bem avaliados por gênero"""
+def janela_da_requisicao(avisar=True):
+    """
+    Lê a janela de tempo (?inicio=AAAA-MM-DD&fim=AAAA-MM-DD) da requisição.
+
+    Retorna (inicio, fim_exclusivo) como strings ISO, ou None sem filtro ou com
+    datas inválidas (avisadas com flash, se avisar=True).
+    """
+    inicio = request.args.get('inicio', '').strip()
+    fim = request.args.get('fim', '').strip()
+    if not inicio and not fim:
+        return None
+    try:
+        inicio = datetime.strptime(inicio, '%Y-%m-%d').date().isoformat() if inicio else ''
+        # A data final do formulário é inclusiva
+        fim = (datetime.strptime(fim, '%Y-%m-%d') + timedelta(days=1)).date().isoformat() if fim else ''
+    except ValueError:
+        if avisar:
+            flash('Período inválido: use datas no formato AAAA-MM-DD', 'error')
+        return None
+    return inicio, fim
+
+# Limite máximo de filmes por gênero aceito em ?n=
+MARTS_LIMITE_MAXIMO = 100
+
+def limite_da_requisicao(padrao):
+    """Lê o N do top N por gênero (?n=), entre 1 e MARTS_LIMITE_MAXIMO"""
+    try:
+        n = int(request.args.get('n', padrao))
+    except ValueError:
+        flash('Quantidade inválida: use um número inteiro', 'error')
+        return padrao
+    return max(1, min(n, MARTS_LIMITE_MAXIMO))
+
+def consultar_mart(nome_mart, query_sql, parametros=None, usar_snapshot=True):
+    """
+    Retorna as linhas de um mart do snapshot mais recente ou, na falta dele, do PostgreSQL.
+
+    O snapshot só tem os marts com os parâmetros padrão das rotas; com outros
+    parâmetros (usar_snapshot=False) a consulta vai ao banco.
+    """
+    janela = janela_da_requisicao()
+    if janela is None and usar_snapshot:
+        linhas = mart_do_snapshot(nome_mart)
+        if linhas is not None:
+            return linhas
+
     conn = get_db_connection()
     data = []
     
     if conn:
         try:
             cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cursor.execute("""
-                SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
-                FROM vw_top_filmes_por_genero
-                WHERE ranking <= 10
-                ORDER BY genero, ranking
-            """)
+            if janela:
+                # Vale só para esta transação; as views filtram por marts_inicio()/marts_fim()
+                cursor.execute(
+                    "SELECT set_config('marts.inicio', %s, true), set_config('marts.fim', %s, true)",
+                    janela
+                )
+            cursor.execute(query_sql, parametros)
             data = cursor.fetchall()
             cursor.close()
             conn.close()
@@ -286,217 +636,219 @@ def top_filmes_por_genero():
     else:
         flash('Erro de conexão com o banco de dados', 'error')
     
-    return render_template('top_filmes_por_genero.html', filmes=data)
+    return data
+
+# Consultas dos Data Marts (as mesmas do snapshot gerado pelo ETL).
+# %s é o N do top N por gênero, com o padrão em MARTS_LIMITE_PADRAO.
+MARTS_CONSULTAS = {
+    'top_filmes_por_genero': """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_top_filmes_por_genero(%s)
+        ORDER BY genero, ranking
+    """,
+    'top_usuarios_avaliacoes': """
+        SELECT id, nome, email, total_avaliacoes, nota_media_dada, 
+               primeira_avaliacao, ultima_avaliacao
+        FROM vw_top_usuarios_avaliacoes
+        LIMIT 5
+    """,
+    'piores_filmes_por_genero': """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_piores_filmes_por_genero(%s)
+        ORDER BY genero, ranking
+    """,
+    'top_filmes_populares': """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_top_filmes_por_genero(%s)
+        ORDER BY genero, ranking
+    """,
+    'numero_filmes_avaliados': """
+        SELECT nome, email, total_avaliacoes, filmes_unicos_avaliados,
+               nota_media_dada, primeira_avaliacao, ultima_avaliacao
+        FROM mart_numero_filmes_avaliados(10)
+        ORDER BY total_avaliacoes DESC, nota_media_dada DESC, id
+    """,
+    'top_filmes_odiados': """
+        SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
+        FROM mart_piores_filmes_por_genero(%s)
+        ORDER BY genero, ranking
+    """,
+    'avaliacoes_por_pais': """
+        SELECT pais, total_avaliacoes, total_usuarios, nota_media_pais,
+               primeira_avaliacao, ultima_avaliacao
+        FROM vw_avaliacoes_por_pais
+        ORDER BY total_avaliacoes DESC
+    """,
+    'nota_media_por_genero': """
+        SELECT genero, total_avaliacoes, nota_media_genero, usuarios_avaliaram,
+               filmes_avaliados, nota_minima, nota_maxima
+        FROM vw_nota_media_por_genero
+        ORDER BY nota_media_genero DESC
+    """,
+}
+
+MARTS_LIMITE_PADRAO = {
+    'top_filmes_por_genero': 10,
+    'piores_filmes_por_genero': 10,
+    'top_filmes_populares': 5,
+    'top_filmes_odiados': 5,
+}
+
+def consultar_mart_top_n(nome_mart):
+    """Consulta um mart de top N por gênero com o N da requisição; retorna (linhas, n, sql)"""
+    padrao = MARTS_LIMITE_PADRAO[nome_mart]
+    n = limite_da_requisicao(padrao)
+    query_sql = MARTS_CONSULTAS[nome_mart]
+    data = consultar_mart(nome_mart, query_sql, (n,), usar_snapshot=n == padrao)
+    return data, n, query_sql % n
+
+@app.route('/data-marts/top-filmes-por-genero')
+def top_filmes_por_genero():
+    """Data Mart: Top N (padrão 10) filmes mais bem avaliados por gênero"""
+    data, n, _ = consultar_mart_top_n('top_filmes_por_genero')
+    return render_template('top_filmes_por_genero.html', filmes=data, n=n)
 
 @app.route('/data-marts/top-usuarios-avaliacoes')
 def top_usuarios_avaliacoes():
     """Data Mart: Top 5 usuários com mais avaliações"""
-    conn = get_db_connection()
-    data = []
-    
-    if conn:
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cursor.execute("""
-                SELECT id, nome, email, total_avaliacoes, nota_media_dada, 
-                       primeira_avaliacao, ultima_avaliacao
-                FROM vw_top_usuarios_avaliacoes
-                LIMIT 5
-            """)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
+    data = consultar_mart('top_usuarios_avaliacoes', MARTS_CONSULTAS['top_usuarios_avaliacoes'])
     return render_template('top_usuarios_avaliacoes.html', usuarios=data)
 
 @app.route('/data-marts/piores-filmes-por-genero')
 def piores_filmes_por_genero():
-    """Data Mart: Top 10 filmes com piores avaliações por gênero"""
-    conn = get_db_connection()
-    data = []
-    
-    if conn:
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cursor.execute("""
-                SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
-                FROM vw_piores_filmes_por_genero
-                WHERE ranking <= 10
-                ORDER BY genero, ranking
-            """)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
-    return render_template('piores_filmes_por_genero.html', filmes=data)
+    """Data Mart: Top N (padrão 10) filmes com piores avaliações por gênero"""
+    data, n, _ = consultar_mart_top_n('piores_filmes_por_genero')
+    return render_template('piores_filmes_por_genero.html', filmes=data, n=n)
 
 # Novas rotas para consultas analíticas específicas
 
 @app.route('/data-marts/top-filmes-populares')
 def top_filmes_populares():
-    """Consulta Analítica: Top 5 filmes mais populares por gênero"""
-    conn = get_db_connection()
-    data = []
-    query_sql = ""
-    
-    if conn:
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            query_sql = """
-                SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
-                FROM vw_top_filmes_por_genero
-                WHERE ranking <= 5
-                ORDER BY genero, ranking
-            """
-            cursor.execute(query_sql)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
-    return render_template('top_filmes_populares.html', filmes=data, query_sql=query_sql)
+    """Consulta Analítica: Top N (padrão 5) filmes mais populares por gênero"""
+    data, n, query_sql = consultar_mart_top_n('top_filmes_populares')
+    return render_template('top_filmes_populares.html', filmes=data, query_sql=query_sql, n=n)
 
 @app.route('/data-marts/numero-filmes-avaliados')
 def numero_filmes_avaliados():
     """Consulta Analítica: Número de filmes avaliados por usuário top"""
-    conn = get_db_connection()
-    data = []
-    query_sql = ""
-    
-    if conn:
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            query_sql = """
-                SELECT u.nome, u.email, u.total_avaliacoes,
-                       COUNT(DISTINCT a.filme_titulo) as filmes_unicos_avaliados,
-                       u.nota_media_dada,
-                       u.primeira_avaliacao, u.ultima_avaliacao
-                FROM vw_top_usuarios_avaliacoes u
-                JOIN avaliacoes a ON u.id = a.user_id
-                GROUP BY u.id, u.nome, u.email, u.total_avaliacoes, u.nota_media_dada, 
-                         u.primeira_avaliacao, u.ultima_avaliacao
-                ORDER BY u.total_avaliacoes DESC
-                LIMIT 10
-            """
-            cursor.execute(query_sql)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
+    query_sql = MARTS_CONSULTAS['numero_filmes_avaliados']
+    data = consultar_mart('numero_filmes_avaliados', query_sql)
     return render_template('numero_filmes_avaliados.html', usuarios=data, query_sql=query_sql)
 
 @app.route('/data-marts/top-filmes-odiados')
 def top_filmes_odiados():
-    """Consulta Analítica: Top 5 filmes mais odiados por gênero"""
-    conn = get_db_connection()
-    data = []
-    query_sql = ""
-    
-    if conn:
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            query_sql = """
-                SELECT genero, titulo, ano_lancamento, nota_media, total_avaliacoes, ranking
-                FROM vw_piores_filmes_por_genero
-                WHERE ranking <= 5
-                ORDER BY genero, ranking
-            """
-            cursor.execute(query_sql)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
-    return render_template('top_filmes_odiados.html', filmes=data, query_sql=query_sql)
+    """Consulta Analítica: Top N (padrão 5) filmes mais odiados por gênero"""
+    data, n, query_sql = consultar_mart_top_n('top_filmes_odiados')
+    return render_template('top_filmes_odiados.html', filmes=data, query_sql=query_sql, n=n)
 
 @app.route('/data-marts/avaliacoes-por-pais')
 def avaliacoes_por_pais():
     """Data Mart: Número de avaliações por país"""
-    conn = get_db_connection()
-    data = []
-    query_sql = ""
-    
-    if conn:
-        try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            query_sql = """
-                SELECT pais, total_avaliacoes, total_usuarios, nota_media_pais,
-                       primeira_avaliacao, ultima_avaliacao
-                FROM vw_avaliacoes_por_pais
-                ORDER BY total_avaliacoes DESC
-            """
-            cursor.execute(query_sql)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
+    query_sql = MARTS_CONSULTAS['avaliacoes_por_pais']
+    data = consultar_mart('avaliacoes_por_pais', query_sql)
     return render_template('avaliacoes_por_pais.html', paises=data, query_sql=query_sql)
 
 @app.route('/data-marts/nota-media-por-genero')
 def nota_media_por_genero():
     """Data Mart: Nota média por gênero dos usuários"""
-    conn = get_db_connection()
-    data = []
-    query_sql = ""
-    
-    if conn:
+    query_sql = MARTS_CONSULTAS['nota_media_por_genero']
+    data = consultar_mart('nota_media_por_genero', query_sql)
+    return render_template('nota_media_por_genero.html', generos=data, query_sql=query_sql)
+
+@app.route('/api/dashboard')
+def api_dashboard():
+    """
+    API: todos os Data Marts em uma única resposta JSON.
+
+    Sem janela de tempo os marts vêm do snapshot; caso contrário (ou sem
+    snapshot válido) as consultas rodam ao mesmo tempo no pool assíncrono, e a
+    latência é a da consulta mais lenta, não a soma de todas.
+    """
+    inicio = time.perf_counter()
+    janela = janela_da_requisicao(avisar=False)
+    if janela is None and (request.args.get('inicio') or request.args.get('fim')):
+        return jsonify({'error': 'Período inválido: use datas no formato AAAA-MM-DD'}), 400
+
+    marts = {}
+    pendentes = {}
+    for nome_mart, query_sql in MARTS_CONSULTAS.items():
+        linhas = mart_do_snapshot(nome_mart) if janela is None else None
+        if linhas is not None:
+            marts[nome_mart] = linhas
+        else:
+            padrao = MARTS_LIMITE_PADRAO.get(nome_mart)
+            pendentes[nome_mart] = (query_sql, (padrao,) if padrao else ())
+
+    erros = {}
+    if pendentes:
+        # asyncpg só é importado quando o dashboard precisa consultar o banco
+        from marts_async import consultar_marts_concorrente
         try:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            query_sql = """
-                SELECT genero, total_avaliacoes, nota_media_genero, usuarios_avaliaram,
-                       filmes_avaliados, nota_minima, nota_maxima
-                FROM vw_nota_media_por_genero
-                ORDER BY nota_media_genero DESC
-            """
-            cursor.execute(query_sql)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            resultados = consultar_marts_concorrente(pendentes, janela)
         except Exception as e:
-            flash(f'Erro ao carregar dados: {e}', 'error')
-            if conn:
-                conn.close()
-    else:
-        flash('Erro de conexão com o banco de dados', 'error')
-    
-    return render_template('nota_media_por_genero.html', generos=data, query_sql=query_sql)
+            return jsonify({'error': f'Erro ao consultar os Data Marts: {e}'}), 500
+        for nome_mart, resultado in resultados.items():
+            if isinstance(resultado, Exception):
+                erros[nome_mart] = str(resultado)
+            else:
+                marts[nome_mart] = resultado
 
-if __name__ == '__main__':
+    return jsonify({
+        'marts': {nome: marts[nome] for nome in MARTS_CONSULTAS if nome in marts},
+        'consultados_no_banco': sorted(pendentes),
+        'erros': erros,
+        'janela': {'inicio': janela[0], 'fim_exclusivo': janela[1]} if janela else None,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }), 500 if erros and not marts else 200
+
+# Perfil das consultas SQL
+ORDENS_DEBUG = {
+    'total': 'total_ms',
+    'media': 'media_ms',
+    'max': 'max_ms',
+    'chamadas': 'chamadas',
+    'linhas': 'linhas',
+}
+
+# A página expõe o SQL e os planos das consultas: só existe com DEBUG_QUERIES=1
+DEBUG_QUERIES = os.getenv("DEBUG_QUERIES", "0").lower() in ("1", "true", "yes")
+
+@app.route('/debug/queries')
+def debug_queries():
+    """Estatísticas agregadas das consultas SQL executadas por este processo"""
+    if not DEBUG_QUERIES:
+        abort(404)
+    ordem = request.args.get('ordem', 'total')
+    if ordem not in ORDENS_DEBUG:
+        ordem = 'total'
+    try:
+        n = max(1, min(int(request.args.get('n', 20)), 200))
+    except ValueError:
+        n = 20
+    return render_template(
+        'debug_queries.html',
+        consultas=top_consultas(n, ORDENS_DEBUG[ordem]),
+        lentas=consultas_lentas(),
+        ordem=ordem,
+        ordens=ORDENS_DEBUG,
+        n=n,
+        limite_ms=SLOW_QUERY_MS,
+    )
+
+@app.route('/debug/queries/limpar', methods=['POST'])
+def limpar_debug_queries():
+    """Zera as estatísticas das consultas deste processo"""
+    if not DEBUG_QUERIES:
+        abort(404)
+    limpar_estatisticas()
+    return redirect(url_for('debug_queries'))
+
+def main():
     print("Inicializando aplicação...")
     print("ℹ️  Tabelas são criadas automaticamente pelo processo ETL")
     print("🚀 Iniciando servidor Flask...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Consultas assíncronas dos Data Marts
+
+O Flask atende cada requisição de forma síncrona, então as consultas
+assíncronas rodam em um event loop próprio, iniciado em uma thread de fundo na
+primeira chamada e mantido durante toda a vida do processo, junto com um pool
+de conexões asyncpg. consultar_marts_concorrente envia todas as consultas ao
+loop de uma vez (asyncio.gather) e espera o conjunto: o tempo total é o da
+consulta mais lenta, não a soma de todas.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+
+import asyncpg
+
+from query_profiler import SLOW_QUERY_MS, registrar
+
+PG_USER = os.getenv("PG_USER", "user")
+PG_PASS = os.getenv("PG_PASS", "secret")
+PG_DB = os.getenv("PG_DB", "dw")
+PG_HOST = os.getenv("PG_HOST", "localhost")
+PG_PORT = int(os.getenv("PG_PORT", "5432"))
+
+# Conexões do pool assíncrono; o padrão cobre todos os marts em paralelo
+MARTS_ASYNC_POOL_MIN = int(os.getenv("MARTS_ASYNC_POOL_MIN", "1"))
+MARTS_ASYNC_POOL_MAX = int(os.getenv("MARTS_ASYNC_POOL_MAX", "8"))
+
+# Tempo máximo (s) de espera pelo conjunto de consultas
+MARTS_ASYNC_TIMEOUT = float(os.getenv("MARTS_ASYNC_TIMEOUT", "30"))
+
+_trava = threading.Lock()
+_loop = None
+_pool = None
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+def _para_asyncpg(sql):
+    """Troca os placeholders %s do psycopg2 por $1, $2, ... do asyncpg"""
+    contador = iter(range(1, 1000))
+    return _PLACEHOLDER.sub(lambda _: f"${next(contador)}", sql)
+
+
+def _obter_loop():
+    """Event loop da thread de fundo (criado na primeira chamada)"""
+    global _loop
+    with _trava:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="marts-async", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+async def _obter_pool():
+    global _pool
+    # Só a thread do loop chega aqui, então não há corrida na criação
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=PG_HOST,
+            port=PG_PORT,
+            user=PG_USER,
+            password=PG_PASS,
+            database=PG_DB,
+            min_size=MARTS_ASYNC_POOL_MIN,
+            max_size=MARTS_ASYNC_POOL_MAX,
+        )
+    return _pool
+
+
+async def _consultar(pool, query_sql, parametros, janela):
+    """Executa uma consulta em uma conexão do pool e retorna as linhas como dicionários"""
+    async with pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            if janela:
+                # Vale só para esta transação, como nas rotas síncronas
+                await conn.execute(
+                    "SELECT set_config('marts.inicio', $1, true), set_config('marts.fim', $2, true)",
+                    *janela,
+                )
+            inicio = time.perf_counter()
+            linhas = await conn.fetch(_para_asyncpg(query_sql), *parametros)
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+
+    registrar(query_sql, duracao_ms, len(linhas), "api_dashboard")
+    if duracao_ms >= SLOW_QUERY_MS:
+        print(f"🐢 Consulta lenta ({duracao_ms:.1f} ms, rota api_dashboard): {' '.join(query_sql.split())}")
+    return [dict(linha) for linha in linhas]
+
+
+async def _consultar_todos(consultas, janela):
+    pool = await _obter_pool()
+    nomes = list(consultas)
+    # No tempo esgotado o wait_for cancela o gather e as consultas em andamento,
+    # devolvendo as conexões ao pool
+    resultados = await asyncio.wait_for(
+        asyncio.gather(
+            *(_consultar(pool, sql, parametros, janela) for sql, parametros in consultas.values()),
+            return_exceptions=True,
+        ),
+        MARTS_ASYNC_TIMEOUT,
+    )
+    return dict(zip(nomes, resultados))
+
+
+def consultar_marts_concorrente(consultas, janela=None):
+    """
+    Executa {nome: (sql, parametros)} concorrentemente no pool assíncrono.
+
+    Retorna {nome: linhas}; a consulta que falhar tem a exceção no lugar das
+    linhas, sem derrubar as demais.
+    """
+    futuro = asyncio.run_coroutine_threadsafe(_consultar_todos(consultas, janela), _obter_loop())
+    try:
+        # O limite vale dentro do loop; a folga aqui só cobre a criação do pool
+        return futuro.result(timeout=MARTS_ASYNC_TIMEOUT + 5)
+    except TimeoutError:
+        futuro.cancel()
+        raise TimeoutError(f"consultas dos Data Marts excederam {MARTS_ASYNC_TIMEOUT:g} s") from None
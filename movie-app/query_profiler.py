@@ -0,0 +1,184 @@
+"""
+Perfil das consultas SQL da aplicação
+
+Toda conexão aberta por get_db_connection usa ConexaoPerfilada: qualquer cursor
+criado nela (inclusive com cursor_factory=DictCursor) mede cada execute e
+registra a impressão digital do SQL, a duração, as linhas retornadas e a rota
+Flask que fez a chamada. Consultas acima de SLOW_QUERY_MS são logadas com o
+plano de EXPLAIN (ANALYZE, BUFFERS). As estatísticas agregadas ficam em memória
+(por processo) e são exibidas em /debug/queries.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import psycopg2.extensions
+
+try:
+    from flask import has_request_context, request
+except ImportError:  # uso fora da aplicação Flask
+    has_request_context = lambda: False
+    request = None
+
+# Limite (ms) a partir do qual a consulta é considerada lenta
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# SLOW_QUERY_EXPLAIN=0 desativa o EXPLAIN ANALYZE das consultas lentas
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1").lower() in ("1", "true", "yes")
+
+# Quantas consultas lentas recentes manter para a página de debug
+SLOW_QUERY_HISTORICO = int(os.getenv("SLOW_QUERY_HISTORY", "50"))
+
+# Só consultas de leitura são reexecutadas com EXPLAIN ANALYZE, que executa o
+# comando de novo: apenas SELECT, sem WITH (uma CTE pode conter INSERT/UPDATE/DELETE)
+# e sem palavras de escrita ou bloqueio fora dos literais (SELECT ... INTO, FOR UPDATE)
+_LEITURA = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+_ESCRITA = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|INTO|FOR\s+(NO\s+KEY\s+)?(SHARE|KEY\s+SHARE))\b", re.IGNORECASE)
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_ESPACOS = re.compile(r"\s+")
+
+_trava = threading.Lock()
+_estatisticas = {}
+_lentas = deque(maxlen=SLOW_QUERY_HISTORICO)
+
+
+def impressao_digital(sql):
+    """Normaliza o SQL (espaços e literais) para agrupar execuções da mesma consulta"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = _LITERAL_TEXTO.sub("?", str(sql))
+    sql = _LITERAL_NUMERO.sub("?", sql)
+    return _ESPACOS.sub(" ", sql).strip()
+
+
+def somente_leitura(sql):
+    """True se o SQL pode ser reexecutado com EXPLAIN ANALYZE sem efeitos colaterais"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = str(sql)
+    return bool(_LEITURA.match(sql)) and not _ESCRITA.search(_LITERAL_TEXTO.sub("''", sql))
+
+
+def rota_atual():
+    """Endpoint Flask da requisição em andamento (ou '-' fora de uma requisição)"""
+    if has_request_context():
+        return request.endpoint or request.path
+    return "-"
+
+
+def registrar(sql, duracao_ms, linhas, rota, plano=None):
+    """Acumula a execução nas estatísticas da impressão digital"""
+    digital = impressao_digital(sql)
+    with _trava:
+        estat = _estatisticas.get(digital)
+        if estat is None:
+            estat = _estatisticas[digital] = {
+                "sql": digital,
+                "chamadas": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "linhas": 0,
+                "lentas": 0,
+                "rotas": {},
+            }
+        estat["chamadas"] += 1
+        estat["total_ms"] += duracao_ms
+        estat["max_ms"] = max(estat["max_ms"], duracao_ms)
+        estat["linhas"] += max(linhas, 0)
+        estat["rotas"][rota] = estat["rotas"].get(rota, 0) + 1
+        if duracao_ms >= SLOW_QUERY_MS:
+            estat["lentas"] += 1
+            _lentas.appendleft({
+                "sql": digital,
+                "duracao_ms": duracao_ms,
+                "linhas": linhas,
+                "rota": rota,
+                "plano": plano,
+                "quando": time.strftime("%Y-%m-%d %H:%M:%S"),
+            })
+
+
+def top_consultas(n=20, ordem="total_ms"):
+    """As n impressões digitais com maior valor no critério de ordenação"""
+    with _trava:
+        linhas = [
+            dict(estat, media_ms=estat["total_ms"] / estat["chamadas"], rotas=dict(estat["rotas"]))
+            for estat in _estatisticas.values()
+        ]
+    linhas.sort(key=lambda estat: estat[ordem], reverse=True)
+    return linhas[:n]
+
+
+def consultas_lentas():
+    """Consultas lentas mais recentes, da mais nova para a mais antiga"""
+    with _trava:
+        return list(_lentas)
+
+
+def limpar_estatisticas():
+    with _trava:
+        _estatisticas.clear()
+        _lentas.clear()
+
+
+class _CursorPerfilado:
+    """Mixin que mede o execute de qualquer classe de cursor do psycopg2"""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        sucesso = False
+        try:
+            resultado = super().execute(query, vars)
+            sucesso = True
+            return resultado
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            sql = self.query or query
+            plano = None
+            if duracao_ms >= SLOW_QUERY_MS:
+                # Transação abortada não aceita o EXPLAIN
+                if sucesso:
+                    plano = self._explicar(query, vars)
+                print(f"🐢 Consulta lenta ({duracao_ms:.1f} ms, rota {rota_atual()}): {impressao_digital(sql)}")
+                if plano:
+                    print(plano)
+            registrar(sql, duracao_ms, self.rowcount, rota_atual(), plano)
+
+    def _explicar(self, query, vars):
+        """Plano com EXPLAIN (ANALYZE, BUFFERS), na mesma transação da consulta original"""
+        if not SLOW_QUERY_EXPLAIN or not somente_leitura(query):
+            return None
+        conn = self.connection
+        try:
+            # Cursor simples: o EXPLAIN não deve entrar nas estatísticas
+            with psycopg2.extensions.cursor(conn) as cursor:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + str(query), vars)
+                return "\n".join(linha[0] for linha in cursor.fetchall())
+        except psycopg2.Error as e:
+            return f"EXPLAIN falhou: {e}"
+
+
+_classes_perfiladas = {}
+
+
+def _cursor_perfilado(base):
+    """Subclasse (em cache) de base com o mixin de perfil"""
+    classe = _classes_perfiladas.get(base)
+    if classe is None:
+        classe = type(f"{base.__name__}Perfilado", (_CursorPerfilado, base), {})
+        _classes_perfiladas[base] = classe
+    return classe
+
+
+class ConexaoPerfilada(psycopg2.extensions.connection):
+    """Conexão cujos cursores registram todas as consultas executadas"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _cursor_perfilado(base)
+        return super().cursor(*args, **kwargs)